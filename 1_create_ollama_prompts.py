@@ -10,17 +10,16 @@ from collections import defaultdict
 from utilities.ollama_utils import (
     install_and_setup_ollama,
     get_story_response_from_model,
+    get_structured_response_from_model,
+    prime_model_context,
     stop_ollama_service,
     kill_existing_ollama_service,
     clear_gpu_memory,
     start_ollama_service
 )
-from utilities.lora_utils import create_lora_combos_json, update_lora_metadata, cleanse_prompt
-
-def load_configurations():
-    with open('global_variables.json', 'r', encoding='utf-8') as file:
-        configs = json.load(file)
-        return {key: value['value'] for key, value in configs.items()}
+from utilities.lora_utils import create_lora_combos_json, update_lora_metadata, cleanse_prompt, write_lora_combos
+from utilities.logging_utils import configure_logging, log, log_debug, log_error
+from utilities.runtime_context import get_runtime_context
 
 def load_archived_lora_combos(archive_path):
     archived_combos = {}
@@ -43,17 +42,17 @@ def check_and_move_lora_file(lora_name):
     people_dir = os.path.join(base_dir, 'people')
     people_path = os.path.join(people_dir, lora_name)
 
-    print(f"[DEBUG] Checking for '{lora_name}' in '{expected_path}' and '{people_dir}'")
+    log_debug(f"Checking for '{lora_name}' in '{expected_path}' and '{people_dir}'")
 
     if os.path.exists(expected_path):
-        print(f"[INFO] LoRA file '{lora_name}' is already in the correct directory.")
+        log(f"LoRA file '{lora_name}' is already in the correct directory.")
         return True
     elif os.path.exists(people_path):
-        print(f"[INFO] LoRA file '{lora_name}' found in /people/. Moving it to the correct directory.")
+        log(f"LoRA file '{lora_name}' found in /people/. Moving it to the correct directory.")
         shutil.move(people_path, expected_path)
         return True
     else:
-        print(f"[ERROR] LoRA file '{lora_name}' could not be found. Please ensure it is placed in the /people/ directory and restart the script.")
+        log_error(f"LoRA file '{lora_name}' could not be found. Please ensure it is placed in the /people/ directory and restart the script.")
         return False
 
 def check_and_move_lora_metadata():
@@ -63,33 +62,36 @@ def check_and_move_lora_metadata():
     data_dir = os.path.join(base_dir, 'data')
     backup_path = os.path.join(data_dir, metadata_filename)
 
-    print(f"[DEBUG] Checking for '{metadata_filename}' in '{expected_path}' and '{data_dir}'")
+    log_debug(f"Checking for '{metadata_filename}' in '{expected_path}' and '{data_dir}'")
 
     if os.path.exists(expected_path):
-        print(f"[INFO] LoRA metadata file '{metadata_filename}' is already in the correct directory.")
+        log(f"LoRA metadata file '{metadata_filename}' is already in the correct directory.")
         return True
     elif os.path.exists(backup_path):
-        print(f"[INFO] LoRA metadata file '{metadata_filename}' found in /data/. Moving it to the correct directory.")
+        log(f"LoRA metadata file '{metadata_filename}' found in /data/. Moving it to the correct directory.")
         shutil.copy(backup_path, expected_path)
         return True
     else:
-        print(f"[ERROR] LoRA metadata file '{metadata_filename}' could not be found. Please ensure it is placed in the /data/ directory and restart the script.")
+        log_error(f"LoRA metadata file '{metadata_filename}' could not be found. Please ensure it is placed in the /data/ directory and restart the script.")
         return False
 
-config = load_configurations()
+config = get_runtime_context().config
 
 MODEL_NAME = config["MODEL_NAME"]
 LORA_COMBOS_PATH = config["LORA_COMBOS_PATH"]
 ARCHIVE_PATH = config["ARCHIVE_PATH"]
 LORA_DIRECTORY = config["LORA_DIRECTORY"]
+OLLAMA_BATCH_SIZE = max(1, int(config.get("OLLAMA_BATCH_SIZE", 1)))
+OLLAMA_REUSE_CONTEXT = config.get("OLLAMA_REUSE_CONTEXT", True)
+LOG_FILE = config.get("LOG_FILE", "log.txt")  # Shared with 2_create_loop_lora.py; this step appends to it
+LOG_LEVEL = config.get("LOG_LEVEL", "INFO")
 
 def load_lora_combos():
     with open(LORA_COMBOS_PATH, 'r', encoding='utf-8') as file:
         return json.load(file)
 
 def save_lora_combos(lora_combos):
-    with open(LORA_COMBOS_PATH, 'w', encoding='utf-8') as file:
-        json.dump(lora_combos, file, indent=2)
+    write_lora_combos(lora_combos, LORA_COMBOS_PATH)
 
 def archive_lora_combos():
     if os.path.exists(LORA_COMBOS_PATH):
@@ -98,7 +100,7 @@ def archive_lora_combos():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         archive_filename = os.path.join(ARCHIVE_PATH, f"lora_combos_{timestamp}.json")
         os.rename(LORA_COMBOS_PATH, archive_filename)
-        print(f"[INFO] Archived existing lora_combos.json to {archive_filename}")
+        log(f"Archived existing lora_combos.json to {archive_filename}")
 
 def clean_response(response):
     filler_phrases = [
@@ -132,6 +134,198 @@ def clean_response(response):
 
     return response.strip()
 
+def strip_base_prompt(suggested_prompt, base_prompt):
+    """Drop the base prompt that create_lora_combos_json already embeds in SUGGESTED_PROMPT_TEXT."""
+    cleaned_base = cleanse_prompt(base_prompt)
+    if cleaned_base and suggested_prompt.startswith(cleaned_base):
+        return suggested_prompt[len(cleaned_base):].strip()
+    return suggested_prompt
+
+def apply_answer(iteration_data, raw_answer, time_to_respond):
+    """Clean a model answer, prepend trigger words and store it on the combo. Returns the answer or None."""
+    answer = clean_response(raw_answer)
+    answer = cleanse_prompt(answer)
+    if not answer:
+        return None
+
+    trigger_words = []
+    for idx in range(1, 4):
+        lora = iteration_data.get(f"LORA{idx}", {})
+        trigger_word = lora.get("metadata", {}).get("trigger_word", "")
+        if trigger_word:
+            trigger_words.append(trigger_word)
+
+    trigger_words_str = ", ".join(trigger_words)
+    updated_prompt_text = f"{trigger_words_str}, {answer}" if trigger_words_str else answer
+
+    iteration_data.update({
+        "PROMPT_TEXT": cleanse_prompt(updated_prompt_text),
+        "time_to_respond": round(time_to_respond, 6),
+    })
+    return answer
+
+def build_batch_question(batch, base_prompt, include_base_prompt=True):
+    """Ask for one prompt per combo in a single JSON-formatted request."""
+    lines = [base_prompt] if include_base_prompt else []
+    lines.append(
+        "Write one SUGGESTED PROMPT for each numbered request below. "
+        "Answer only with a JSON object that maps each request number to its prompt text, "
+        "for example {\"12\": \"...\", \"13\": \"...\"}."
+    )
+    for iteration_data in batch:
+        suggested_prompt = strip_base_prompt(iteration_data.get("SUGGESTED_PROMPT_TEXT", ""), base_prompt)
+        lines.append(f"Request {iteration_data['iteration']}: {suggested_prompt}")
+    return "\n".join(lines)
+
+def parse_batch_answers(parsed):
+    """Map a batch JSON answer back to iteration numbers."""
+    if isinstance(parsed, dict) and len(parsed) == 1 and isinstance(next(iter(parsed.values())), (dict, list)):
+        parsed = next(iter(parsed.values()))  # Some models wrap the answers in an outer key
+    if isinstance(parsed, list):
+        parsed = {item.get("request", item.get("id")): item.get("prompt", "") for item in parsed if isinstance(item, dict)}
+    if not isinstance(parsed, dict):
+        return {}
+
+    answers = {}
+    for key, value in parsed.items():
+        digits = re.sub(r"\D", "", str(key))
+        if digits and isinstance(value, str):
+            answers[int(digits)] = value
+    return answers
+
+def generate_prompt_for_combo(iteration_data, base_prompt):
+    """Query the model for a single combo. Returns (raw_answer, time_to_respond)."""
+    suggested_prompt = strip_base_prompt(iteration_data.get("SUGGESTED_PROMPT_TEXT", ""), base_prompt)
+    question = f"{base_prompt} {suggested_prompt}"
+
+    start_iteration_time = time()
+    raw_answer = get_story_response_from_model(MODEL_NAME, question)
+    return raw_answer, time() - start_iteration_time
+
+def generate_prompts_for_batch(batch, base_prompt, context=None):
+    """Query the model for several combos at once. Returns ({iteration: raw_answer}, time_to_respond)."""
+    question = build_batch_question(batch, base_prompt, include_base_prompt=not context)
+
+    start_batch_time = time()
+    parsed, body = get_structured_response_from_model(MODEL_NAME, question, context=context)
+    time_to_respond = time() - start_batch_time
+
+    log(f"Batch of {len(batch)} used {body.get('prompt_eval_count', 'n/a')} prompt tokens "
+        f"and {body.get('eval_count', 'n/a')} response tokens.")
+    return parse_batch_answers(parsed), time_to_respond
+
+def chunk_combos(combos, size):
+    """Yield consecutive slices of at most size combos."""
+    for start in range(0, len(combos), size):
+        yield combos[start:start + size]
+
+def match_archived_combos(lora_combos, archived_combos, archived_match_counts):
+    """Fill combos from archived runs and return the ones that still need a model answer."""
+    new_combos_to_process = []
+    for iteration_data in lora_combos:
+        key = frozenset((iteration_data["LORA1"]["name"], iteration_data["LORA2"]["name"], iteration_data["LORA3"]["name"]))
+
+        if key in archived_combos:
+            archived_data = archived_combos[key]["combo"]
+            iteration_data.update({
+                "PROMPT_TEXT": archived_data["PROMPT_TEXT"],
+                "time_to_respond": archived_data["time_to_respond"],
+            })
+
+            archived_match_counts[archived_combos[key]['file']] += 1
+
+            lora1_name = iteration_data["LORA1"]["name"]
+            lora2_name = iteration_data["LORA2"]["name"]
+            lora3_name = iteration_data["LORA3"]["name"]
+            file_found = archived_combos[key]['file']
+            prompt_text = iteration_data['PROMPT_TEXT']
+
+            log(f"Found existing combination for iteration {iteration_data['iteration']} using archived data from {file_found}.")
+            log(f"LoRA Names: {lora1_name}, {lora2_name}, {lora3_name}")
+            log(f"PROMPT_TEXT: {prompt_text}")
+        else:
+            lora1_name = iteration_data["LORA1"]["name"]
+            lora2_name = iteration_data["LORA2"]["name"]
+            lora3_name = iteration_data["LORA3"]["name"]
+
+            log(f"New combination (lora1: {lora1_name}, lora2: {lora2_name}, lora3: {lora3_name}) for iteration {iteration_data['iteration']} to be processed.")
+            new_combos_to_process.append(iteration_data)
+
+    return new_combos_to_process
+
+def generate_new_prompts(lora_combos, new_combos_to_process, base_prompt, before_batch=None, after_batch=None):
+    """Ask the model for every new combo, saving lora_combos.json after each batch that got an answer. Returns the time spent waiting on the model.
+
+    before_batch() and after_batch(batch) let a caller (e.g. stream_prompts_and_images.py) gate GPU use
+    around each batch and pick up finished combos as soon as they are saved.
+    """
+    total_time_spent = 0
+    total_iterations = len(new_combos_to_process)
+
+    context = None
+    if OLLAMA_BATCH_SIZE > 1 and OLLAMA_REUSE_CONTEXT and new_combos_to_process:
+        try:
+            context = prime_model_context(MODEL_NAME, base_prompt)
+            log("Primed Ollama context with the base prompt; batches will reuse it.")
+        except requests.exceptions.RequestException as e:
+            log_error(f"Could not prime Ollama context, sending the base prompt with each batch: {e}")
+
+    completed = 0
+    for batch in chunk_combos(new_combos_to_process, OLLAMA_BATCH_SIZE):
+        if before_batch:
+            before_batch()
+
+        answers = {}
+        answered = 0
+        if len(batch) > 1:
+            request_start = time()
+            try:
+                answers, batch_time = generate_prompts_for_batch(batch, base_prompt, context)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                log_error(f"Batch request failed, falling back to one request per combo: {e}")
+                batch_time = 0
+            total_time_spent += time() - request_start  # A failed request's wait counts too
+
+        for iteration_data in batch:
+            if iteration_data['iteration'] in answers:
+                raw_answer = answers[iteration_data['iteration']]
+                time_to_respond = batch_time / len(batch)
+            else:
+                request_start = time()
+                try:
+                    raw_answer, time_to_respond = generate_prompt_for_combo(iteration_data, base_prompt)
+                except requests.exceptions.RequestException as e:
+                    log_error(f"Error querying Ollama model: {e}")
+                    continue
+                finally:
+                    total_time_spent += time() - request_start
+
+            completed += 1
+            answer = apply_answer(iteration_data, raw_answer, time_to_respond)
+
+            if answer:
+                answered += 1
+                log(f"[Iteration: {iteration_data['iteration']}]")
+                log(f"Response: {answer}")
+                log(f"Time to respond: {time_to_respond:.6f} seconds")
+            else:
+                log_error(f"No answer received for iteration: {iteration_data['iteration']}")
+
+        average_time_per_iteration = total_time_spent / completed if completed else 0
+        remaining_iterations = total_iterations - completed
+        estimated_time_remaining = remaining_iterations * average_time_per_iteration
+
+        if answered:  # Nothing changed when every request failed or came back empty
+            save_lora_combos(lora_combos)
+            log(f"Updated lora_combos.json through iteration {batch[-1]['iteration']}")
+        log(f"Completed {completed} iterations, total time spent: {total_time_spent:.2f} seconds.")
+        log(f"Estimated time remaining for {remaining_iterations} iterations: {estimated_time_remaining:.2f} seconds.")
+
+        if after_batch:
+            after_batch(batch)
+
+    return total_time_spent
+
 def main():
     start_time = datetime.now()
 
@@ -148,7 +342,7 @@ def main():
     archived_combos, archived_match_counts = load_archived_lora_combos(ARCHIVE_PATH)
 
     original_count, final_count = update_lora_metadata(lora_directory=LORA_DIRECTORY)
-    print(f"[SUMMARY] LoRA metadata updated: started with {original_count}, ended with {final_count} entries.")
+    log(f"[SUMMARY] LoRA metadata updated: started with {original_count}, ended with {final_count} entries.")
 
     create_lora_combos_json()
 
@@ -158,97 +352,17 @@ def main():
     install_and_setup_ollama(MODEL_NAME)
 
     lora_combos = load_lora_combos()
-    global_vars = load_configurations()
-    base_prompt = global_vars["OLLAMA_BASE_PROMPT"]
+    base_prompt = config["OLLAMA_BASE_PROMPT"]
 
-    total_time_spent = 0
     new_combos_to_process = []
 
     try:
-        for iteration_data in lora_combos:
-            key = frozenset((iteration_data["LORA1"]["name"], iteration_data["LORA2"]["name"], iteration_data["LORA3"]["name"]))
-
-            if key in archived_combos:
-                archived_data = archived_combos[key]["combo"]
-                iteration_data.update({
-                    "PROMPT_TEXT": archived_data["PROMPT_TEXT"],
-                    "time_to_respond": archived_data["time_to_respond"],
-                })
-
-                archived_match_counts[archived_combos[key]['file']] += 1
-
-                lora1_name = iteration_data["LORA1"]["name"]
-                lora2_name = iteration_data["LORA2"]["name"]
-                lora3_name = iteration_data["LORA3"]["name"]
-                file_found = archived_combos[key]['file']
-                prompt_text = iteration_data['PROMPT_TEXT']
-
-                print(f"[INFO] Found existing combination for iteration {iteration_data['iteration']} using archived data from {file_found}.")
-                print(f"LoRA Names: {lora1_name}, {lora2_name}, {lora3_name}")
-                print(f"PROMPT_TEXT: {prompt_text}")
-            else:
-                lora1_name = iteration_data["LORA1"]["name"]
-                lora2_name = iteration_data["LORA2"]["name"]
-                lora3_name = iteration_data["LORA3"]["name"]
-
-                print(f"[INFO] New combination (lora1: {lora1_name}, lora2: {lora2_name}, lora3: {lora3_name}) for iteration {iteration_data['iteration']} to be processed.")
-                new_combos_to_process.append(iteration_data)
-
-        total_iterations = len(new_combos_to_process)
+        new_combos_to_process = match_archived_combos(lora_combos, archived_combos, archived_match_counts)
 
         if new_combos_to_process:
             start_ollama_service()
 
-        for index, iteration_data in enumerate(new_combos_to_process):
-            suggested_prompt = iteration_data.get("SUGGESTED_PROMPT_TEXT", "")
-            question = f"{base_prompt} {suggested_prompt}"
-
-            start_iteration_time = time()
-
-            try:
-                raw_answer = get_story_response_from_model(MODEL_NAME, question)
-            except requests.exceptions.RequestException as e:
-                print(f"[ERROR] Error querying Ollama model: {e}")
-                continue
-            
-            end_iteration_time = time()
-
-            time_to_respond = end_iteration_time - start_iteration_time
-            total_time_spent += time_to_respond
-            average_time_per_iteration = total_time_spent / (index + 1)
-            remaining_iterations = total_iterations - (index + 1)
-            estimated_time_remaining = remaining_iterations * average_time_per_iteration
-
-            answer = clean_response(raw_answer)
-            answer = cleanse_prompt(answer)
-
-            if answer:
-                print(f"[Iteration: {iteration_data['iteration']}]")
-                print(f"Prompt: {question}")
-                print(f"Response: {answer}")
-                print(f"Time to respond: {time_to_respond:.6f} seconds")
-
-                trigger_words = []
-                for idx in range(1, 4):
-                    lora = iteration_data.get(f"LORA{idx}", {})
-                    trigger_word = lora.get("metadata", {}).get("trigger_word", "")
-                    if trigger_word:
-                        trigger_words.append(trigger_word)
-
-                trigger_words_str = ", ".join(trigger_words)
-                updated_prompt_text = f"{trigger_words_str}, {answer}" if trigger_words_str else answer
-
-                iteration_data.update({
-                    "PROMPT_TEXT": cleanse_prompt(updated_prompt_text),
-                    "time_to_respond": round(time_to_respond, 6),
-                })
-
-                save_lora_combos(lora_combos)
-                print(f"[INFO] Updated lora_combos.json for iteration {iteration_data['iteration']}")
-                print(f"Completed {index + 1} iterations, total time spent: {total_time_spent:.2f} seconds.")
-                print(f"Estimated time remaining for {remaining_iterations} iterations: {estimated_time_remaining:.2f} seconds.")
-            else:
-                print(f"[ERROR] No answer received for iteration: {iteration_data['iteration']}")
+        generate_new_prompts(lora_combos, new_combos_to_process, base_prompt)
 
     finally:
         stop_ollama_service()
@@ -258,15 +372,16 @@ def main():
         execution_time = end_time - start_time
         execution_time_str = str(timedelta(seconds=int(execution_time.total_seconds())))
 
-        print("\n====SUMMARY====")
-        print("Archived matches:")
+        log("\n====SUMMARY====")
+        log("Archived matches:")
         total_archived = 0
         for file, count in archived_match_counts.items():
-            print(f"{os.path.basename(file)}: {count}")
+            log(f"{os.path.basename(file)}: {count}")
             total_archived += count
-        print("--")
-        print(f"New Ollama created JSON values: {len(new_combos_to_process)}")
-        print(f"Time to execute: {execution_time_str}")
+        log("--")
+        log(f"New Ollama created JSON values: {len(new_combos_to_process)}")
+        log(f"Time to execute: {execution_time_str}")
 
 if __name__ == "__main__":
+    configure_logging(LOG_FILE, LOG_LEVEL)
     main()
\ No newline at end of file
@@ -1,32 +1,45 @@
 import os
 import json
-import requests
 import time
 from datetime import datetime, timedelta
 import shutil
 import random
-import torch
 import gc
+import sqlite3
 from utilities.lora_utils import update_lora_metadata, cleanse_prompt
 from utilities.remove_metadata import remove_metadata_in_place, show_metadata, has_metadata
 from utilities.comfy_starter import initialize_comfyui
+from utilities.batch_tuner import autotune, load_batch_tuning, tuned_batch_size
+from utilities.comfy_client import ComfyClient, ComfyRequestError
+from utilities.comfy_dispatcher import ComfyDispatcher, execution_window
+from utilities.draft_scoring import gpu_seconds_saved, keep_count, load_scorer, select_seeds
+from utilities.image_catalog import ImageCatalog
+from utilities.job_ledger import JobLedger, plan_signature
+from utilities.job_planner import JobCostModel, plan_jobs
+from utilities.model_registry import ModelRegistry
+from utilities.render_costs import budget_jobs, load_cost_model, parse_deadline
+from utilities.run_metrics import MetricsExporter, RunMetrics
+from utilities.workflow_template import FLUX_LORA_BINDINGS, WorkflowTemplate, fan_out_workflow
 from utilities.image_creation_utils import wait_for_images, move_and_rename_images, create_filename_prefix, remove_metadata_if_required
-from utilities.logging_utils import log, log_error, log_iteration_details
+from utilities.logging_utils import configure_iteration_log, configure_logging, flush_iteration_log, log, log_debug, log_error, log_iteration_details
+from utilities.runtime_context import get_runtime_context
+from utilities import tracing
 
-# Load configurations from global_variables.json
-def load_configurations():
-    with open('global_variables.json', 'r', encoding='utf-8') as f:
-        configs = json.load(f)
-        return {key: value['value'] for key, value in configs.items()}
-
-config = load_configurations()
+config_load_start = time.time()
+context = get_runtime_context()
+config = context.config
+config_load_span = (config_load_start, time.time())  # Added to the trace once tracing is on
 
 WORKFLOW_PATH = config['WORKFLOW_PATH']
 OUTPUT_FOLDER = config['OUTPUT_FOLDER']
 SERVER_ADDRESS = config['SERVER_ADDRESS']
+SERVER_ADDRESSES = config.get('SERVER_ADDRESSES', [SERVER_ADDRESS])  # Several ComfyUI servers spread the jobs between them
 LOG_FILE = config['LOG_FILE']
+LOG_LEVEL = config.get('LOG_LEVEL', 'INFO')  # DEBUG also logs every prompt payload
 API_OUTPUT_FOLDER = config['API_OUTPUT_FOLDER']
 ITERATION_LOG_FILE = config['ITERATION_LOG_FILE']
+ITERATION_LOG_FORMAT = config.get('ITERATION_LOG_FORMAT', 'csv')  # 'parquet': columnar log in ITERATION_LOG_DIRECTORY (needs pyarrow)
+ITERATION_LOG_DIRECTORY = config.get('ITERATION_LOG_DIRECTORY', 'iteration_log')  # Partitioned by run date (see utilities/columnar_log.py)
 CHECK_INTERVAL = config['CHECK_INTERVAL']
 MAX_WAIT_TIME = config['MAX_WAIT_TIME']
 MODEL_DIRS = config['MODEL_DIRS']
@@ -56,20 +69,50 @@ VAE_FILENAME = config['VAE_FILENAME']
 DEFAULT_SAMPLER = config['DEFAULT_SAMPLER']
 DEFAULT_SCHEDULER = config['DEFAULT_SCHEDULER']
 
-REPEAT_LATENT_BATCH_AMOUNT = config['REPEAT_LATENT_BATCH_AMOUNT']
+REPEAT_LATENT_BATCH_AMOUNT = config['REPEAT_LATENT_BATCH_AMOUNT']  # Used for sampler/scheduler pairs without a tuned batch size
+AUTOTUNE_BATCH = config.get('AUTOTUNE_BATCH', False)  # Probe AUTOTUNE_BATCH_SIZES for pairs not yet in BATCH_TUNING_PATH
+AUTOTUNE_BATCH_SIZES = config.get('AUTOTUNE_BATCH_SIZES', [1, 2, 4, 8])
+BATCH_TUNING_PATH = config.get('BATCH_TUNING_PATH', 'batch_tuning.json')
 NUMBER_OF_LOOPS = config['NUMBER_OF_LOOPS']
 
 BEST_SAMPLERS_SCHEDULERS = config['BEST_SAMPLERS_SCHEDULERS']
+FAN_OUT_SAMPLERS = config.get('FAN_OUT_SAMPLERS', False)  # One prompt renders every BEST_SAMPLERS_SCHEDULERS pair
 
-USE_ALL_CONFIGS = config['USE_ALL_CONFIGS']
-
-# Load LoRA combinations (ensure metadata is current but do not create new combos)
-update_lora_metadata()  # Ensure metadata is up-to-date
-with open(config['LORA_COMBOS_PATH'], 'r', encoding='utf-8') as f:
-    lora_combos = json.load(f)
+# TWO_STAGE: render DRAFT_SEEDS seeds at DRAFT_STEPS, score them on the CPU (see utilities/draft_scoring.py)
+# and render only the best DRAFT_KEEP_FRACTION of them again at INFERENCE_STEPS. Single server only.
+TWO_STAGE = config.get('TWO_STAGE', False)
+DRAFT_SEEDS = config.get('DRAFT_SEEDS', 8)
+DRAFT_STEPS = config.get('DRAFT_STEPS', max(1, INFERENCE_STEPS // 4))
+DRAFT_KEEP_FRACTION = config.get('DRAFT_KEEP_FRACTION', 0.25)
+DRAFT_SCORER = config.get('DRAFT_SCORER', 'sharpness_contrast')  # A name in SCORERS or 'module:function'
 
-# Shuffle the lora_combos list
-random.shuffle(lora_combos)
+USE_ALL_CONFIGS = config['USE_ALL_CONFIGS']
+DEDUPE_PROMPTS = config.get('DEDUPE_PROMPTS', False)
+JOB_ORDER = config.get('JOB_ORDER', 'planned')  # planned, grouped_random or random (see utilities/job_planner.py)
+JOB_LEDGER_PATH = config.get('JOB_LEDGER_PATH', 'job_ledger.db')  # Planned and finished jobs; a restart resumes the open run
+SEED_BASE = config.get('SEED_BASE')  # Fixes every job seed of a new run; random when not set
+FINISH_BY = config.get('FINISH_BY')  # 'HH:MM' or an ISO date and time; only the jobs that fit before it are run
+RENDER_COSTS_PATH = config.get('RENDER_COSTS_PATH', 'render_costs.json')  # Learned seconds per sampler/scheduler/steps/batch
+REPLAN_DRIFT = config.get('REPLAN_DRIFT', 0.2)  # Plan the remaining jobs again when a job's estimate moves by more than this fraction
+METRICS_PORT = config.get('METRICS_PORT')  # Serve Prometheus metrics at http://METRICS_HOST:METRICS_PORT/metrics
+METRICS_HOST = config.get('METRICS_HOST', '127.0.0.1')
+METRICS_JSON_PATH = config.get('METRICS_JSON_PATH', 'run_metrics.json')  # Rewritten every METRICS_INTERVAL seconds
+METRICS_INTERVAL = config.get('METRICS_INTERVAL', 15)
+IMAGE_CATALOG_PATH = config.get('IMAGE_CATALOG_PATH', 'image_catalog.db')  # Every saved image with its settings (count_faves.py reads it)
+TRACE_DIRECTORY = config.get('TRACE_DIRECTORY')  # Opt-in: write a Chrome/Perfetto trace of each run here (see utilities/tracing.py)
+
+# Models every job needs; LORA2 and LORA3 change per combo and are checked per job
+REQUIRED_MODELS = [
+    ('unet', UNET_FILENAME), ('clip', CLIP1_FILENAME), ('clip', CLIP2_FILENAME),
+    ('vae', VAE_FILENAME), ('loras', LORA1)
+]
+model_registry = ModelRegistry(MODEL_DIRS)
+comfy_client = ComfyClient(SERVER_ADDRESS)
+batch_tuning = load_batch_tuning(BATCH_TUNING_PATH)
+draft_scorer = load_scorer(DRAFT_SCORER) if TWO_STAGE else None
+queue_clients = [comfy_client] if len(SERVER_ADDRESSES) == 1 else [ComfyClient(address) for address in SERVER_ADDRESSES]
+run_metrics = RunMetrics(lambda: sum(client.queue_depth() for client in queue_clients))
+configure_iteration_log(ITERATION_LOG_FILE, ITERATION_LOG_FORMAT, ITERATION_LOG_DIRECTORY)
 
 # HELPER FUNCTIONS SECTION
 
@@ -89,9 +132,9 @@ def prepend_trigger_words_to_prompt(lora_choices, prompt_text, lora_metadata):
     full_prompt = f"{trigger_words} {prompt_text}" if trigger_words else prompt_text
     return full_prompt
 
-def find_lora_set(lora1, lora2, lora3):
+def find_lora_set(lora1, lora2, lora3, combos):
     """ Find the corresponding iteration set in lora_combos.json for the given LoRAs. """
-    for iteration in lora_combos:
+    for iteration in combos:
         if (iteration["LORA1"]["name"] == lora1 and
             iteration["LORA2"]["name"] == lora2 and
             iteration["LORA3"]["name"] == lora3):
@@ -103,50 +146,231 @@ def find_lora_set(lora1, lora2, lora3):
     print("No match found.")
     return config['PROMPT_TEXT']
 
-def queue_prompt(workflow_json):
-    """ Queue a workflow prompt in the ComfyUI server with error handling. """
-    url = f"{SERVER_ADDRESS}/prompt"
-    headers = {'Content-Type': 'application/json'}
-    data = {'prompt': workflow_json}
+traced_prompts = []  # (prompt_id, submitted_at) queued since the last trace_comfy_prompts()
 
+def queue_prompt(prompt_json):
+    """ Queue a workflow prompt (JSON text from build_workflow) in the ComfyUI server with error handling. """
     try:
-        log(f"Queueing prompt to {url} with data: {json.dumps(data, indent=4)}")
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-
-        if response.status_code == 200:
-            log("Prompt queued successfully.")
-            return response.json()
-        else:
-            log(f"Error {response.status_code}: {response.text}")
-            return None
+        log(f"Queueing prompt to {SERVER_ADDRESS}/prompt")
+        log_debug(f"Prompt payload: {prompt_json}")
+        response = comfy_client.queue_prompt(prompt_json)
+        log("Prompt queued successfully.")
+        return response
+    except ComfyRequestError as e:
+        log(f"Error {e.status_code}: {e.body}")
+        return None
     except Exception as e:
         log_error(f"An exception occurred while queuing the prompt: {str(e)}")
         return None
 
-def check_model_file(model_filename, category):
-    """Check if the model file exists in the given directory."""
-    model_path = os.path.join(MODEL_DIRS[category], model_filename)
-    if not os.path.exists(model_path):
-        log(f"Model file '{model_filename}' not found in '{MODEL_DIRS[category]}' directory.")
-        return False
-    log(f"Model file '{model_filename}' found in '{MODEL_DIRS[category]}' directory.")
-    return True
-
 def clear_vram():
-    """ Clear VRAM and collect garbage. """
-    torch.cuda.empty_cache()
+    """ Collect garbage between sets. VRAM is held by the ComfyUI server, not by this process. """
     gc.collect()
 
 
 
-def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, scheduler_name, lora_combos, available_loras):
-    """ Execute one iteration of the workflow loop. """
-    lora_combo = random.choice(lora_combos)  # Select a random lora_combo on each iteration
+def workflow_constants(steps=None):
+    """ The models, LoRA1 and the fixed settings from global_variables.json, by FLUX_LORA_BINDINGS name.
+    steps replaces INFERENCE_STEPS (TWO_STAGE drafts). """
+    return {
+        "vae": VAE_FILENAME,
+        "clip1": CLIP1_FILENAME,
+        "clip2": CLIP2_FILENAME,
+        "unet": UNET_FILENAME,
+        "steps": steps or INFERENCE_STEPS,
+        "guidance": GUIDANCE_SCALE,
+        "lora1": LORA1,
+        "lora1_strength": LORA1_WEIGHT,
+        "lora1_clip_strength": LORA1_CLIP_STRENGTH,
+        "lora2_strength": LORA2_WEIGHT,
+        "lora2_clip_strength": LORA2_CLIP_STRENGTH,
+        "lora3_strength": LORA3_WEIGHT,
+        "lora3_clip_strength": LORA3_CLIP_STRENGTH,
+    }
+
+def compile_workflow(workflow_json, branch_count=1, steps=None):
+    """ Compile workflow_json with workflow_constants(steps) baked in. The sampler part of the graph is
+    repeated branch_count times; its values are set per branch (sampler_0, scheduler_0, ...). """
+    workflow_json, bindings, constants = fan_out_workflow(workflow_json, FLUX_LORA_BINDINGS, branch_count, workflow_constants(steps))
+    return WorkflowTemplate(workflow_json, bindings, constants)
+
+def batch_size_for(sampler_name, scheduler_name):
+    """ The tuned batch size for the pair (see utilities/batch_tuner.py), else REPEAT_LATENT_BATCH_AMOUNT. """
+    return tuned_batch_size(batch_tuning, sampler_name, scheduler_name, REPEAT_LATENT_BATCH_AMOUNT)
+
+def job_renders(sampler_pairs, two_stage=False):
+    """ The (sampler, scheduler, steps, batch) renders one job queues, as costed by utilities/render_costs.py. """
+    if two_stage:
+        kept = keep_count(DRAFT_SEEDS, DRAFT_KEEP_FRACTION)
+        return ([(sampler, scheduler, DRAFT_STEPS, 1) for sampler, scheduler in sampler_pairs] * DRAFT_SEEDS
+                + [(sampler, scheduler, INFERENCE_STEPS, 1) for sampler, scheduler in sampler_pairs] * kept)
+    return [(sampler, scheduler, INFERENCE_STEPS, batch_size_for(sampler, scheduler)) for sampler, scheduler in sampler_pairs]
+
+# Jobs the FINISH_BY budget covers first: every LoRA combo, then every combo with each of its sampler groups
+JOB_COVERAGE = (
+    lambda job: (job["lora2"], job["lora3"]),
+    lambda job: (job["lora2"], job["lora3"], job["sampler_pairs"]),
+)
+
+def describe_pairs(sampler_pairs):
+    return ", ".join(f"{sampler}/{scheduler}" for sampler, scheduler in sampler_pairs)
+
+def branch_values(sampler_pairs, filename_prefixes=None):
+    """ The per-branch template values: sampler_0, scheduler_0, batch_amount_0, filename_prefix_0, sampler_1, ... """
+    values = {}
+    for branch, (sampler_name, scheduler_name) in enumerate(sampler_pairs):
+        values[f"sampler_{branch}"] = sampler_name
+        values[f"scheduler_{branch}"] = scheduler_name
+        values[f"batch_amount_{branch}"] = batch_size_for(sampler_name, scheduler_name)
+        if filename_prefixes:
+            values[f"filename_prefix_{branch}"] = filename_prefixes[branch]
+    return values
+
+def build_workflow(template, sampler_pairs, lora2, lora3, final_prompt, filename_prefixes, seed=None, batch_amount=None):
+    """ Render the prompt JSON for one job (one branch per sampler/scheduler pair), with a new random seed
+    unless seed is given. batch_amount overrides the per-pair batch sizes. """
+    new_seed = random.randint(0, 2**32 - 1) if seed is None else seed
+    log(f"Set new random seed to {new_seed}.")
+    with tracing.span("build_payload", branches=len(sampler_pairs)):
+        values = branch_values(sampler_pairs, filename_prefixes)
+        if batch_amount is not None:
+            values.update({f"batch_amount_{branch}": batch_amount for branch in range(len(sampler_pairs))})
+        return template.render(prompt=final_prompt, seed=new_seed, lora2=lora2, lora3=lora3, **values)
+
+def record_combo_result(lora_combos, lora2, lora3, final_prompt, seconds):
+    """ Store the render time and final prompt on the matching combo and save lora_combos.json. """
+    for iteration in lora_combos:
+        if iteration["LORA1"]["name"] == LORA1 and iteration["LORA2"]["name"] == lora2 and iteration["LORA3"]["name"] == lora3:
+            iteration["time_to_respond"] = seconds
+            iteration["PROMPT_TEXT"] = final_prompt
+            break
+
+    context.save_lora_combos(lora_combos)
+
+_image_catalog = None
+
+def image_catalog():
+    """ The image catalog, opened on first use so importing this module creates no files. """
+    global _image_catalog
+    if _image_catalog is None:
+        _image_catalog = ImageCatalog(IMAGE_CATALOG_PATH)
+    return _image_catalog
+
+def catalog_images(file_paths, sampler_name, scheduler_name, batch_amount, lora2, lora3, final_prompt, started_at, finished_at, seed=None, prompt_id=None):
+    """ Record saved images with their settings in the image catalog; a failure is logged, not raised. """
+    try:
+        image_catalog().add_images(
+            file_paths, API_OUTPUT_FOLDER, prompt_id=prompt_id, seed=seed,
+            sampler=sampler_name, scheduler=scheduler_name, steps=INFERENCE_STEPS, batch_size=batch_amount,
+            lora1=LORA1, lora1_weight=LORA1_WEIGHT, lora2=lora2, lora2_weight=LORA2_WEIGHT, lora3=lora3, lora3_weight=LORA3_WEIGHT,
+            prompt=final_prompt, started_at=started_at, finished_at=finished_at,
+            render_seconds=(finished_at - started_at).total_seconds()
+        )
+    except sqlite3.Error as e:
+        log_error(f"[CATALOG] Could not catalog {len(file_paths)} images: {e}")
+
+def queue_and_check(prompt_json):
+    """ Queue prompt_json; returns its prompt ID, or None after logging why it failed. """
+    submitted_at = time.time()
+    with run_metrics.stage("queue"), tracing.span("queue_prompt"):
+        response = queue_prompt(prompt_json)
+    if not response:
+        log("Failed to queue the prompt.")
+        return None
+    prompt_id = response.get('prompt_id')
+    if not prompt_id:
+        log("No prompt ID received.")
+        return None
+    log(f"Prompt queued successfully with ID: {prompt_id}")
+    if tracing.enabled():
+        traced_prompts.append((prompt_id, submitted_at))
+    return prompt_id
+
+def execution_windows(prompt_ids):
+    """ {prompt ID: (start, end)} of ComfyUI's execution of each prompt, from /history.
+    Prompts without execution timestamps are left out. """
+    windows = {}
+    for prompt_id in prompt_ids:
+        try:
+            status = comfy_client.history(prompt_id).get(prompt_id, {}).get("status", {})
+        except Exception as e:
+            log_debug(f"No history for prompt {prompt_id}: {e}")
+            continue
+        window = execution_window(status)
+        if window:
+            windows[prompt_id] = window
+    return windows
+
+def execution_seconds(prompt_ids, windows):
+    """ Seconds ComfyUI spent executing prompt_ids, or None when any of them has no window. """
+    if any(prompt_id not in windows for prompt_id in prompt_ids):
+        return None
+    return sum(windows[prompt_id][1] - windows[prompt_id][0] for prompt_id in prompt_ids)
+
+def trace_comfy_prompts(windows):
+    """ Add the queue wait and execution of the prompts queued since the last call to the trace. """
+    while traced_prompts:
+        prompt_id, submitted_at = traced_prompts.pop(0)
+        tracing.add_comfy_spans(SERVER_ADDRESS, submitted_at, windows.get(prompt_id), prompt_id=prompt_id)
+
+def render_drafts(draft_template, loop, total_start_time, loop_start_time, sampler_pairs, lora2, lora3, final_prompt, seed=None):
+    """ Render DRAFT_SEEDS seeds at DRAFT_STEPS, score the drafts with DRAFT_SCORER and delete them.
+    The draft seeds are drawn from seed when given. Returns (kept seeds, best first; seconds ComfyUI spent
+    executing the drafts, None when /history has no timestamps for them). """
+    draft_prefix = f"draft_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    seeds = random.Random(seed).sample(range(2**32), DRAFT_SEEDS)
+    start_time = time.time()
+    prompt_ids = []
+    for seed in seeds:
+        filename_prefixes = [f"{draft_prefix}_{seed}_{branch}" for branch in range(len(sampler_pairs))]
+        prompt_json = build_workflow(draft_template, sampler_pairs, lora2, lora3, final_prompt, filename_prefixes, seed=seed, batch_amount=1)
+        prompt_id = queue_and_check(prompt_json)
+        if not prompt_id:
+            return [], None
+        prompt_ids.append(prompt_id)
+
+    draft_files = wait_for_images(
+        OUTPUT_FOLDER, MAX_WAIT_TIME, CHECK_INTERVAL,
+        draft_prefix, len(seeds) * len(sampler_pairs), log, loop,
+        total_start_time, loop_start_time, final_prompt, LORA1, lora2, lora3, context
+    )
+    wait_seconds = time.time() - start_time
+    time.sleep(DELAY_BEFORE_MOVE)
+
+    windows = execution_windows(prompt_ids)
+    trace_comfy_prompts(windows)
+    run_metrics.gpu_executed(SERVER_ADDRESS, windows.values())
+    draft_seconds = execution_seconds(prompt_ids, windows)
+
+    # A seed's score is the mean over its sampler/scheduler branches; missing drafts score nothing
+    branch_scores = {seed: [] for seed in seeds}
+    with tracing.span("score_drafts", drafts=len(draft_files)):
+        for filename in draft_files:
+            seed = int(filename[len(draft_prefix) + 1:].split('_')[0])
+            path = os.path.join(OUTPUT_FOLDER, filename)
+            try:
+                branch_scores[seed].append(draft_scorer(path))
+            except OSError as e:
+                log_error(f"[DRAFT] Could not score {filename}: {e}")
+            os.remove(path)
+    seed_scores = {seed: sum(scores) / len(scores) for seed, scores in branch_scores.items() if scores}
+    kept = select_seeds(seed_scores, DRAFT_KEEP_FRACTION) if seed_scores else []
+    log(f"[DRAFT] Scored {len(draft_files)} drafts in {wait_seconds:.1f}s; keeping seeds {kept} "
+        f"(scores {', '.join(f'{seed_scores[seed]:.3f}' for seed in kept)}).")
+    return kept, draft_seconds
+
+def execute_workflow_loop(loop, total_start_time, template, sampler_pairs, lora_combos, available_loras, lora_combo=None, draft_template=None, seed=None, render_costs=None):
+    """ Execute one iteration of the workflow loop for lora_combo (a random combo if not given),
+    rendering every (sampler, scheduler) pair in sampler_pairs from a single prompt with seed (random if not given).
+    With draft_template (TWO_STAGE), only the seeds that make the best drafts are rendered in full.
+    render_costs, when given, learns the job's ComfyUI execution seconds and its overhead. """
+    if lora_combo is None:
+        lora_combo = random.choice(lora_combos)
     LORA2, LORA3 = lora_combo['LORA2']['name'], lora_combo['LORA3']['name']
 
     try:
         # Use the function to get the appropriate PROMPT_TEXT
-        final_prompt_text = find_lora_set(LORA1, LORA2, LORA3)
+        final_prompt_text = find_lora_set(LORA1, LORA2, LORA3, lora_combos)
         
     except Exception as e:
         log_error(f"An error occurred: {str(e)}")
@@ -156,104 +380,125 @@ def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, s
     try:
         log(f"Starting loop {loop}/{NUMBER_OF_LOOPS}...")
 
-        if not all([
-            check_model_file(UNET_FILENAME, 'unet'),
-            check_model_file(CLIP1_FILENAME, 'clip'),
-            check_model_file(CLIP2_FILENAME, 'clip'),
-            check_model_file(VAE_FILENAME, 'vae'),
-            check_model_file(LORA1, 'loras'),
-            check_model_file(LORA2, 'loras'),
-            check_model_file(LORA3, 'loras')]):
+        with tracing.span("check_models"):
+            missing_models = model_registry.missing(REQUIRED_MODELS + [('loras', LORA2), ('loras', LORA3)])
+        if missing_models:
+            log(f"Model files not found: {', '.join(name for _, name in missing_models)}")
             return False
 
-        new_seed = random.randint(0, 2**32 - 1)
-        workflow_json["25"]["inputs"]["noise_seed"] = new_seed
-        log(f"Set new random seed to {new_seed}.")
-
         # Load LoRA metadata; assume a function or dictionary providing the needed data structure
         lora_metadata = {f: '' for f in available_loras}  # Simplified placeholder to mock metadata
 
         # Generate prompt with triggers and use the new final_prompt_text
         final_prompt = prepend_trigger_words_to_prompt([LORA1, LORA2, LORA3], final_prompt_text, lora_metadata)
-        workflow_json["6"]["inputs"]["text"] = final_prompt
 
         # Log the prompt after it has been updated
         log(f"Prompt we're creating: {final_prompt}")
 
-        workflow_json["10"]["inputs"]["vae_name"] = VAE_FILENAME
-        workflow_json["11"]["inputs"]["clip_name1"] = CLIP1_FILENAME
-        workflow_json["11"]["inputs"]["clip_name2"] = CLIP2_FILENAME
-        workflow_json["12"]["inputs"]["unet_name"] = UNET_FILENAME
-        workflow_json["16"]["inputs"]["sampler_name"] = sampler_name
-        workflow_json["17"]["inputs"]["scheduler"] = scheduler_name
-        workflow_json["17"]["inputs"]["steps"] = INFERENCE_STEPS
-        workflow_json["26"]["inputs"]["guidance"] = GUIDANCE_SCALE
-        workflow_json["41"]["inputs"]["amount"] = REPEAT_LATENT_BATCH_AMOUNT
-        workflow_json["38"]["inputs"]["lora_name"] = LORA1
-        workflow_json["38"]["inputs"]["strength_model"] = LORA1_WEIGHT
-        workflow_json["38"]["inputs"]["strength_clip"] = LORA1_CLIP_STRENGTH
-        workflow_json["42"]["inputs"]["lora_name"] = LORA2
-        workflow_json["42"]["inputs"]["strength_model"] = LORA2_WEIGHT
-        workflow_json["42"]["inputs"]["strength_clip"] = LORA2_CLIP_STRENGTH
-        workflow_json["43"]["inputs"]["lora_name"] = LORA3
-        workflow_json["43"]["inputs"]["strength_model"] = LORA3_WEIGHT
-        workflow_json["43"]["inputs"]["strength_clip"] = LORA3_CLIP_STRENGTH
-
-        filename_prefix = create_filename_prefix(final_prompt_text, sampler_name, scheduler_name)
-        workflow_json["9"]["inputs"]["filename_prefix"] = filename_prefix
-        log(f"Updated filename prefix to '{filename_prefix}' in the workflow.")
-
-        log("Queueing the prompt...")
+        # TWO_STAGE: low-step drafts pick the seeds; each kept seed is rendered again at full steps
+        two_stage = draft_template is not None
+        draft_seconds = None
+        if two_stage:
+            with run_metrics.stage("draft"):
+                seeds, draft_seconds = render_drafts(
+                    draft_template, loop, total_start_time, loop_start_time,
+                    sampler_pairs, LORA2, LORA3, final_prompt, seed
+                )
+            if not seeds:
+                log("[DRAFT] No draft could be scored.")
+                return False
+        else:
+            seeds = [seed if seed is not None else random.randint(0, 2**32 - 1)]
+
         start_time = datetime.now()
-        response = queue_prompt(workflow_json)
-        if not response:
-            log("Failed to queue the prompt.")
-            return False
-        prompt_id = response.get('prompt_id')
-        if not prompt_id:
-            log("No prompt ID received.")
-            return False
+        renders = []
+        for render_seed in seeds:
+            filename_prefixes = [create_filename_prefix(final_prompt_text, sampler, scheduler) for sampler, scheduler in sampler_pairs]
+            if two_stage:
+                filename_prefixes = [f"{filename_prefix}_{render_seed}" for filename_prefix in filename_prefixes]
+            prompt_json = build_workflow(
+                template, sampler_pairs, LORA2, LORA3, final_prompt, filename_prefixes,
+                seed=render_seed, batch_amount=1 if two_stage else None
+            )
+            log(f"Updated filename prefixes to {', '.join(filename_prefixes)} in the workflow.")
 
-        log(f"Prompt queued successfully with ID: {prompt_id}")
+            log("Queueing the prompt...")
+            prompt_id = queue_and_check(prompt_json)
+            if not prompt_id:
+                return False
+            renders.append((render_seed, prompt_id, filename_prefixes))
         log(f"Final prompt queued: {final_prompt}")
 
-        # Wait for images to be created
-        new_files = wait_for_images(
-            OUTPUT_FOLDER, MAX_WAIT_TIME, CHECK_INTERVAL,
-            filename_prefix, REPEAT_LATENT_BATCH_AMOUNT, log, loop, 
-            total_start_time, loop_start_time, final_prompt, LORA1, LORA2, LORA3
-        )
-        end_time = datetime.now()
-        time_taken = end_time - start_time
+        # Each branch saves under its own prefix, so the images are collected and logged per pair
+        results = []
+        for render_seed, prompt_id, filename_prefixes in renders:
+            for (sampler_name, scheduler_name), filename_prefix in zip(sampler_pairs, filename_prefixes):
+                batch_amount = 1 if two_stage else batch_size_for(sampler_name, scheduler_name)
+                with run_metrics.stage("render"):
+                    wait_for_images(
+                        OUTPUT_FOLDER, MAX_WAIT_TIME, CHECK_INTERVAL,
+                        filename_prefix, batch_amount, log, loop, 
+                        total_start_time, loop_start_time, final_prompt, LORA1, LORA2, LORA3, context
+                    )
+                end_time = datetime.now()
 
-        moved_files = move_and_rename_images(
-            OUTPUT_FOLDER, API_OUTPUT_FOLDER, filename_prefix, 
-            REPEAT_LATENT_BATCH_AMOUNT, DELAY_BEFORE_MOVE
-        )
+                with run_metrics.stage("move"), tracing.span("move_and_rename_images", prefix=filename_prefix):
+                    moved_files = move_and_rename_images(
+                        OUTPUT_FOLDER, API_OUTPUT_FOLDER, filename_prefix, 
+                        batch_amount, DELAY_BEFORE_MOVE
+                    )
 
-        for file in moved_files:
-            remove_metadata_if_required(
-                file, remove_metadata_in_place, show_metadata, 
-                has_metadata, log, REMOVE_METADATA_AFTER
+                    for file in moved_files:
+                        remove_metadata_if_required(
+                            file, remove_metadata_in_place, show_metadata, 
+                            has_metadata, log, REMOVE_METADATA_AFTER
+                        )
+
+                log(f"{sampler_name}/{scheduler_name}: {len(moved_files)} files after {end_time - start_time}")
+                results.append((sampler_name, scheduler_name, batch_amount, end_time, moved_files, render_seed, prompt_id))
+
+        prompt_ids = [prompt_id for _, prompt_id, _ in renders]
+        windows = execution_windows(prompt_ids)
+        trace_comfy_prompts(windows)
+        run_metrics.gpu_executed(SERVER_ADDRESS, windows.values())
+        time_taken = datetime.now() - start_time
+        log(f"Time taken for creation: {time_taken} for {len(sampler_pairs)} sampler/scheduler pairs")
+
+        # ComfyUI's execution time only: polling, the sleeps before moving and metadata stripping do not count
+        final_seconds = execution_seconds(prompt_ids, windows)
+        seconds_saved = None
+        if two_stage:
+            if draft_seconds is None or final_seconds is None:
+                log("[DRAFT] ComfyUI's /history has no execution times for this job; GPU seconds saved not logged.")
+            else:
+                # Per kept image, against rendering every draft seed at full steps
+                seconds_saved = gpu_seconds_saved(draft_seconds, final_seconds, DRAFT_SEEDS, len(seeds)) / len(sampler_pairs)
+                log(f"[DRAFT] Kept {len(seeds)}/{DRAFT_SEEDS} seeds; about {seconds_saved:.1f} GPU-seconds saved per kept image.")
+
+        for sampler_name, scheduler_name, batch_amount, end_time, moved_files, render_seed, prompt_id in results:
+            log_iteration_details(
+                loop, start_time, end_time, INFERENCE_STEPS, 
+                batch_amount, scheduler_name, sampler_name, 
+                moved_files, LORA2, LORA3, final_prompt, seconds_saved
+            )
+            catalog_images(
+                moved_files, sampler_name, scheduler_name, batch_amount, LORA2, LORA3,
+                final_prompt, start_time, end_time, render_seed, prompt_id
             )
-
-        log(f"Time taken for creation: {time_taken} for {len(moved_files)} files")
 
         # Capture the time to respond in the combos file after the workflow executes
-        for iteration in lora_combos:
-            if iteration["LORA1"]["name"] == LORA1 and iteration["LORA2"]["name"] == LORA2 and iteration["LORA3"]["name"] == LORA3:
-                iteration["time_to_respond"] = time_taken.total_seconds()
-                iteration["PROMPT_TEXT"] = final_prompt
-                break
-
-        with open(config['LORA_COMBOS_PATH'], 'w', encoding='utf-8') as f:
-            json.dump(lora_combos, f, indent=2)
-
-        log_iteration_details(
-            loop, start_time, end_time, INFERENCE_STEPS, 
-            REPEAT_LATENT_BATCH_AMOUNT, scheduler_name, sampler_name, 
-            moved_files, LORA2, LORA3, final_prompt
-        )
+        record_combo_result(lora_combos, LORA2, LORA3, final_prompt, time_taken.total_seconds())
+
+        # A wait that timed out leaves the job short; failing it keeps it in the ledger for the next run
+        missing = [f"{sampler_name}/{scheduler_name} {len(moved_files)}/{batch_amount}"
+                   for sampler_name, scheduler_name, batch_amount, _, moved_files, _, _ in results if len(moved_files) < batch_amount]
+        if missing:
+            log(f"Images missing after waiting ({', '.join(missing)}); the job is not marked done.")
+            return False
+
+        gpu_seconds = None if final_seconds is None or (two_stage and draft_seconds is None) else final_seconds + (draft_seconds or 0.0)
+        if render_costs is not None and gpu_seconds is not None:
+            render_costs.observe(job_renders(sampler_pairs, two_stage), gpu_seconds, (datetime.now() - loop_start_time).total_seconds())
 
         return True
 
@@ -261,73 +506,307 @@ def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, s
         log_error(f"Exception occurred during loop {loop}: {str(e)}")
         return False
 
+def job_parameters(template, job):
+    """ The workflow inputs a (combo, sampler_pairs) job sets, keyed by (node id, input name). """
+    lora_combo, sampler_pairs = job
+    return template.inputs_for(
+        lora2=lora_combo['LORA2']['name'], lora3=lora_combo['LORA3']['name'],
+        prompt=lora_combo.get('PROMPT_TEXT'), **branch_values(sampler_pairs)
+    )
+
+def render_with_dispatcher(template, pending_jobs, combos_by_key, lora_combos, available_loras, ledger, render_costs):
+    """ Spread the pending ledger jobs over SERVER_ADDRESSES and gather the images in API_OUTPUT_FOLDER.
+    Each finished job's execution time is learned by render_costs. """
+    jobs = [
+        {"number": job["position"] + 1, "combo": combos_by_key[(job["lora2"], job["lora3"])],
+         "pairs": job["sampler_pairs"], "seed": job["seed"], "ledger_job": job}
+        for job in pending_jobs
+    ]
+    lora_metadata = {f: '' for f in available_loras}
+
+    def build_job_workflow(job):
+        lora2, lora3 = job["combo"]["LORA2"]["name"], job["combo"]["LORA3"]["name"]
+        final_prompt_text = find_lora_set(LORA1, lora2, lora3, lora_combos)
+        job["final_prompt"] = prepend_trigger_words_to_prompt([LORA1, lora2, lora3], final_prompt_text, lora_metadata)
+        # Jobs run side by side, so the job number keeps the file names unique
+        job["filename_prefixes"] = [
+            f"{create_filename_prefix(final_prompt_text, sampler, scheduler)}_{job['number']:05d}"
+            for sampler, scheduler in job["pairs"]
+        ]
+        ledger.mark_started(job["ledger_job"])
+        return build_workflow(
+            template, job["pairs"], lora2, lora3,
+            job["final_prompt"], job["filename_prefixes"], seed=job["seed"]
+        )
+
+    def on_complete(record):
+        job = record["job"]
+        tracing.add_comfy_spans(record["server"], record.get("submitted_at"), record.get("execution_window"), job=job["number"])
+        if record.get("execution_window"):
+            run_metrics.gpu_executed(record["server"], [record["execution_window"]])
+        if record["status"] != "success":
+            run_metrics.job_failed()
+            ledger.mark_failed(job["ledger_job"])
+            log(f"Job {job['number']} failed on {record['server']} ({record['status']}).")
+            return
+        for file in record["files"]:
+            remove_metadata_if_required(
+                file, remove_metadata_in_place, show_metadata,
+                has_metadata, log, REMOVE_METADATA_AFTER
+            )
+        lora2, lora3 = job["combo"]["LORA2"]["name"], job["combo"]["LORA3"]["name"]
+        record_combo_result(lora_combos, lora2, lora3, job["final_prompt"], record["execution_seconds"])
+        end_time = datetime.fromtimestamp(record["finished_at"])
+        # ComfyUI names outputs <prefix>_00001_.png, which routes each file back to its pair
+        for (sampler, scheduler), filename_prefix in zip(job["pairs"], job["filename_prefixes"]):
+            files = [file for file in record["files"] if os.path.basename(file).startswith(f"{filename_prefix}_")]
+            start_time = end_time - timedelta(seconds=record["execution_seconds"])
+            log_iteration_details(
+                job["number"], start_time, end_time,
+                INFERENCE_STEPS, batch_size_for(sampler, scheduler), scheduler, sampler,
+                files, lora2, lora3, job["final_prompt"]
+            )
+            catalog_images(
+                files, sampler, scheduler, batch_size_for(sampler, scheduler), lora2, lora3,
+                job["final_prompt"], start_time, end_time, job["seed"], record["prompt_id"]
+            )
+        ledger.mark_done(job["ledger_job"])
+        if record.get("execution_window"):  # Without it execution_seconds is wall time, queue wait included
+            render_costs.observe(job_renders(job["pairs"]), record["execution_seconds"])
+        run_metrics.job_done(len(record["files"]))
+        run_metrics.add_stage("render", record["execution_seconds"])
+        log(f"Job {job['number']} finished on {record['server']} in {record['execution_seconds']:.1f}s ({len(record['files'])} files).")
+
+    log(f"Dispatching {len(jobs)} jobs over {len(SERVER_ADDRESSES)} ComfyUI servers...")
+    dispatcher = ComfyDispatcher(SERVER_ADDRESSES, API_OUTPUT_FOLDER)
+    records = dispatcher.run(jobs, build_job_workflow, on_complete)
+    dispatcher.log_summary()
+    return sum(len(record["files"]) for record in records if record["status"] == "success")
+
 # MAIN EXECUTION SECTION
 
 def main():
     """ Main function to execute the workflow with error handling. """
+    metrics_exporter = None
+    if TRACE_DIRECTORY:
+        tracing.enable(os.path.join(TRACE_DIRECTORY, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
+        tracing.add_span("load_config", *config_load_span)
     try:
         os.makedirs(OUTPUT_FOLDER, exist_ok=True)
         os.makedirs(API_OUTPUT_FOLDER, exist_ok=True)
 
-        log("Initializing ComfyUI...")
-        if not initialize_comfyui():
-            log("Failed to initialize ComfyUI.")
-            return
+        # With several servers each box runs its own ComfyUI; only a local single server is started here
+        if len(SERVER_ADDRESSES) == 1:
+            log("Initializing ComfyUI...")
+            with tracing.span("initialize_comfyui"):
+                comfyui_ready = initialize_comfyui()
+            if not comfyui_ready:
+                log("Failed to initialize ComfyUI.")
+                return
+
+            # Check the local model files once; after that the registry watches the folders for changes
+            with tracing.span("check_models"):
+                models_ready = model_registry.validate(REQUIRED_MODELS)
+            if not models_ready:
+                log("Model files are missing; stopping.")
+                return
+            model_registry.watch(REQUIRED_MODELS)
 
         log(f"Loading workflow from {WORKFLOW_PATH}...")
-        with open(WORKFLOW_PATH, 'r', encoding='utf-8') as file:
+        with tracing.span("load_workflow"), open(WORKFLOW_PATH, 'r', encoding='utf-8') as file:
             workflow_json = json.load(file)
-        log("Workflow loaded.")
+        # Fan-out puts every sampler/scheduler pair in one prompt; otherwise each pair is its own job
+        if FAN_OUT_SAMPLERS:
+            sampler_groups = [tuple(tuple(pair) for pair in BEST_SAMPLERS_SCHEDULERS)]
+        else:
+            sampler_groups = [(tuple(pair),) for pair in BEST_SAMPLERS_SCHEDULERS]
+        template = compile_workflow(workflow_json, len(sampler_groups[0]))
+        log(f"Workflow loaded ({len(sampler_groups[0])} sampler branches per prompt).")
+
+        draft_template = None
+        if TWO_STAGE and len(SERVER_ADDRESSES) == 1:
+            draft_template = compile_workflow(workflow_json, len(sampler_groups[0]), steps=DRAFT_STEPS)
+            log(f"[DRAFT] Two-stage mode: {DRAFT_SEEDS} drafts at {DRAFT_STEPS} steps per job, "
+                f"keeping {keep_count(DRAFT_SEEDS, DRAFT_KEEP_FRACTION)} for {INFERENCE_STEPS} steps.")
+        elif TWO_STAGE:
+            log("[DRAFT] TWO_STAGE needs the local output folder; ignored with several servers.")
+
+        def images_per_job(sampler_pairs):
+            if draft_template is not None:
+                return keep_count(DRAFT_SEEDS, DRAFT_KEEP_FRACTION) * len(sampler_pairs)
+            return sum(batch_size_for(sampler, scheduler) for sampler, scheduler in sampler_pairs)
 
         total_start_time = datetime.now()
         total_files = 0
+        run_metrics.started_at = time.time()
+        metrics_exporter = MetricsExporter(run_metrics, METRICS_PORT, METRICS_JSON_PATH, METRICS_INTERVAL, METRICS_HOST)
 
         # Get all available LORA files except the primary LORA
         available_loras = [f for f in os.listdir(LORA_DIRECTORY) if f != LORA1 and f.endswith('.safetensors')]
 
+        # Load LoRA combinations (ensure metadata is current but do not create new combos)
+        update_lora_metadata()
+        lora_combos = context.lora_combos
+
         # Shuffle the LoRA combinations
         random.shuffle(lora_combos)
 
-        total_lora_combinations = len(lora_combos)
-        total_sampler_scheduler_combinations = len(BEST_SAMPLERS_SCHEDULERS)
-        total_expected_images = total_lora_combinations * total_sampler_scheduler_combinations * REPEAT_LATENT_BATCH_AMOUNT * NUMBER_OF_LOOPS
-
-        for loop_count in range(NUMBER_OF_LOOPS):
-            for combo_index, lora_combo in enumerate(lora_combos):  # Iterate systematically over each randomized combo
-                LORA2, LORA3 = lora_combo['LORA2']['name'], lora_combo['LORA3']['name']
-                final_prompt_text = find_lora_set(LORA1, LORA2, LORA3)
-
-                for idx, (sampler, scheduler) in enumerate(BEST_SAMPLERS_SCHEDULERS):
-                    log(f"Loop {loop_count + 1}/{NUMBER_OF_LOOPS}, Combo {combo_index + 1}/{total_lora_combinations}, Sampler Name: {sampler}, Scheduler Name: {scheduler}")
-
-                    # Calculate running and estimated times
-                    current_time = datetime.now()
-                    running_time = current_time - total_start_time
-
-                    images_done = (combo_index * total_sampler_scheduler_combinations + idx + 1) * REPEAT_LATENT_BATCH_AMOUNT
-                    total_remaining_images = total_expected_images - images_done
-                    estimated_time_remaining = (running_time / total_files * total_remaining_images) if total_files > 0 else timedelta(0)
-
-                    log(f"Running time since start of script: {running_time}")
-                    log(f"Total images remaining: {total_remaining_images}")
-                    log(f"Estimated time remaining: ~{timedelta(seconds=int(estimated_time_remaining.total_seconds()))}")
-                    log("================")
-
-                    start_time = time.time()
-                    success = execute_workflow_loop(
-                        combo_index * total_sampler_scheduler_combinations + idx + 1,
-                        total_start_time,
-                        workflow_json,
-                        sampler,
-                        scheduler,
-                        lora_combos,
-                        available_loras
-                    )
-                    time_taken_this_set = time.time() - start_time
-
-                    if success:
-                        total_files += REPEAT_LATENT_BATCH_AMOUNT
-                    clear_vram()
+        if DEDUPE_PROMPTS:
+            from utilities.prompt_dedup import mark_duplicates
+            clusters = mark_duplicates(lora_combos)
+            context.save_lora_combos(lora_combos)
+            log(f"Marked {sum(len(cluster) - 1 for cluster in clusters)} near-duplicate prompts in {len(clusters)} clusters.")
+
+        # Combos marked by utilities/prompt_dedup.py share a prompt with another combo; render that one only
+        combos_to_render = [combo for combo in lora_combos if not combo.get('DUPLICATE_OF')]
+        if len(combos_to_render) < len(lora_combos):
+            log(f"Skipping {len(lora_combos) - len(combos_to_render)} combos marked as near-duplicate prompts.")
+
+        # Tuned before planning, so the batch sizes in the plan signature are the ones the run uses
+        if AUTOTUNE_BATCH and len(SERVER_ADDRESSES) == 1 and combos_to_render:
+            sample_combo = combos_to_render[0]
+            batch_tuning.update(autotune(
+                comfy_client, WorkflowTemplate(workflow_json, FLUX_LORA_BINDINGS, workflow_constants()),
+                {"prompt": sample_combo.get('PROMPT_TEXT') or config['PROMPT_TEXT'],
+                 "lora2": sample_combo['LORA2']['name'], "lora3": sample_combo['LORA3']['name']},
+                BEST_SAMPLERS_SCHEDULERS, BATCH_TUNING_PATH, AUTOTUNE_BATCH_SIZES, output_folder=OUTPUT_FOLDER
+            ))
+
+        # The ledger keeps the planned order and seeds; an open run with the same plan is resumed as it was
+        plan_start = time.time()
+        ledger = JobLedger(JOB_LEDGER_PATH)
+        combos_by_key = {(combo['LORA2']['name'], combo['LORA3']['name']): combo for combo in combos_to_render}
+        signature = plan_signature(
+            workflow=WORKFLOW_PATH, loops=NUMBER_OF_LOOPS, combos=sorted(combos_by_key),
+            sampler_groups=sampler_groups, job_order=JOB_ORDER, two_stage=draft_template is not None,
+            inference_steps=INFERENCE_STEPS,
+            batch_sizes={f"{sampler}/{scheduler}": batch_size_for(sampler, scheduler) for sampler_pairs in sampler_groups for sampler, scheduler in sampler_pairs},
+            drafts=[DRAFT_SEEDS, DRAFT_STEPS, DRAFT_KEEP_FRACTION] if draft_template is not None else None
+        )
+        run_id = ledger.open_run(signature)
+        if run_id is None:
+            # Consecutive jobs that share LoRAs and prompt let ComfyUI reuse its cached nodes
+            jobs = [(lora_combo, sampler_pairs) for lora_combo in combos_to_render for sampler_pairs in sampler_groups]
+            cost_model = JobCostModel(template.workflow_json, lambda job: job_parameters(template, job))
+            random_order_cost = cost_model.sequence_cost(plan_jobs(jobs, cost_model, "random"))
+            jobs = plan_jobs(jobs, cost_model, JOB_ORDER)
+            log(f"Job order '{JOB_ORDER}': about {cost_model.sequence_cost(jobs):.0f}s of re-run nodes per loop (random order: {random_order_cost:.0f}s).")
+            run_id = ledger.create_run(signature, len(jobs), (
+                (loop_count, job_index, lora_combo['LORA2']['name'], lora_combo['LORA3']['name'], sampler_pairs)
+                for loop_count in range(NUMBER_OF_LOOPS) for job_index, (lora_combo, sampler_pairs) in enumerate(jobs)
+            ), SEED_BASE)
+            log(f"[LEDGER] Planned run {run_id}: {len(jobs) * NUMBER_OF_LOOPS} jobs in {JOB_LEDGER_PATH}.")
+        else:
+            counts = ledger.counts(run_id)
+            log(f"[LEDGER] Resuming run {run_id}: {counts.get('done', 0)}/{sum(counts.values())} jobs already done.")
+        jobs_per_loop = ledger.run_info(run_id)["jobs_per_loop"]
+        pending_jobs = ledger.pending(run_id)
+        tracing.add_span("plan_jobs", plan_start, time.time(), run_id=run_id, pending=len(pending_jobs))
+
+        # Per sampler/scheduler/steps/batch costs give the ETAs and, with FINISH_BY, pick the jobs that fit
+        iteration_log = ITERATION_LOG_DIRECTORY if ITERATION_LOG_FORMAT == 'parquet' else ITERATION_LOG_FILE
+        render_costs = load_cost_model(RENDER_COSTS_PATH, iteration_log, 'sampler_benchmark.csv')
+        deadline = parse_deadline(FINISH_BY) if FINISH_BY else None
+        two_stage = draft_template is not None
+
+        def plan_queue(jobs, covered, servers=1):
+            """ The jobs to run next, in order, with their estimated seconds by sampler group. """
+            # The dispatcher overlaps one job's overhead with the next job's render
+            group_seconds = {group: render_costs.job_seconds(job_renders(group, two_stage), overhead=servers == 1)
+                             for group in {job["sampler_pairs"] for job in jobs}}
+            if deadline is None:
+                return jobs, group_seconds
+            budget = (deadline - datetime.now()).total_seconds() * servers
+            return budget_jobs(jobs, lambda job: group_seconds[job["sampler_pairs"]], budget, JOB_COVERAGE, covered), group_seconds
+
+        if deadline is not None:
+            log(f"[BUDGET] Finishing by {deadline:%Y-%m-%d %H:%M}; jobs that do not fit stay planned for the next start.")
+
+        if len(SERVER_ADDRESSES) > 1:
+            queue, group_seconds = plan_queue(pending_jobs, None, len(SERVER_ADDRESSES))
+            queue_seconds = sum(group_seconds[job["sampler_pairs"]] for job in queue) / len(SERVER_ADDRESSES)
+            log(f"[ESTIMATE] {len(queue)}/{len(pending_jobs)} pending jobs, about {timedelta(seconds=int(queue_seconds))} "
+                f"over {len(SERVER_ADDRESSES)} servers.")
+            total_files = render_with_dispatcher(template, queue, combos_by_key, lora_combos, available_loras, ledger, render_costs)
+        else:
+            remaining_jobs = pending_jobs
+            covered = [set() for _ in JOB_COVERAGE]
+            run_positions = set()
+            queue, next_index, replan = [], 0, True
+            while True:
+                if replan or next_index == len(queue):
+                    # Planned once, and again only when a measured cost drifts by REPLAN_DRIFT or the plan runs out
+                    remaining_jobs = [other for other in remaining_jobs if other["position"] not in run_positions]
+                    if not remaining_jobs:
+                        break
+                    queue, group_seconds = plan_queue(remaining_jobs, covered)
+                    next_index, replan = 0, False
+                    if not queue:
+                        log(f"[BUDGET] No remaining job fits before {deadline:%H:%M}; {len(remaining_jobs)} jobs stay planned.")
+                        break
+                    if len(queue) < len(remaining_jobs):
+                        log(f"[BUDGET] {len(remaining_jobs) - len(queue)} jobs do not fit before {deadline:%H:%M} and are deferred.")
+                    queue_seconds = sum(group_seconds[other["sampler_pairs"]] for other in queue)
+                    images_remaining = sum(images_per_job(other["sampler_pairs"]) for other in queue)
+                job = queue[next_index]
+                next_index += 1
+                run_positions.add(job["position"])
+                sampler_pairs = job["sampler_pairs"]
+                job_images = images_per_job(sampler_pairs)
+                log(f"Loop {job['loop'] + 1}/{NUMBER_OF_LOOPS}, Job {job['job_index'] + 1}/{jobs_per_loop}, Sampler/Scheduler: {describe_pairs(sampler_pairs)}, Seed: {job['seed']}")
+
+                running_time = datetime.now() - total_start_time
+                job_seconds = group_seconds[sampler_pairs]
+                log(f"Running time since start of script: {running_time}")
+                log(f"Total images remaining: {images_remaining}")
+                log(f"[ESTIMATE] This job ~{timedelta(seconds=int(job_seconds))}; {len(queue) - next_index + 1} jobs ~{timedelta(seconds=int(queue_seconds))}, "
+                    f"done about {datetime.now() + timedelta(seconds=queue_seconds):%Y-%m-%d %H:%M}")
+                log("================")
+
+                start_time = time.time()
+                context.remaining_seconds = lambda: queue_seconds - min(time.time() - start_time, job_seconds)
+                ledger.mark_started(job)
+                success = execute_workflow_loop(
+                    job['job_index'] + 1,
+                    total_start_time,
+                    template,
+                    sampler_pairs,
+                    lora_combos,
+                    available_loras,
+                    combos_by_key[(job['lora2'], job['lora3'])],
+                    draft_template,
+                    job['seed'],
+                    render_costs
+                )
+                time_taken_this_set = time.time() - start_time
+                tracing.add_span("job", start_time, start_time + time_taken_this_set, position=job['position'],
+                                 pairs=describe_pairs(sampler_pairs), seed=job['seed'], success=success)
+                queue_seconds -= job_seconds
+                images_remaining -= job_images
+
+                run_metrics.add_stage("job", time_taken_this_set)
+                if success:
+                    ledger.mark_done(job)
+                    run_metrics.job_done(job_images)
+                    total_files += job_images
+                    for level, key_of in enumerate(JOB_COVERAGE):
+                        covered[level].add(key_of(job))
+                    if any(abs(render_costs.job_seconds(job_renders(group, two_stage)) - seconds) > REPLAN_DRIFT * seconds
+                           for group, seconds in group_seconds.items()):
+                        log(f"[BUDGET] A job's estimated cost moved by more than {REPLAN_DRIFT:.0%}; planning the remaining jobs again.")
+                        replan = True
+                else:
+                    ledger.mark_failed(job)
+                    run_metrics.job_failed()
+                clear_vram()
+            context.remaining_seconds = None
+
+        if ledger.finish_run(run_id):
+            log(f"[LEDGER] Run {run_id} is complete.")
+        else:
+            counts = ledger.counts(run_id)
+            log(f"[LEDGER] Run {run_id}: {counts.get('failed', 0)} jobs failed and {counts.get('planned', 0)} were not run; the next start resumes them.")
+        ledger.close()
 
         total_end_time = datetime.now()
         total_time_taken = total_end_time - total_start_time
@@ -335,15 +814,20 @@ def main():
 
         log(f"Total time taken for all loops: {total_time_taken}")
         log(f"Average time per file creation: {average_time_per_file}")
+        comfy_client.log_latency()
         log("Completed successfully!")
 
     except Exception as e:
         log_error(f"Exception occurred in main: {str(e)}")
+    finally:
+        flush_iteration_log()
+        if metrics_exporter:
+            metrics_exporter.stop()
+        trace_path = tracing.write()
+        if trace_path:
+            log(f"[TRACE] Wrote {trace_path}; open it in https://ui.perfetto.dev or chrome://tracing.")
 
 
 if __name__ == "__main__":
-    log("Clearing the log file...")
-    with open(LOG_FILE, 'w', encoding='utf-8') as f:
-        f.write("")
-
+    configure_logging(LOG_FILE, LOG_LEVEL, clear=True)
     main()
\ No newline at end of file
@@ -1,23 +1,27 @@
 import os
 import json
-import requests
 import time
 from datetime import datetime, timedelta
 import shutil
 import random
-import traceback
 import re
 import csv
-import torch
 import gc
 from utilities.remove_metadata import remove_metadata_in_place, show_metadata, has_metadata
 from utilities.comfy_starter import initialize_comfyui
+from utilities.comfy_client import ComfyClient, ComfyRequestError
+from utilities.comfy_dispatcher import execution_window
+from utilities.model_registry import ModelRegistry
+from utilities.logging_utils import configure_logging, log, log_debug, log_error
+from utilities.workflow_template import FLUX_LORA_BINDINGS, WorkflowTemplate
+from utilities import tracing
 
 # GLOBAL VARIABLES SECTION
 WORKFLOW_PATH = 'workflow_json\\superhero_creator.json'
 OUTPUT_FOLDER = 'ComfyUI\\output'
 SERVER_ADDRESS = 'http://127.0.0.1:8188'
 LOG_FILE = 'superhero_test_log.txt'
+TRACE_DIRECTORY = None  # Set to a folder to write a Chrome/Perfetto trace of each run (see utilities/tracing.py)
 API_OUTPUT_FOLDER = 'api_outputs'
 ITERATION_LOG_FILE = 'iteration_log.csv'
 CHECK_INTERVAL = 60
@@ -60,6 +64,14 @@ CLIP1_FILENAME = "t5xxl_fp8_e4m3fn.safetensors"
 CLIP2_FILENAME = "clip_l.safetensors"
 VAE_FILENAME = "ae.safetensors"
 
+# Checked once at startup, then watched by the model registry
+REQUIRED_MODELS = [
+    ('unet', UNET_FILENAME), ('clip', CLIP1_FILENAME), ('clip', CLIP2_FILENAME), ('vae', VAE_FILENAME),
+    ('loras', LORA1), ('loras', LORA2), ('loras', LORA3)
+]
+model_registry = ModelRegistry(MODEL_DIRS)
+comfy_client = ComfyClient(SERVER_ADDRESS)
+
 DEFAULT_SAMPLER = "euler"
 DEFAULT_SCHEDULER = "simple"
 
@@ -90,36 +102,17 @@ BEST_SAMPLERS_SCHEDULERS = [
 USE_ALL_CONFIGS = True
 
 # HELPER FUNCTIONS SECTION
-def log(message):
-    """ Log a message both to the console and to a file. """
-    with open(LOG_FILE, 'a') as f:
-        f.write(f"{message}\n")
-    print(message)
-
-def log_error(message):
-    """ Log an error message with traceback both to the console and to a file. """
-    with open(LOG_FILE, 'a') as f:
-        f.write(f"{message}\n")
-        f.write(traceback.format_exc() + "\n")
-    print(message)
-    print(traceback.format_exc())
-
-def queue_prompt(workflow_json):
-    """ Queue a workflow prompt in the ComfyUI server with error handling. """
-    url = f"{SERVER_ADDRESS}/prompt"
-    headers = {'Content-Type': 'application/json'}
-    data = {'prompt': workflow_json}
-
+def queue_prompt(prompt_json):
+    """ Queue a workflow prompt (JSON text rendered from the template) in the ComfyUI server with error handling. """
     try:
-        log(f"Queueing prompt to {url} with data: {json.dumps(data, indent=4)}")
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-
-        if response.status_code == 200:
-            log("Prompt queued successfully.")
-            return response.json()
-        else:
-            log(f"Error {response.status_code}: {response.text}")
-            return None
+        log(f"Queueing prompt to {SERVER_ADDRESS}/prompt")
+        log_debug(f"Prompt payload: {prompt_json}")
+        response = comfy_client.queue_prompt(prompt_json)
+        log("Prompt queued successfully.")
+        return response
+    except ComfyRequestError as e:
+        log(f"Error {e.status_code}: {e.body}")
+        return None
     except Exception as e:
         log_error(f"An exception occurred while queuing the prompt: {str(e)}")
         return None
@@ -152,16 +145,16 @@ def wait_for_images(output_path, wait_time, check_interval, prefix, expected_cou
         estimated_time_remaining_str = str(timedelta(seconds=int(estimated_time_remaining)))
 
         log(f"[{current_time.strftime('%Y-%m-%d %H:%M:%S')}] {len(found_files)}/{expected_count} images created in loop {loop} of {NUMBER_OF_LOOPS}. Still creating, rechecking in {check_interval} seconds...")
-        log(f"Prompt we're creating: {PROMPT_TEXT}")
-        log(f"Inference steps: {INFERENCE_STEPS}")
-        log(f"Loras in use: {LORA1}, {LORA2}, {LORA3}")
-        log(f"Sampler Name: {sampler_name}")
-        log(f"Scheduler Name: {scheduler_name}")
+        log_debug(f"Prompt we're creating: {PROMPT_TEXT}")
+        log_debug(f"Inference steps: {INFERENCE_STEPS}")
+        log_debug(f"Loras in use: {LORA1}, {LORA2}, {LORA3}")
+        log_debug(f"Sampler Name: {sampler_name}")
+        log_debug(f"Scheduler Name: {scheduler_name}")
         log(f"Running time since start of script: {str(total_elapsed_time)}")
         log(f"Running time for this image creation set: {str(loop_elapsed_time)}")
         log(f"Images remaining: {images_remaining}")
         log(f"Estimated time remaining: ~{estimated_time_remaining_str}")
-        log(f"================")
+        log_debug(f"================")
 
         time.sleep(check_interval)
         total_wait_time += check_interval
@@ -184,7 +177,8 @@ def move_and_rename_images(src_path, dest_dir, new_filename_prefix, num_images):
         src_filepath = os.path.join(src_path, original_filename)
         dest_filepath = os.path.join(dest_dir, dest_filename)
         
-        time.sleep(DELAY_BEFORE_MOVE)  # Wait before moving the file to ensure it is not being used
+        with tracing.span("sleep_before_move", delay=DELAY_BEFORE_MOVE):
+            time.sleep(DELAY_BEFORE_MOVE)  # Wait before moving the file to ensure it is not being used
 
         try:
             shutil.move(src_filepath, dest_filepath)
@@ -207,22 +201,22 @@ def remove_metadata_if_required(file_path):
     if REMOVE_METADATA_AFTER:
         if has_metadata(file_path):
             log(f"Removing metadata from {file_path}...")
-            show_metadata(file_path)
-            remove_metadata_in_place(file_path)
-            show_metadata(file_path)
-
-def check_model_file(model_filename, category):
-    """Check if the model file exists in the given directory."""
-    model_path = os.path.join(MODEL_DIRS[category], model_filename)
-    if not os.path.exists(model_path):
-        log(f"Model file '{model_filename}' not found in '{MODEL_DIRS[category]}' directory.")
-        return False
-    log(f"Model file '{model_filename}' found in '{MODEL_DIRS[category]}' directory.")
-    return True
+            with tracing.span("strip_metadata", file=os.path.basename(file_path)):
+                show_metadata(file_path)
+                remove_metadata_in_place(file_path)
+                show_metadata(file_path)
+
+def trace_comfy_prompt(prompt_id, submitted_at):
+    """ Add the prompt's queue wait and execution on the ComfyUI server to the trace. """
+    try:
+        status = comfy_client.history(prompt_id).get(prompt_id, {}).get("status", {})
+    except Exception as e:
+        log_debug(f"[TRACE] No history for prompt {prompt_id}: {e}")
+        return
+    tracing.add_comfy_spans(SERVER_ADDRESS, submitted_at, execution_window(status), prompt_id=prompt_id)
 
 def clear_vram():
-    """ Clear VRAM and collect garbage. """
-    torch.cuda.empty_cache()
+    """ Collect garbage between sets. VRAM is held by the ComfyUI server, not by this process. """
     gc.collect()
 
 def log_iteration_details(iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler):
@@ -234,52 +228,51 @@ def log_iteration_details(iter_num, time_start, time_end, inference_steps, laten
             writer.writerow(["Iteration Number", "Start Time", "End Time", "Inference Steps", "Latent Batch Amount", "Scheduler", "Sampler", "Time to Complete"])
         writer.writerow([iter_num, time_start.strftime("%Y-%m-%d %H:%M:%S"), time_end.strftime("%Y-%m-%d %H:%M:%S"), inference_steps, latent_batch_amount, scheduler, sampler, str(time_end - time_start)])
 
-def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, scheduler_name, total_combinations):
+def compile_workflow(workflow_json):
+    """ Compile workflow_json with the prompt, models, LoRAs and guidance above baked in. """
+    return WorkflowTemplate(workflow_json, FLUX_LORA_BINDINGS, constants={
+        "prompt": PROMPT_TEXT,
+        "vae": VAE_FILENAME,
+        "clip1": CLIP1_FILENAME,
+        "clip2": CLIP2_FILENAME,
+        "unet": UNET_FILENAME,
+        "steps": INFERENCE_STEPS,
+        "guidance": GUIDANCE_SCALE,
+        "batch_amount": REPEAT_LATENT_BATCH_AMOUNT,
+        "lora1": LORA1,
+        "lora1_strength": LORA1_WEIGHT,
+        "lora1_clip_strength": LORA1_CLIP_STRENGTH,
+        "lora2": LORA2,
+        "lora2_strength": LORA2_WEIGHT,
+        "lora2_clip_strength": LORA2_CLIP_STRENGTH,
+        "lora3": LORA3,
+        "lora3_strength": LORA3_WEIGHT,
+        "lora3_clip_strength": LORA3_CLIP_STRENGTH,
+    })
+
+def execute_workflow_loop(loop, total_start_time, template, sampler_name, scheduler_name, total_combinations):
     loop_start_time = datetime.now()
     try:
         log(f"Starting loop {loop}/{NUMBER_OF_LOOPS}...")
 
-        if not all([
-            check_model_file(UNET_FILENAME, 'unet'),
-            check_model_file(CLIP1_FILENAME, 'clip'),
-            check_model_file(CLIP2_FILENAME, 'clip'),
-            check_model_file(VAE_FILENAME, 'vae'),
-            check_model_file(LORA1, 'loras'),
-            check_model_file(LORA2, 'loras'),
-            check_model_file(LORA3, 'loras')]):
+        missing_models = model_registry.missing(REQUIRED_MODELS)
+        if missing_models:
+            log(f"Model files not found: {', '.join(name for _, name in missing_models)}")
             return False
 
         new_seed = random.randint(0, 2**32 - 1)
-        workflow_json["25"]["inputs"]["noise_seed"] = new_seed
         log(f"Set new random seed to {new_seed}.")
 
-        workflow_json["6"]["inputs"]["text"] = PROMPT_TEXT
-        workflow_json["10"]["inputs"]["vae_name"] = VAE_FILENAME
-        workflow_json["11"]["inputs"]["clip_name1"] = CLIP1_FILENAME
-        workflow_json["11"]["inputs"]["clip_name2"] = CLIP2_FILENAME
-        workflow_json["12"]["inputs"]["unet_name"] = UNET_FILENAME
-        workflow_json["16"]["inputs"]["sampler_name"] = sampler_name
-        workflow_json["17"]["inputs"]["scheduler"] = scheduler_name
-        workflow_json["17"]["inputs"]["steps"] = INFERENCE_STEPS
-        workflow_json["26"]["inputs"]["guidance"] = GUIDANCE_SCALE  # Set guidance scale
-        workflow_json["41"]["inputs"]["amount"] = REPEAT_LATENT_BATCH_AMOUNT
-        workflow_json["38"]["inputs"]["lora_name"] = LORA1
-        workflow_json["38"]["inputs"]["strength_model"] = LORA1_WEIGHT
-        workflow_json["38"]["inputs"]["strength_clip"] = LORA1_CLIP_STRENGTH  # Apply LoRA1 clip strength
-        workflow_json["42"]["inputs"]["lora_name"] = LORA2
-        workflow_json["42"]["inputs"]["strength_model"] = LORA2_WEIGHT
-        workflow_json["42"]["inputs"]["strength_clip"] = LORA2_CLIP_STRENGTH  # Apply LoRA2 clip strength
-        workflow_json["43"]["inputs"]["lora_name"] = LORA3
-        workflow_json["43"]["inputs"]["strength_model"] = LORA3_WEIGHT
-        workflow_json["43"]["inputs"]["strength_clip"] = LORA3_CLIP_STRENGTH  # Apply LoRA3 clip strength
-
         filename_prefix = create_filename_prefix(PROMPT_TEXT, sampler_name, scheduler_name)
-        workflow_json["9"]["inputs"]["filename_prefix"] = filename_prefix
+        with tracing.span("build_payload"):
+            prompt_json = template.render(seed=new_seed, sampler=sampler_name, scheduler=scheduler_name, filename_prefix=filename_prefix)
         log(f"Updated filename prefix to '{filename_prefix}' in the workflow.")
 
         log("Queueing the prompt...")
         start_time = datetime.now()
-        response = queue_prompt(workflow_json)
+        submitted_at = time.time()
+        with tracing.span("queue_prompt"):
+            response = queue_prompt(prompt_json)
         if not response:
             log("Failed to queue the prompt.")
             return False
@@ -290,13 +283,17 @@ def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, s
 
         log(f"Prompt queued successfully with ID: {prompt_id}")
 
-        new_files = wait_for_images(OUTPUT_FOLDER, MAX_WAIT_TIME, CHECK_INTERVAL, filename_prefix, REPEAT_LATENT_BATCH_AMOUNT, loop, total_start_time, loop_start_time, sampler_name, scheduler_name)
+        with tracing.span("wait_for_images", prefix=filename_prefix):
+            new_files = wait_for_images(OUTPUT_FOLDER, MAX_WAIT_TIME, CHECK_INTERVAL, filename_prefix, REPEAT_LATENT_BATCH_AMOUNT, loop, total_start_time, loop_start_time, sampler_name, scheduler_name)
         end_time = datetime.now()
         time_taken = end_time - start_time
+        if tracing.enabled():
+            trace_comfy_prompt(prompt_id, submitted_at)
 
-        moved_files = move_and_rename_images(OUTPUT_FOLDER, API_OUTPUT_FOLDER, filename_prefix, REPEAT_LATENT_BATCH_AMOUNT)
-        for file in moved_files:
-            remove_metadata_if_required(file)
+        with tracing.span("move_and_rename_images", prefix=filename_prefix):
+            moved_files = move_and_rename_images(OUTPUT_FOLDER, API_OUTPUT_FOLDER, filename_prefix, REPEAT_LATENT_BATCH_AMOUNT)
+            for file in moved_files:
+                remove_metadata_if_required(file)
 
         log(f"Time taken for creation: {time_taken} for {len(moved_files)} files")
 
@@ -313,18 +310,30 @@ def execute_workflow_loop(loop, total_start_time, workflow_json, sampler_name, s
 # MAIN EXECUTION SECTION
 def main():
     """ Main function to execute the workflow with error handling. """
+    if TRACE_DIRECTORY:
+        tracing.enable(os.path.join(TRACE_DIRECTORY, f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"))
     try:
         os.makedirs(OUTPUT_FOLDER, exist_ok=True)
         os.makedirs(API_OUTPUT_FOLDER, exist_ok=True)
 
         log("Initializing ComfyUI...")
-        if not initialize_comfyui():
+        with tracing.span("initialize_comfyui"):
+            comfyui_ready = initialize_comfyui()
+        if not comfyui_ready:
             log("Failed to initialize ComfyUI.")
             return
 
+        # Check the model files once; after that the registry watches the folders for changes
+        with tracing.span("check_models"):
+            models_ready = model_registry.validate(REQUIRED_MODELS)
+        if not models_ready:
+            log("Model files are missing; stopping.")
+            return
+        model_registry.watch(REQUIRED_MODELS)
+
         log(f"Loading workflow from {WORKFLOW_PATH}...")
-        with open(WORKFLOW_PATH, 'r') as file:
-            workflow_json = json.load(file)
+        with tracing.span("load_workflow"), open(WORKFLOW_PATH, 'r') as file:
+            template = compile_workflow(json.load(file))
         log("Workflow loaded.")
 
         total_start_time = datetime.now()
@@ -349,10 +358,11 @@ def main():
             log(f"Running time for this image creation set: 0:00:00.000000")  # Placeholder; this updates per loop
             log(f"Images remaining: {images_remaining}")
             log(f"Estimated time remaining: ~{timedelta(seconds=int(estimated_time_remaining.total_seconds()))}")
-            log(f"================")
+            log_debug(f"================")
 
             start_time = time.time()
-            success = execute_workflow_loop(idx + 1, total_start_time, workflow_json, sampler, scheduler, total_combinations)
+            with tracing.span("job", pairs=f"{sampler}/{scheduler}"):
+                success = execute_workflow_loop(idx + 1, total_start_time, template, sampler, scheduler, total_combinations)
             time_taken_this_set = time.time() - start_time
 
             total_files = (idx + 1) * REPEAT_LATENT_BATCH_AMOUNT
@@ -368,11 +378,13 @@ def main():
 
     except Exception as e:
         log_error(f"Exception occurred in main: {str(e)}")
+    finally:
+        trace_path = tracing.write()
+        if trace_path:
+            log(f"[TRACE] Wrote {trace_path}; open it in https://ui.perfetto.dev or chrome://tracing.")
 
 if __name__ == "__main__":
-    log("Clearing the log file...")
-    with open(LOG_FILE, 'w') as f:
-        f.write("")
+    configure_logging(LOG_FILE, clear=True)
     main()
 
 #NOTES
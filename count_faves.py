@@ -1,15 +1,20 @@
 import os
-import json
+import argparse
 from collections import Counter
+from utilities.image_catalog import ImageCatalog
+from utilities.runtime_context import get_runtime_context
 
-# Load configurations from the global variable JSON file
-def load_configurations():
-    with open('global_variables.json', 'r', encoding='utf-8') as f:
-        configs = json.load(f)
-        return {key: value['value'] for key, value in configs.items()}
-
-config = load_configurations()
+config = get_runtime_context().config
 best_samplers_schedulers = config['BEST_SAMPLERS_SCHEDULERS']
+api_output_folder = config.get('API_OUTPUT_FOLDER', 'api_outputs')
+image_catalog_path = config.get('IMAGE_CATALOG_PATH', 'image_catalog.db')
+
+# Counts come from the image catalog that 2_create_loop_lora.py fills as it saves images (see
+# utilities/image_catalog.py), so sampler and scheduler are what was rendered, not guessed from file
+# names. Images made before the catalog existed: python -m utilities.image_catalog --import-log iteration_log.csv
+# The report reads the catalog only, so it takes indexed queries whatever the number of images. It warns
+# when the folder changed after the catalog was written; --sync then re-reads the output folder first, so
+# moved and deleted images are counted where they are now.
 
 # Generate all possible combos
 known_samplers = ["euler", "lms", "dpmpp_2m", "dpm_adaptive", 
@@ -31,75 +36,46 @@ attempted_combos = {f"{sampler}_{scheduler}" for sampler, scheduler in best_samp
 # Determine excluded combos
 excluded_combos = all_possible_combos - attempted_combos
 
-def extract_combo_from_filename(filename):
-    parts = filename.split('_')
-    sampler = None
-    scheduler = None
-
-    for i in range(len(parts) - 1):
-        potential_sampler = f"{parts[i]}_{parts[i+1]}"
-        if potential_sampler in known_samplers and not sampler:
-            sampler = potential_sampler
-        
-        potential_scheduler = f"{parts[i]}_{parts[i+1]}"
-        if potential_scheduler in known_schedulers and not scheduler:
-            scheduler = potential_scheduler
-
-    combined_string = "_".join(parts)
-    for s in known_samplers:
-        if s in combined_string and not sampler:
-            sampler = s
-    for sch in known_schedulers:
-        if sch in combined_string and not scheduler:
-            scheduler = sch
-
-    return sampler, scheduler
+def catalog_is_stale(catalog_path, output_folder):
+    """True when a folder under output_folder changed (images added, moved or deleted) after the catalog was last written.
+    Only directory times are compared; no image is read or stat'ed."""
+    catalog_mtime = max(os.path.getmtime(path) for path in (catalog_path, f"{catalog_path}-wal") if os.path.exists(path))
+    return any(os.path.getmtime(root) > catalog_mtime for root, _, _ in os.walk(output_folder))
 
 def main():
-    api_output_folder = 'api_outputs/'
+    parser = argparse.ArgumentParser(description="Report which sampler/scheduler pairs the kept images used.")
+    parser.add_argument("--sync", action="store_true", help=f"Re-read where the images in {api_output_folder} are now before counting")
+    args = parser.parse_args()
+
+    if not os.path.exists(image_catalog_path):
+        print(f"Image catalog '{image_catalog_path}' does not exist; run 2_create_loop_lora.py or "
+              f"python -m utilities.image_catalog --import-log iteration_log.csv first.")
+        return
+
     if not os.path.exists(api_output_folder):
         print(f"Folder '{api_output_folder}' does not exist.")
         return
 
+    # Checked before the catalog is opened, which may write to it
+    if not args.sync and catalog_is_stale(image_catalog_path, api_output_folder):
+        print(f"Warning: {api_output_folder} changed after {image_catalog_path} was last written; "
+              f"moved or deleted images may be counted. Run with --sync to sync first.")
+
+    catalog = ImageCatalog(image_catalog_path)
+    unmatched_files = catalog.sync_folder(api_output_folder) if args.sync else []
+
     combos_counter = Counter()
-    samplers_counter = Counter()
-    schedulers_counter = Counter()
     best_combos_counter = Counter()  # Initialize the best_combos_counter
-    directory_counts = Counter()
-    total_files = 0
-    unmatched_files = []
-
-    for root, dirs, files in os.walk(api_output_folder):
-        file_count = 0
-        for filename in files:
-            total_files += 1
-            file_path = os.path.join(root, filename)
-            print(f"Processing file: {file_path}")
-
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                sampler, scheduler = extract_combo_from_filename(filename)
-                if sampler and scheduler:
-                    combo = f"{sampler}_{scheduler}"
-                    combos_counter[combo] += 1
-                    samplers_counter[sampler] += 1
-                    schedulers_counter[scheduler] += 1
-
-                    # Update best_combos_counter if the combo is in best_samplers_schedulers
-                    if combo in attempted_combos:
-                        best_combos_counter[combo] += 1
-                        
-                    print(f" - Full combo found: {combo}")
-                elif sampler:
-                    samplers_counter[sampler] += 1
-                    print(f" - Sampler found: {sampler}")
-                elif scheduler:
-                    schedulers_counter[scheduler] += 1
-                    print(f" - Scheduler found: {scheduler}")
-                else:
-                    unmatched_files.append(filename)
-                    print(" - No valid scheduler/sampler combo found")
-                file_count += 1
-        directory_counts[root] = file_count
+    for (sampler, scheduler), count in catalog.counts("sampler", "scheduler").items():
+        combo = f"{sampler}_{scheduler}"
+        combos_counter[combo] += count
+        # Update best_combos_counter if the combo is in best_samplers_schedulers
+        if combo in attempted_combos:
+            best_combos_counter[combo] += count
+    samplers_counter = Counter({sampler: count for (sampler,), count in catalog.counts("sampler").items()})
+    schedulers_counter = Counter({scheduler: count for (scheduler,), count in catalog.counts("scheduler").items()})
+    directory_counts = Counter({os.path.normpath(os.path.join(api_output_folder, folder)): count for (folder,), count in catalog.counts("folder").items()})
+    total_files = sum(directory_counts.values()) + len(unmatched_files)
 
     total_matched_images = sum(combos_counter.values())
     total_best_matched_images = sum(best_combos_counter.values())  # Calculate total best matched images
@@ -179,7 +155,7 @@ def main():
     print(f"Total files processed: {total_files}")
     print(f"Total matched combos: {total_matched_images}")
 
-    print("\nUnmatched files:")
+    print("\nFiles not in the image catalog:")
     for unmatched_file in unmatched_files:
         print(unmatched_file)
 
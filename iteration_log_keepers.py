@@ -1,110 +1,122 @@
 import os
+import argparse
 import pandas as pd
-
-# Load the CSV file
-csv_file_path = "iteration_log.csv"
-data = pd.read_csv(csv_file_path)
-
-# Get the list of filenames from the CSV, fixing path styles
-csv_filenames = [os.path.basename(path) for path in data['File Path'].tolist()]
-
-# Get the list of files in the api_outputs/ directory
-output_directory = "api_outputs/"
-directory_filenames = os.listdir(output_directory)
-
-# Identify kept and deleted filenames
-kept_filenames = [filename for filename in csv_filenames if filename in directory_filenames]
-deleted_filenames = [filename for filename in csv_filenames if filename not in kept_filenames]
-
-# Count the number of kept files vs. deleted files
-kept_count = len(kept_filenames)
-deleted_count = len(deleted_filenames)
-print(f"Kept: {kept_count}, Deleted: {deleted_count}\n")
-
-# Create kept and deleted dataframes
-kept_data = data[data['File Path'].apply(lambda x: os.path.basename(x)).isin(kept_filenames)]
-deleted_data = data[data['File Path'].apply(lambda x: os.path.basename(x)).isin(deleted_filenames)]
-
-kept_data.to_csv("kept_iterations.csv", index=False)
-print("kept_iterations.csv has been created.\n")
-
-# Helper function for percentage calculation
-def calculate_percentage(kept, deleted):
-    total = kept + deleted
-    return (kept / total) * 100 if total > 0 else 0
-
-# Usage Counts
-def get_combined_lora_counts(data):
-    lora_combined = pd.concat([data['LORA2'], data['LORA3']])
-    return lora_combined.value_counts()
-
-# Calculate and print scheduler usage
-print("Analyzing Kept Files:")
-
-scheduler_counts_kept = kept_data['Scheduler'].value_counts()
-sampler_counts_kept = kept_data['Sampler'].value_counts()
-
-print("\nScheduler Usage (Kept):")
-print(scheduler_counts_kept.sort_values(ascending=False))
-
-print("\nSampler Usage (Kept):")
-print(sampler_counts_kept.sort_values(ascending=False))
-
-lora_counts_kept = get_combined_lora_counts(kept_data)
-print("\nLORA Usage (Kept):")
-print(lora_counts_kept.sort_values(ascending=False))
-
-# Top combinations
-kept_combination_counts = kept_data.groupby(['Scheduler', 'Sampler', 'LORA2', 'LORA3']).size().reset_index(name='Counts')
-top_kept_combinations = kept_combination_counts.sort_values(by='Counts', ascending=False).head(10)
-
-print("\nTop 10 Combinations (Kept):")
-print(top_kept_combinations)
-
-print("\nAnalyzing Deleted Files:")
-
-# Calculate and print scheduler usage
-scheduler_counts_deleted = deleted_data['Scheduler'].value_counts()
-sampler_counts_deleted = deleted_data['Sampler'].value_counts()
-
-print("\nScheduler Usage (Deleted):")
-print(scheduler_counts_deleted.sort_values(ascending=False))
-
-print("\nSampler Usage (Deleted):")
-print(sampler_counts_deleted.sort_values(ascending=False))
-
-lora_counts_deleted = get_combined_lora_counts(deleted_data)
-print("\nLORA Usage (Deleted):")
-print(lora_counts_deleted.sort_values(ascending=False))
-
-# Top combinations
-deleted_combination_counts = deleted_data.groupby(['Scheduler', 'Sampler', 'LORA2', 'LORA3']).size().reset_index(name='Counts')
-top_deleted_combinations = deleted_combination_counts.sort_values(by='Counts', ascending=False).head(10)
-
-print("\nTop 10 Combinations (Deleted):")
-print(top_deleted_combinations)
-
-# Calculate and display usage percentages
-print("\nLORA Usage Percentage Kept vs. Deleted:")
-lora_percentages = pd.DataFrame({
-    'Kept': lora_counts_kept,
-    'Deleted': lora_counts_deleted
-}).fillna(0)
-lora_percentages['Kept %'] = lora_percentages.apply(lambda row: calculate_percentage(row['Kept'], row['Deleted']), axis=1)
-print(lora_percentages.sort_values(by='Kept %', ascending=False))
-
-print("\nScheduler Usage Percentage Kept vs. Deleted:")
-scheduler_percentages = pd.DataFrame({
-    'Kept': scheduler_counts_kept,
-    'Deleted': scheduler_counts_deleted
-}).fillna(0)
-scheduler_percentages['Kept %'] = scheduler_percentages.apply(lambda row: calculate_percentage(row['Kept'], row['Deleted']), axis=1)
-print(scheduler_percentages.sort_values(by='Kept %', ascending=False))
-
-print("\nSampler Usage Percentage Kept vs. Deleted:")
-sampler_percentages = pd.DataFrame({
-    'Kept': sampler_counts_kept,
-    'Deleted': sampler_counts_deleted
-}).fillna(0)
-sampler_percentages['Kept %'] = sampler_percentages.apply(lambda row: calculate_percentage(row['Kept'], row['Deleted']), axis=1)
-print(sampler_percentages.sort_values(by='Kept %', ascending=False))
\ No newline at end of file
+from utilities.logging_utils import ITERATION_LOG_HEADER
+
+# Splits iteration_log.csv into kept images (file still in api_outputs/) and deleted ones, and compares
+# scheduler, sampler and LoRA usage between the two. The log is read in chunks, so it may be larger
+# than RAM: each chunk is matched against a set of the directory's file names, its kept rows are
+# appended to kept_iterations.csv, and only the counts per (scheduler, sampler, LoRA pair, kept) are
+# held in memory. Every report below is summed from those counts.
+# --log may also be the directory of a columnar log (ITERATION_LOG_FORMAT 'parquet'); then only the
+# columns needed are read, plus the rest for the kept rows when kept_iterations.csv is written.
+# Usage (from the repo root): python iteration_log_keepers.py [--log iteration_log.csv] [--output-folder api_outputs/]
+
+COMBO_COLUMNS = ['Scheduler', 'Sampler', 'LORA2', 'LORA3']
+CHUNK_ROWS = 500_000
+
+def directory_filenames(output_directory):
+    """The file names in output_directory, as a set for constant-time lookups."""
+    with os.scandir(output_directory) as entries:
+        return {entry.name for entry in entries if entry.is_file()}
+
+def basenames(paths):
+    """os.path.basename of each path, with Windows and POSIX separators alike."""
+    return paths.str.replace('\\', '/', regex=False).str.rpartition('/')[2]
+
+def iteration_log_chunks(log_path, columns=None, chunk_rows=CHUNK_ROWS):
+    """The log chunk_rows at a time, as text (so kept_iterations.csv repeats the log's values exactly).
+    columns limits the columns read; log_path is iteration_log.csv or a columnar log directory."""
+    if os.path.isdir(log_path):
+        from utilities.columnar_log import read_text_batches  # pyarrow is only loaded for a columnar log
+        for batch in read_text_batches(log_path, columns, chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(log_path, usecols=columns, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+
+def tally_iteration_log(log_path, kept_filenames, kept_csv_path=None, chunk_rows=CHUNK_ROWS):
+    """Image counts per COMBO_COLUMNS and 'Kept' (file name in kept_filenames).
+    With kept_csv_path, the log rows of the kept images are written there as the log is read."""
+    partial_counts = []
+    header = True
+    columns = None if kept_csv_path else COMBO_COLUMNS + ['File Path']
+    for chunk in iteration_log_chunks(log_path, columns, chunk_rows):
+        kept = basenames(chunk['File Path']).isin(kept_filenames)
+        if kept_csv_path:
+            chunk[kept].to_csv(kept_csv_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
+        partial_counts.append(chunk[COMBO_COLUMNS].assign(Kept=kept).value_counts(sort=False))
+
+    if kept_csv_path and header:  # Empty log: still leave a file with just the header
+        pd.DataFrame(columns=ITERATION_LOG_HEADER).to_csv(kept_csv_path, index=False)
+    if not partial_counts:
+        return pd.Series(0, index=pd.MultiIndex.from_arrays([[]] * 5, names=COMBO_COLUMNS + ['Kept']))
+    return pd.concat(partial_counts).groupby(level=COMBO_COLUMNS + ['Kept'], sort=False).sum()
+
+def split_counts(combo_counts, kept):
+    """The per-combo counts of the kept (or deleted) images."""
+    counts = combo_counts[combo_counts.index.get_level_values('Kept') == kept]
+    return counts.droplevel('Kept')
+
+def usage_counts(counts, column):
+    usage = counts.groupby(level=column).sum()
+    return usage[usage.index != ''].sort_values(ascending=False)
+
+def get_combined_lora_counts(counts):
+    lora_combined = pd.concat([usage_counts(counts, 'LORA2'), usage_counts(counts, 'LORA3')])
+    return lora_combined.groupby(level=0).sum().sort_values(ascending=False)
+
+def top_combinations(counts, limit=10):
+    combinations = counts.reset_index(name='Counts')
+    return combinations.sort_values(by=['Counts'] + COMBO_COLUMNS, ascending=[False] + [True] * len(COMBO_COLUMNS)).head(limit)
+
+def usage_percentages(kept_counts, deleted_counts):
+    percentages = pd.DataFrame({'Kept': kept_counts, 'Deleted': deleted_counts}).fillna(0)
+    total = percentages['Kept'] + percentages['Deleted']
+    percentages['Kept %'] = (percentages['Kept'] / total.where(total > 0) * 100).fillna(0)
+    return percentages.sort_values(by='Kept %', ascending=False)
+
+def print_usage(label, counts):
+    print(f"\nScheduler Usage ({label}):")
+    print(usage_counts(counts, 'Scheduler'))
+
+    print(f"\nSampler Usage ({label}):")
+    print(usage_counts(counts, 'Sampler'))
+
+    print(f"\nLORA Usage ({label}):")
+    print(get_combined_lora_counts(counts))
+
+    print(f"\nTop 10 Combinations ({label}):")
+    print(top_combinations(counts))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the settings of kept and deleted images.")
+    parser.add_argument("--log", default="iteration_log.csv")
+    parser.add_argument("--output-folder", default="api_outputs/")
+    parser.add_argument("--kept-csv", default="kept_iterations.csv")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Log rows read at a time")
+    args = parser.parse_args()
+
+    combo_counts = tally_iteration_log(args.log, directory_filenames(args.output_folder), args.kept_csv, args.chunk_rows)
+    kept_counts = split_counts(combo_counts, True)
+    deleted_counts = split_counts(combo_counts, False)
+    print(f"Kept: {kept_counts.sum()}, Deleted: {deleted_counts.sum()}\n")
+    print(f"{args.kept_csv} has been created.\n")
+
+    print("Analyzing Kept Files:")
+    print_usage("Kept", kept_counts)
+
+    print("\nAnalyzing Deleted Files:")
+    print_usage("Deleted", deleted_counts)
+
+    print("\nLORA Usage Percentage Kept vs. Deleted:")
+    print(usage_percentages(get_combined_lora_counts(kept_counts), get_combined_lora_counts(deleted_counts)))
+
+    print("\nScheduler Usage Percentage Kept vs. Deleted:")
+    print(usage_percentages(usage_counts(kept_counts, 'Scheduler'), usage_counts(deleted_counts, 'Scheduler')))
+
+    print("\nSampler Usage Percentage Kept vs. Deleted:")
+    print(usage_percentages(usage_counts(kept_counts, 'Sampler'), usage_counts(deleted_counts, 'Sampler')))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import json
+import queue
+import threading
+import importlib
+from datetime import datetime, timedelta
+from utilities.lora_utils import create_lora_combos_json, update_lora_metadata
+from utilities.ollama_utils import install_and_setup_ollama, stop_ollama_service, unload_ollama_model
+from utilities.comfy_starter import initialize_comfyui, free_comfyui_memory
+from utilities.gpu_arbiter import GpuArbiter, LLM, IMAGES
+from utilities.logging_utils import configure_logging, flush_iteration_log, log, log_error
+from utilities import tracing
+
+# Streaming mode: combos whose prompts are ready (archived or freshly generated) go straight to
+# image generation while Ollama keeps working on the rest, instead of running
+# 1_create_ollama_prompts.py to completion before 2_create_loop_lora.py.
+
+prompts_stage = importlib.import_module("1_create_ollama_prompts")
+config = prompts_stage.config
+
+GPU_ARBITRATION_POLICY = config.get("GPU_ARBITRATION_POLICY", "exclusive")
+STREAM_HANDOFF_SIZE = config.get("STREAM_HANDOFF_SIZE", 4)
+BEST_SAMPLERS_SCHEDULERS = config['BEST_SAMPLERS_SCHEDULERS']
+LOG_FILE = config.get("LOG_FILE", "log.txt")
+LOG_LEVEL = config.get("LOG_LEVEL", "INFO")  # DEBUG also logs every prompt payload
+TRACE_DIRECTORY = config.get("TRACE_DIRECTORY")  # Opt-in Chrome/Perfetto trace of the run (see utilities/tracing.py)
+
+def produce_prompts(lora_combos, new_combos, base_prompt, ready_queue, arbiter):
+    """Generate prompts for new combos, publishing each batch to the image side as soon as it is saved."""
+    held = threading.local()
+
+    def before_batch():
+        arbiter.acquire(LLM)
+        held.value = True
+
+    def after_batch(batch):
+        arbiter.release(LLM)
+        held.value = False
+        ready = [combo for combo in batch if combo.get("time_to_respond") is not None and not combo.get("DUPLICATE_OF")]
+        for combo in ready:
+            ready_queue.put(combo)
+        arbiter.add_ready(len(ready))
+        log(f"[STREAM] {len(ready)} new combos ready for image generation.")
+
+    try:
+        prompts_stage.generate_new_prompts(lora_combos, new_combos, base_prompt, before_batch, after_batch)
+    except Exception as e:
+        log_error(f"Prompt producer failed: {str(e)}")
+    finally:
+        if getattr(held, "value", False):
+            arbiter.release(LLM)
+        arbiter.finish_producer()
+        stop_ollama_service()
+
+def consume_combos(lora_combos, ready_queue, arbiter, producer):
+    """Render every ready combo with each sampler/scheduler pair as it arrives."""
+    images_stage = importlib.import_module("2_create_loop_lora")  # Already imported by main()
+
+    with open(images_stage.WORKFLOW_PATH, 'r', encoding='utf-8') as file:
+        template = images_stage.compile_workflow(json.load(file))
+    available_loras = [f for f in os.listdir(images_stage.LORA_DIRECTORY) if f != images_stage.LORA1 and f.endswith('.safetensors')]
+
+    total_start_time = datetime.now()
+    jobs_done = 0
+    combos_done = 0
+
+    while True:
+        try:
+            lora_combo = ready_queue.get(timeout=1)
+        except queue.Empty:
+            if not producer.is_alive() and ready_queue.empty():
+                break
+            continue
+
+        for sampler, scheduler in BEST_SAMPLERS_SCHEDULERS:
+            arbiter.acquire(IMAGES)
+            try:
+                jobs_done += 1
+                with tracing.span("job", combo=lora_combo['iteration'], pairs=f"{sampler}/{scheduler}"):
+                    images_stage.execute_workflow_loop(
+                        jobs_done, total_start_time, template, ((sampler, scheduler),),
+                        lora_combos, available_loras, lora_combo
+                    )
+            finally:
+                arbiter.release(IMAGES)
+            images_stage.clear_vram()
+
+        arbiter.combo_done()
+        combos_done += 1
+        log(f"[STREAM] Finished combo {lora_combo['iteration']} ({combos_done} done, {ready_queue.qsize()} waiting).")
+
+    return combos_done, jobs_done
+
+def main():
+    start_time = datetime.now()
+    if TRACE_DIRECTORY:
+        tracing.enable(os.path.join(TRACE_DIRECTORY, f"stream_trace_{start_time.strftime('%Y%m%d_%H%M%S')}.json"))
+
+    if not prompts_stage.check_and_move_lora_metadata():
+        return
+    if not prompts_stage.check_and_move_lora_file(config["LORA1_NAME"]):
+        return
+
+    prompts_stage.archive_lora_combos()
+    archived_combos, archived_match_counts = prompts_stage.load_archived_lora_combos(prompts_stage.ARCHIVE_PATH)
+    update_lora_metadata(lora_directory=prompts_stage.LORA_DIRECTORY)
+    create_lora_combos_json()
+
+    lora_combos = prompts_stage.load_lora_combos()
+    new_combos = prompts_stage.match_archived_combos(lora_combos, archived_combos, archived_match_counts)
+    prompts_stage.save_lora_combos(lora_combos)
+
+    log("Initializing ComfyUI...")
+    if not initialize_comfyui():
+        log("Failed to initialize ComfyUI.")
+        return
+
+    # Imported once ComfyUI is up: the import sets up 2_create_loop_lora's ComfyUI clients and iteration log
+    images_stage = importlib.import_module("2_create_loop_lora")
+    # Check the model files once, like 2_create_loop_lora.py; after that the registry watches the folders for changes
+    with tracing.span("check_models"):
+        models_ready = images_stage.model_registry.validate(images_stage.REQUIRED_MODELS)
+    if not models_ready:
+        log("Model files are missing; stopping.")
+        return
+    images_stage.model_registry.watch(images_stage.REQUIRED_MODELS)
+
+    if new_combos:
+        # Not clear_gpu_memory(): it would also kill the ComfyUI server started above
+        install_and_setup_ollama(prompts_stage.MODEL_NAME)
+
+    arbiter = GpuArbiter(GPU_ARBITRATION_POLICY, STREAM_HANDOFF_SIZE, unload_hooks={
+        LLM: lambda: unload_ollama_model(prompts_stage.MODEL_NAME),
+        IMAGES: free_comfyui_memory,
+    })
+
+    ready_queue = queue.Queue()
+    new_iterations = {combo["iteration"] for combo in new_combos}
+    archived_ready = [combo for combo in lora_combos if combo["iteration"] not in new_iterations]
+    # Combos marked by utilities/prompt_dedup.py share a prompt with another combo; render that one only
+    duplicates = sum(1 for combo in archived_ready if combo.get("DUPLICATE_OF"))
+    if duplicates:
+        archived_ready = [combo for combo in archived_ready if not combo.get("DUPLICATE_OF")]
+        log(f"Skipping {duplicates} combos marked as near-duplicate prompts.")
+    for combo in archived_ready:
+        ready_queue.put(combo)
+    arbiter.add_ready(len(archived_ready))
+    log(f"[STREAM] {len(archived_ready)} archived combos ready, {len(new_combos)} to generate "
+        f"(policy: {GPU_ARBITRATION_POLICY}, handoff size: {STREAM_HANDOFF_SIZE}).")
+
+    producer = threading.Thread(
+        target=produce_prompts,
+        args=(lora_combos, new_combos, config["OLLAMA_BASE_PROMPT"], ready_queue, arbiter),
+        daemon=True
+    )
+    producer.start()
+
+    try:
+        combos_done, jobs_done = consume_combos(lora_combos, ready_queue, arbiter, producer)
+    finally:
+        producer.join()
+        flush_iteration_log()
+        trace_path = tracing.write()
+        if trace_path:
+            log(f"[TRACE] Wrote {trace_path}.")
+
+    execution_time = datetime.now() - start_time
+    log("\n====SUMMARY====")
+    log(f"Combos rendered: {combos_done}, image jobs: {jobs_done}, GPU handoffs: {arbiter.handoffs}")
+    log(f"Time to execute: {timedelta(seconds=int(execution_time.total_seconds()))}")
+
+if __name__ == "__main__":
+    configure_logging(LOG_FILE, LOG_LEVEL, clear=True)
+    main()
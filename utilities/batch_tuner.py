@@ -0,0 +1,124 @@
+import json
+import os
+import time
+import random
+from datetime import datetime
+from utilities.comfy_dispatcher import execution_seconds
+from utilities.logging_utils import log, log_warning
+
+# Finds the REPEAT_LATENT_BATCH_AMOUNT with the best images/sec for each (sampler, scheduler).
+# Each candidate batch size is rendered once and timed from ComfyUI's own execution_start /
+# execution_success timestamps, so queueing and polling delays do not count. Sizes are tried in
+# increasing order and the search stops when throughput drops (VRAM thrashing under --lowvram) or
+# the prompt fails (out of memory). Results are kept in batch_tuning.json. Given ComfyUI's output
+# folder, the probe images are deleted as soon as each probe is timed.
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8]
+DROP_TOLERANCE = 0.9  # Stop once a size gives less than 90% of the best images/sec so far
+POLL_INTERVAL = 1.0
+PROBE_TIMEOUT = 1800
+
+def tuning_key(sampler, scheduler):
+    return f"{sampler}|{scheduler}"
+
+def load_batch_tuning(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+def save_batch_tuning(tuning, path):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(tuning, file, indent=2)
+    os.replace(temp_path, path)
+
+def tuned_batch_size(tuning, sampler, scheduler, default):
+    """The tuned batch size for a sampler/scheduler pair, or default when it has not been tuned."""
+    return tuning.get(tuning_key(sampler, scheduler), {}).get('batch_size', default)
+
+def probe_prefix(sampler, scheduler, batch_size):
+    return f"batch_tuning_{sampler}_{scheduler}_{batch_size}"
+
+def remove_probe_images(output_folder, filename_prefix):
+    """Delete the images ComfyUI saved for a probe (<prefix>_00001_.png, ...)."""
+    for name in os.listdir(output_folder):
+        if name.startswith(f"{filename_prefix}_"):
+            try:
+                os.remove(os.path.join(output_folder, name))
+            except OSError as e:
+                log_warning(f"[AUTOTUNE] Could not remove probe image {name}: {e}")
+
+def run_probe(client, prompt_json, timeout=PROBE_TIMEOUT):
+    """Queue one prompt and wait for it. Returns its execution seconds, or None if it failed."""
+    record = {"submitted_at": time.time()}
+    prompt_id = client.queue_prompt(prompt_json)["prompt_id"]
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        entry = client.history(prompt_id).get(prompt_id)
+        if entry:
+            status = entry.get("status", {})
+            if not status.get("completed"):
+                return None
+            record["finished_at"] = time.time()
+            return execution_seconds(status, record)
+        time.sleep(POLL_INTERVAL)
+    log_warning(f"[AUTOTUNE] Prompt {prompt_id} did not finish within {timeout}s.")
+    return None
+
+def tune_pair(client, render, sampler, scheduler, batch_sizes, output_folder=None):
+    """Measure images/sec for each batch size; render(batch_size) returns the prompt JSON."""
+    measurements = {}
+    best_size, best_rate = None, 0.0
+    for batch_size in sorted(batch_sizes):
+        seconds = run_probe(client, render(batch_size))
+        if output_folder:
+            remove_probe_images(output_folder, probe_prefix(sampler, scheduler, batch_size))
+        if not seconds:
+            log(f"[AUTOTUNE] {sampler}/{scheduler}: batch {batch_size} failed; stopping here.")
+            break
+        rate = batch_size / seconds
+        measurements[str(batch_size)] = round(rate, 4)
+        log(f"[AUTOTUNE] {sampler}/{scheduler}: batch {batch_size} -> {rate:.3f} images/sec ({seconds:.1f}s)")
+        if rate > best_rate:
+            best_size, best_rate = batch_size, rate
+        elif rate < best_rate * DROP_TOLERANCE:
+            break
+    if best_size is None:
+        return None
+    return {
+        "batch_size": best_size,
+        "images_per_second": round(best_rate, 4),
+        "measurements": measurements,
+        "tuned_at": datetime.now().isoformat(timespec='seconds'),
+    }
+
+def autotune(client, template, base_values, sampler_pairs, path, batch_sizes=DEFAULT_BATCH_SIZES, retune=False, output_folder=None):
+    """Tune every (sampler, scheduler) pair that has no entry in path yet; returns the tuning table.
+
+    base_values are the template values shared by every probe (prompt, LoRAs, ...). Each probe
+    gets its own random seed so ComfyUI cannot answer it from its cache, not even on a retune.
+    With output_folder (ComfyUI's output folder), the probe images are removed from it.
+    """
+    tuning = load_batch_tuning(path)
+    pending = [(sampler, scheduler) for sampler, scheduler in sampler_pairs if retune or tuning_key(sampler, scheduler) not in tuning]
+    if not pending:
+        return tuning
+
+    log(f"[AUTOTUNE] Tuning batch sizes {sorted(batch_sizes)} for {len(pending)} sampler/scheduler pairs...")
+    # The first prompt also loads the models; keep that time out of the measurements
+    run_probe(client, template.render(**base_values, seed=random.randrange(2**32), sampler=pending[0][0], scheduler=pending[0][1],
+                                      batch_amount=1, filename_prefix="batch_tuning_warmup"))
+    if output_folder:
+        remove_probe_images(output_folder, "batch_tuning_warmup")
+    for sampler, scheduler in pending:
+        def render(batch_size):
+            return template.render(**base_values, seed=random.randrange(2**32), sampler=sampler, scheduler=scheduler, batch_amount=batch_size,
+                                   filename_prefix=probe_prefix(sampler, scheduler, batch_size))
+
+        result = tune_pair(client, render, sampler, scheduler, batch_sizes, output_folder)
+        if result:
+            tuning[tuning_key(sampler, scheduler)] = result
+            save_batch_tuning(tuning, path)
+            log(f"[AUTOTUNE] {sampler}/{scheduler}: using batch {result['batch_size']} ({result['images_per_second']:.3f} images/sec)")
+    return tuning
@@ -0,0 +1,85 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from utilities.comfy_dispatcher import ComfyDispatcher
+from utilities.fake_comfyui_server import start_fake_comfyui_server
+
+# Runs the multi-server dispatcher against several utilities/fake_comfyui_server.py instances and
+# compares the wall time with a single server. Checks that every image reaches the central folder.
+# Usage (from the repo root): python -m utilities.benchmark_dispatcher --servers 3 --jobs 24
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKFLOW_PATH = os.path.join(REPO_ROOT, "workflow_json", "superhero_creator.json")
+SAMPLERS = [("euler", "simple"), ("euler", "beta"), ("dpmpp_2m", "sgm_uniform"), ("heun", "normal")]
+LORAS = [f"style_{index:02d}.safetensors" for index in range(6)]
+
+def build_jobs(count):
+    rng = random.Random(7)
+    return [
+        {"number": number, "sampler": SAMPLERS[number % len(SAMPLERS)], "loras": rng.sample(LORAS, 2)}
+        for number in range(1, count + 1)
+    ]
+
+def build_workflow(template, job):
+    workflow_json = copy.deepcopy(template)
+    workflow_json["16"]["inputs"]["sampler_name"], workflow_json["17"]["inputs"]["scheduler"] = job["sampler"]
+    workflow_json["42"]["inputs"]["lora_name"], workflow_json["43"]["inputs"]["lora_name"] = job["loras"]
+    workflow_json["25"]["inputs"]["noise_seed"] = job["number"]
+    workflow_json["41"]["inputs"]["amount"] = 2
+    workflow_json["9"]["inputs"]["filename_prefix"] = f"bench_{job['number']:05d}"
+    return workflow_json
+
+def run(server_count, jobs, template, time_scale, max_in_flight):
+    servers = [start_fake_comfyui_server(0, time_scale, name=f"fake-gpu-{index}") for index in range(server_count)]
+    output_folder = tempfile.mkdtemp(prefix="dispatch_bench_")
+    dispatcher = ComfyDispatcher(
+        [f"http://127.0.0.1:{server.server_port}" for server in servers], output_folder,
+        max_in_flight=max_in_flight, poll_interval=0.05
+    )
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        records = dispatcher.run(jobs, lambda job: build_workflow(template, job))
+    wall_time = time.perf_counter() - start
+    for server in servers:
+        server.shutdown()
+    return wall_time, records, output_folder
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ComfyUI dispatcher against stand-in servers.")
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--time-scale", type=float, default=0.005)
+    parser.add_argument("--max-in-flight", type=int, default=2)
+    args = parser.parse_args()
+
+    with open(WORKFLOW_PATH, "r", encoding="utf-8") as file:
+        template = json.load(file)
+    os.chdir(tempfile.mkdtemp(prefix="dispatch_logs_"))  # Keep the dispatcher's log file out of the repo
+
+    results = {}
+    for server_count in sorted({1, args.servers}):
+        wall_time, records, output_folder = run(server_count, build_jobs(args.jobs), template, args.time_scale, args.max_in_flight)
+        images = len(os.listdir(output_folder))
+        expected = 2 * args.jobs
+        per_server = Counter(record["server"] for record in records)
+        results[server_count] = wall_time
+        print(f"{server_count} server(s): {wall_time:.2f}s wall, {images}/{expected} images gathered, "
+              f"jobs per server: {sorted(per_server.values(), reverse=True)}")
+        if images != expected or any(record["status"] != "success" for record in records):
+            print("FAIL: not every job produced its images.")
+            sys.exit(1)
+
+    if args.servers > 1:
+        print(f"Speed-up with {args.servers} servers: {results[1] / results[args.servers]:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Measures how long each entry script takes to import (python -X importtime) and fails when one
+# exceeds its budget or pulls in a heavy dependency that should only load on the code path using it.
+# Run from the repo root with a valid global_variables.json (or GLOBAL_VARIABLES_PATH):
+#   python -m utilities.benchmark_imports --budget-ms 400
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = [
+    "1_create_ollama_prompts",
+    "2_create_loop_lora",
+    "stream_prompts_and_images",
+    "superhero_creator",
+    "andy_linkedin",
+    "count_faves",
+    "utilities.remove_metadata",
+]
+FORBIDDEN_MODULES = ("torch", "pandas", "PIL", "hachoir", "numpy")
+DEFAULT_BUDGET_MS = 500
+DEFAULT_REPEAT = 3
+
+def measure_import(module_name):
+    """Import module_name in a fresh interpreter. Returns (cumulative ms, {module: self ms}) or raises."""
+    code = f"import importlib; importlib.import_module({module_name!r})"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.getcwd(), env={**os.environ, "PYTHONPATH": REPO_ROOT},
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    total_us = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # Header line
+        modules[name.strip()] = int(self_us) / 1000
+        if not name.startswith("  "):  # Top-level import (nested ones are indented)
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+def main():
+    parser = argparse.ArgumentParser(description="Guard the import time of the entry scripts.")
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per module; the fastest counts")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per module")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'Entry point':<30} {'Import (ms)':>12}  Slowest imports")
+    for module_name in args.modules:
+        try:
+            runs = [measure_import(module_name) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            print(f"{module_name:<30} {'error':>12}  {e}")
+            failures.append(f"{module_name}: {e}")
+            continue
+
+        total_ms, modules = min(runs, key=lambda run: run[0])
+        slowest = sorted(modules.items(), key=lambda item: -item[1])[:args.top]
+        print(f"{module_name:<30} {total_ms:>12.1f}  " + ", ".join(f"{name} {ms:.1f}" for name, ms in slowest))
+
+        if total_ms > args.budget_ms:
+            failures.append(f"{module_name}: {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        heavy = sorted({name.split(".")[0] for name in modules} & set(FORBIDDEN_MODULES))
+        if heavy:
+            failures.append(f"{module_name}: imports {', '.join(heavy)} at startup")
+
+    if failures:
+        print("\nFAIL:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll entry points are within budget.")
+
+if __name__ == "__main__":
+    main()
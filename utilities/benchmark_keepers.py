@@ -0,0 +1,93 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from iteration_log_keepers import tally_iteration_log
+from utilities.logging_utils import ITERATION_LOG_HEADER
+
+# Times iteration_log_keepers.py on synthetic iteration logs of growing size (by default up to 10M
+# rows), with a share of the images still "in the output folder". The old list-based matching is
+# timed as well on the sizes up to --legacy-max-rows; it grows with rows times kept files.
+# Usage (from the repo root): python -m utilities.benchmark_keepers --rows 100000 1000000 10000000
+
+SAMPLERS = ["euler", "euler_ancestral", "heun", "dpmpp_2m", "dpmpp_sde", "uni_pc", "lms", "ddim"]
+SCHEDULERS = ["simple", "normal", "karras", "beta", "sgm_uniform"]
+LORAS = [f"style_{index:03d}.safetensors" for index in range(40)]
+WRITE_ROWS = 1_000_000
+
+def write_log(path, rows, seed=0):
+    """A synthetic iteration_log.csv with rows images; returns the file name of every image."""
+    rng = np.random.default_rng(seed)
+    filenames = []
+    for start in range(0, rows, WRITE_ROWS):
+        count = min(WRITE_ROWS, rows - start)
+        names = [f"{index:09d}_ComfyUI.png" for index in range(start, start + count)]
+        filenames.extend(names)
+        chunk = pd.DataFrame({
+            "Iteration Number": rng.integers(1, 100, count),
+            "Start Time": "2026-10-19 01:00:00",
+            "End Time": "2026-10-19 01:00:30",
+            "Inference Steps": 30,
+            "Latent Batch Amount": 1,
+            "Scheduler": rng.choice(SCHEDULERS, count),
+            "Sampler": rng.choice(SAMPLERS, count),
+            "LORA2": rng.choice(LORAS, count),
+            "LORA3": rng.choice(LORAS, count),
+            "File Path": ["api_outputs\\" + name if index % 2 else "api_outputs/" + name for index, name in enumerate(names)],
+            "Time to Complete": "0:00:30",
+            "Prompt Text": "a lighthouse at dusk, 35mm, soft rim light",
+            "GPU Seconds Saved": "",
+        }, columns=ITERATION_LOG_HEADER)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return filenames
+
+def legacy_match(csv_file_path, directory_filenames):
+    """The matching iteration_log_keepers.py did before: list membership tests."""
+    data = pd.read_csv(csv_file_path)
+    csv_filenames = [os.path.basename(path.replace('\\', '/')) for path in data['File Path'].tolist()]
+    directory_filenames = list(directory_filenames)
+    kept_filenames = [filename for filename in csv_filenames if filename in directory_filenames]
+    deleted_filenames = [filename for filename in csv_filenames if filename not in kept_filenames]
+    return len(kept_filenames), len(deleted_filenames)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the keeper analysis on synthetic iteration logs.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--kept-fraction", type=float, default=0.2, help="Share of images still in the folder")
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    parser.add_argument("--legacy-max-rows", type=int, default=20_000, help="Largest log to time the old matching on")
+    args = parser.parse_args()
+
+    step = max(1, round(1 / args.kept_fraction))
+    print(f"{'Rows':>12} {'CSV MB':>8} {'Analysis s':>11} {'Rows/s':>12} {'Kept':>10} {'Old matching s':>15}")
+    with tempfile.TemporaryDirectory() as workspace:
+        log_path = os.path.join(workspace, "iteration_log.csv")
+        kept_csv_path = os.path.join(workspace, "kept_iterations.csv")
+        for rows in args.rows:
+            filenames = write_log(log_path, rows)
+            kept_filenames = set(filenames[::step])
+            del filenames
+
+            started = time.perf_counter()
+            combo_counts = tally_iteration_log(log_path, kept_filenames, kept_csv_path, args.chunk_rows)
+            seconds = time.perf_counter() - started
+            kept = int(combo_counts[combo_counts.index.get_level_values('Kept')].sum())
+            if kept != len(kept_filenames):
+                raise RuntimeError(f"{kept} rows matched, expected {len(kept_filenames)}")
+
+            legacy = "skipped"
+            if rows <= args.legacy_max_rows:
+                started = time.perf_counter()
+                legacy_kept, _ = legacy_match(log_path, kept_filenames)
+                legacy = f"{time.perf_counter() - started:.2f}"
+                if legacy_kept != kept:
+                    raise RuntimeError(f"Old matching kept {legacy_kept} rows, the new one {kept}")
+
+            size_mb = os.path.getsize(log_path) / 2**20
+            print(f"{rows:>12,} {size_mb:>8.0f} {seconds:>11.2f} {rows / seconds:>12,.0f} {kept:>10,} {legacy:>15}")
+
+if __name__ == "__main__":
+    main()
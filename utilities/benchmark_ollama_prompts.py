@@ -0,0 +1,154 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from utilities.fake_ollama_server import start_fake_ollama_server
+
+# Runs the prompt-generation phase of 1_create_ollama_prompts.py against utilities/fake_ollama_server.py
+# and reports how much wall time is spent in the client (archive lookup, cleaning, JSON saves) versus
+# waiting on the model. Usage (from the repo root): python -m utilities.benchmark_ollama_prompts --loras 30 --batch-size 4
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_PROMPT = (
+    "You are an expert prompt writer for a text-to-image model. Write a single vivid, concrete and "
+    "photographic prompt of at most sixty words. Describe subject, setting, lighting, lens and mood. "
+    "Do not explain yourself, do not use lists and do not mention the words LoRA or enhancement."
+)
+
+def build_workspace(workspace, lora_count, batch_size):
+    """Create LoRA files, metadata, config and an archive of already-answered combos."""
+    lora_dir = os.path.join(workspace, "loras")
+    archive_dir = os.path.join(workspace, "archive")
+    os.makedirs(lora_dir)
+    os.makedirs(archive_dir)
+
+    metadata = {}
+    for index in range(lora_count):
+        name = f"style_{index:03d}.safetensors"
+        open(os.path.join(lora_dir, name), "w").close()
+        metadata[name] = {
+            "trigger_word": f"style{index}",
+            "description": f"style number {index} with its own palette, texture and lighting mood",
+            "url": ""
+        }
+    with open(os.path.join(lora_dir, "lora_metadata.json"), "w", encoding="utf-8") as file:
+        json.dump(metadata, file, indent=4)
+
+    config = {
+        "MODEL_NAME": "fake-llm",
+        "LORA_COMBOS_PATH": os.path.join(workspace, "lora_combos.json"),
+        "ARCHIVE_PATH": archive_dir,
+        "LORA_DIRECTORY": lora_dir,
+        "LORA_METADATA_FILENAME": "lora_metadata.json",
+        "LORA1_NAME": "style_000.safetensors",
+        "OLLAMA_BASE_PROMPT": BASE_PROMPT,
+        "PROMPT_TEXT": "(photorealistic:1.8) superhero portrait",
+        "OLLAMA_BATCH_SIZE": batch_size,
+        "LOG_FILE": os.path.join(workspace, "log.txt"),
+    }
+    config_path = os.path.join(workspace, "global_variables.json")
+    with open(config_path, "w", encoding="utf-8") as file:
+        json.dump({key: {"value": value} for key, value in config.items()}, file, indent=4)
+    return config_path, archive_dir
+
+def archive_answered_combos(prompts_stage, archive_dir, archived_fraction):
+    """Write an archive file that already answers the first archived_fraction of the combos."""
+    combos = prompts_stage.load_lora_combos()
+    answered = combos[:int(len(combos) * archived_fraction)]
+    for combo in answered:
+        combo["PROMPT_TEXT"] = f"archived prompt for iteration {combo['iteration']}"
+        combo["time_to_respond"] = 1.0
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    with open(os.path.join(archive_dir, f"lora_combos_{stamp}.json"), "w", encoding="utf-8") as file:
+        json.dump(answered, file, indent=2)
+    return len(combos), len(answered)
+
+def instrument(module, names, timings):
+    """Wrap module-level functions so every call adds to timings[name]."""
+    def wrap(name, original):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timings[name][0] += 1
+                timings[name][1] += time.perf_counter() - start
+        return timed
+
+    for name in names:
+        setattr(module, name, wrap(name, getattr(module, name)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Ollama prompt phase against a stand-in server.")
+    parser.add_argument("--loras", type=int, default=30, help="LoRA files to generate; combos = (loras - 1 choose 2)")
+    parser.add_argument("--archived-fraction", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=1e6)
+    parser.add_argument("--response-tokens-per-sec", type=float, default=1e6)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--max-overhead-ms", type=float, default=None,
+                        help="Exit with status 1 if client overhead per new combo exceeds this")
+    args = parser.parse_args()
+
+    server = start_fake_ollama_server(
+        0, args.first_token_latency, args.prompt_tokens_per_sec,
+        args.response_tokens_per_sec, args.response_tokens
+    )
+    workspace = tempfile.mkdtemp(prefix="ollama_bench_")
+    config_path, archive_dir = build_workspace(workspace, args.loras, args.batch_size)
+
+    os.environ["GLOBAL_VARIABLES_PATH"] = config_path
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    os.chdir(workspace)
+    sys.path.insert(0, REPO_ROOT)
+
+    timings = defaultdict(lambda: [0, 0.0])
+    with contextlib.redirect_stdout(io.StringIO()):
+        prompts_stage = importlib.import_module("1_create_ollama_prompts")
+        prompts_stage.create_lora_combos_json()
+        total_combos, archived_count = archive_answered_combos(prompts_stage, archive_dir, args.archived_fraction)
+        prompts_stage.create_lora_combos_json()
+
+        instrument(prompts_stage, [
+            "load_archived_lora_combos", "match_archived_combos", "clean_response", "cleanse_prompt",
+            "save_lora_combos", "get_story_response_from_model", "get_structured_response_from_model",
+            "prime_model_context"
+        ], timings)
+
+        start = time.perf_counter()
+        archived_combos, archived_match_counts = prompts_stage.load_archived_lora_combos(prompts_stage.ARCHIVE_PATH)
+        lora_combos = prompts_stage.load_lora_combos()
+        new_combos = prompts_stage.match_archived_combos(lora_combos, archived_combos, archived_match_counts)
+        prompts_stage.generate_new_prompts(lora_combos, new_combos, BASE_PROMPT)
+        wall_time = time.perf_counter() - start
+
+    server.shutdown()
+
+    model_calls = ("get_story_response_from_model", "get_structured_response_from_model", "prime_model_context")
+    model_time = sum(timings[name][1] for name in model_calls)
+    overhead = wall_time - model_time
+    new_count = max(len(new_combos), 1)
+
+    print(f"Combos: {total_combos} total, {archived_count} archived, {len(new_combos)} new (batch size {args.batch_size})")
+    print(f"Wall time: {wall_time:.3f}s, waiting on model: {model_time:.3f}s, client overhead: {overhead:.3f}s")
+    print(f"Client overhead per new combo: {overhead / new_count * 1000:.2f} ms")
+    print(f"Model requests: {server.request_count}, prompt tokens per new combo: {server.prompt_tokens / new_count:.0f}")
+    print("\nStage                                   Calls    Total (s)   Per call (ms)")
+    for name, (calls, total) in sorted(timings.items(), key=lambda item: -item[1][1]):
+        print(f"{name:<38} {calls:>6} {total:>12.4f} {total / calls * 1000 if calls else 0:>15.3f}")
+
+    if args.max_overhead_ms is not None and overhead / new_count * 1000 > args.max_overhead_ms:
+        print(f"\nFAIL: client overhead exceeds {args.max_overhead_ms} ms per combo.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from datetime import datetime
 import shutil
 import re
 from utilities.remove_metadata import remove_metadata_in_place, show_metadata, has_metadata
+from utilities.comfy_client import ComfyClient, ComfyRequestError
 
 # -------------------------
 # GLOBAL VARIABLES SECTION
@@ -15,7 +16,9 @@ from utilities.remove_metadata import remove_metadata_in_place, show_metadata, h
 WORKFLOW_PATH = 'test_wf.json'
 OUTPUT_FOLDER = 'ComfyUI\\output'
 SERVER_ADDRESS = 'http://127.0.0.1:8188'
+comfy_client = ComfyClient(SERVER_ADDRESS)
 LOG_FILE = 'comfyui_test_log.txt'
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # DEBUG also logs every prompt payload
 API_OUTPUT_FOLDER = 'api_outputs'
 CHECK_INTERVAL = 10
 MAX_WAIT_TIME = 1200
@@ -73,6 +76,11 @@ def log(message):
         f.write(f"{message}\n")
     print(message)
 
+def log_debug(message):
+    """ Log a message only when LOG_LEVEL is DEBUG (payload dumps and the like). """
+    if LOG_LEVEL.upper() == 'DEBUG':
+        log(message)
+
 def start_comfyui():
     """ Start the ComfyUI server in a new terminal window. """
     subprocess.Popen(START_SCRIPT, shell=True)
@@ -87,35 +95,31 @@ def is_comfyui_ready():
     for attempt in range(max_attempts):
         try:
             log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: Checking if ComfyUI is ready at {url}...")
-            response = requests.get(url)
-            if response.status_code == 200:
-                log(f"ComfyUI is ready after {attempt + 1} attempts.")
-                return True
-            log(f"Status code received: {response.status_code}, Response: {response.text}")
-        except requests.exceptions.ConnectionError as e:
+            comfy_client.request("GET", "/prompt")
+            log(f"ComfyUI is ready after {attempt + 1} attempts.")
+            return True
+        except ComfyRequestError as e:
+            log(f"Status code received: {e.status_code}, Response: {e.body}")
+        except requests.exceptions.RequestException as e:
             remaining_attempts = max_attempts - attempt - 1
             log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: ComfyUI not ready yet. {remaining_attempts} attempts left. Retrying in {attempt_delay} seconds...")
-            log(f"ConnectionError: {e}")
-            time.sleep(attempt_delay)
+            log(f"{type(e).__name__}: {e}")
+        time.sleep(attempt_delay)
     
     log("ComfyUI is not ready.")
     return False
 
 def queue_prompt(workflow_json):
     """ Queue a workflow prompt in the ComfyUI server. """
-    url = f"{SERVER_ADDRESS}/prompt"
-    headers = {'Content-Type': 'application/json'}
-    data = {'prompt': workflow_json}
-    
-    log(f"Queueing prompt to {url} with data: {json.dumps(data, indent=4)}")
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    
-    if response.status_code == 200:
-        log("Prompt queued successfully.")
-        return response.json()
-    else:
-        log(f"Error {response.status_code}: {response.text}")
+    log(f"Queueing prompt to {SERVER_ADDRESS}/prompt")
+    log_debug(f"Prompt payload: {json.dumps(workflow_json)}")
+    try:
+        response = comfy_client.queue_prompt(workflow_json)
+    except ComfyRequestError as e:
+        log(f"Error {e.status_code}: {e.body}")
         return None
+    log("Prompt queued successfully.")
+    return response
 
 def wait_for_image(output_path, wait_time, check_interval, prefix):
     """ Wait for an image file to appear in the output directory. """
@@ -3,6 +3,7 @@ import json
 from collections import Counter
 from datetime import datetime
 import os
+from utilities.comfy_client import ComfyClient
 
 # -------------------------
 # GLOBAL VARIABLES SECTION
@@ -13,6 +14,7 @@ LOG_DIRECTORY = 'logs'
 os.makedirs(LOG_DIRECTORY, exist_ok=True)
 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 LOG_FILE = os.path.join(LOG_DIRECTORY, f'check_queue_log_{timestamp}.txt')
+comfy_client = ComfyClient(SERVER_ADDRESS)
 
 # -------------------------
 # HELPER FUNCTIONS SECTION
@@ -26,38 +28,24 @@ def log(message):
 
 def get_queue_status():
     """ Fetch all prompt statuses from ComfyUI """
-    url = f"{SERVER_ADDRESS}/history"
-    
     try:
-        log(f"Fetching queue status from {url}...")
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            log("Queue status fetched successfully.")
-            return response.json()
-        else:
-            log(f"Error {response.status_code}: {response.text}")
-            return None
-    except requests.exceptions.ConnectionError as e:
-        log(f"ConnectionError: {e}")
+        log(f"Fetching queue status from {SERVER_ADDRESS}/history...")
+        history = comfy_client.history()
+        log("Queue status fetched successfully.")
+        return history
+    except requests.exceptions.RequestException as e:
+        log(f"Error: {e}")
         return None
 
 def get_prompt_status(prompt_id):
     """ Fetches the status for a given prompt ID from ComfyUI """
-    url = f"{SERVER_ADDRESS}/history/{prompt_id}"
-    
     try:
-        log(f"Fetching status for prompt ID {prompt_id} from {url}...")
-        response = requests.get(url)
-        
-        if response.status_code == 200:
-            log("Status fetched successfully.")
-            return response.json()
-        else:
-            log(f"Error {response.status_code}: {response.text}")
-            return None
-    except requests.exceptions.ConnectionError as e:
-        log(f"ConnectionError: {e}")
+        log(f"Fetching status for prompt ID {prompt_id} from {SERVER_ADDRESS}/history/{prompt_id}...")
+        status = comfy_client.history(prompt_id)
+        log("Status fetched successfully.")
+        return status
+    except requests.exceptions.RequestException as e:
+        log(f"Error: {e}")
         return None
 
 # -------------------------
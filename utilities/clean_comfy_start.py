@@ -1,18 +1,25 @@
 import os
+import sys
 import subprocess
-import requests
 import time
-from datetime import datetime
-import psutil
+import platform
+
+# Usage: python utilities/clean_comfy_start.py, or python -m utilities.clean_comfy_start from the repo root.
+if not __package__:  # Run as a plain script: put the repo root on the path for the utilities imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utilities.comfy_starter import is_comfyui_ready  # Probes with backoff via probe_comfyui and wait_for_comfyui_ready
+from utilities.port_utils import is_port_in_use, launch_process, find_port_owner, terminate_process, remove_pidfile
 
 # Configurable constants
 SERVER_ADDRESS = 'http://127.0.0.1:8188'
 COMFYUI_DIR = r'C:\kumori\dev\ComfyUI_training\ComfyUI'
 COMFYUI_MAIN_SCRIPT = 'main.py'
 COMFY_ENV_DIR = os.path.join(COMFYUI_DIR, "comfy_env")
-START_SCRIPT = f'start cmd.exe /k "cd /d {COMFYUI_DIR} && call {COMFY_ENV_DIR}\\Scripts\\activate && python {COMFYUI_MAIN_SCRIPT} --lowvram --listen 0.0.0.0"'
-MAX_ATTEMPTS = 40
-ATTEMPT_DELAY = 15
+COMFY_PYTHON = os.path.join(COMFY_ENV_DIR, "Scripts", "python.exe") if platform.system() == "Windows" else os.path.join(COMFY_ENV_DIR, "bin", "python")
+COMFYUI_COMMAND = [COMFY_PYTHON, COMFYUI_MAIN_SCRIPT, "--lowvram", "--listen", "0.0.0.0"]
+COMFYUI_PORT = 8188
+PIDFILE = 'comfyui.pid'  # Written by start_comfyui so the server can be found without scanning every socket
 
 def log(message):
     """Log a message both to the console and to a file."""
@@ -31,55 +38,27 @@ def run_command(command):
 
 def start_comfyui():
     """Start the ComfyUI server in a new terminal window."""
-    subprocess.Popen(START_SCRIPT, shell=True)
-    log("Started ComfyUI server in a new terminal window.")
-
-def is_comfyui_ready():
-    """Check if the ComfyUI server is ready to receive requests."""
-    url = f"{SERVER_ADDRESS}/prompt"
-    for attempt in range(MAX_ATTEMPTS):
-        try:
-            log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: Checking if ComfyUI is ready at {url}...")
-            response = requests.get(url)
-            if response.status_code == 200:
-                log(f"ComfyUI is ready after {attempt + 1} attempts.")
-                return True
-            log(f"Status code received: {response.status_code}, Response: {response.text}")
-        except requests.exceptions.ConnectionError as e:
-            remaining_attempts = MAX_ATTEMPTS - attempt - 1
-            log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: ComfyUI not ready yet. {remaining_attempts} attempts left. Retrying in {ATTEMPT_DELAY} seconds...")
-            log(f"ConnectionError: {e}")
-            time.sleep(ATTEMPT_DELAY)
-    log("ComfyUI is not ready.")
-    return False
-
-def is_port_in_use(port):
-    """Check if a given port is in use by any process."""
-    for conn in psutil.net_connections():
-        if conn.laddr.port == port:
-            return True
-    return False
+    process = launch_process(COMFYUI_COMMAND, PIDFILE, cwd=COMFYUI_DIR, new_console=True)
+    log(f"Started ComfyUI server in a new terminal window (PID: {process.pid}).")
 
 def kill_process_using_port(port):
     """Kill the process currently using the given port."""
-    for conn in psutil.net_connections():
-        if conn.laddr.port == port:
-            process = psutil.Process(conn.pid)
-            log(f"Killing process {process.name()} (PID: {conn.pid}) using port {port}.")
-            process.terminate()
-            process.wait()
-            break
+    pid = find_port_owner(port, PIDFILE, COMFYUI_MAIN_SCRIPT)
+    if pid:
+        log(f"Killing process (PID: {pid}) using port {port}.")
+        terminate_process(pid)
+        remove_pidfile(PIDFILE)
 
 def initialize_comfyui():
     """Ensure that ComfyUI is running, starting it if necessary."""
-    if is_port_in_use(8188):
+    if is_port_in_use(COMFYUI_PORT):
         log("ComfyUI port is in use. Checking if ComfyUI is ready...")
         if is_comfyui_ready():
             log("ComfyUI is already running and ready.")
             return True
         else:
             log("ComfyUI is not responding correctly. Restarting ComfyUI.")
-            kill_process_using_port(8188)
+            kill_process_using_port(COMFYUI_PORT)
             time.sleep(5)
             start_comfyui()
             if not is_comfyui_ready():
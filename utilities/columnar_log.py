@@ -0,0 +1,240 @@
+import os
+import re
+import csv
+import atexit
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa  # Optional; only needed with ITERATION_LOG_FORMAT 'parquet'
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = ds = pq = None
+
+# A columnar alternative to iteration_log.csv (ITERATION_LOG_FORMAT 'parquet'). Rows are buffered and
+# written BUFFER_ROWS at a time as Parquet part files under <directory>/run_date=YYYY-MM-DD/, a
+# partition per day a run started. Sampler, scheduler, LoRAs and the prompt are dictionary encoded,
+# so the prompt repeated on every image of a job is stored once per file. Analyses read only the
+# columns they need (read_text_batches, or logging_utils.iteration_log_rows for either format).
+# Usage (from the repo root):
+#   python -m utilities.columnar_log --export-csv iteration_log.csv [--since 2026-10-01]
+#   python -m utilities.columnar_log --import-csv iteration_log.csv
+#   python -m utilities.columnar_log --compact
+
+LOG_DIRECTORY = 'iteration_log'
+BUFFER_ROWS = 500
+BATCH_ROWS = 500_000
+FIELDS = (  # Parquet column and its iteration_log.csv header, in the CSV's order
+    ("iteration", "Iteration Number"),
+    ("start_time", "Start Time"),
+    ("end_time", "End Time"),
+    ("inference_steps", "Inference Steps"),
+    ("latent_batch_amount", "Latent Batch Amount"),
+    ("scheduler", "Scheduler"),
+    ("sampler", "Sampler"),
+    ("lora2", "LORA2"),
+    ("lora3", "LORA3"),
+    ("file_path", "File Path"),
+    ("time_to_complete", "Time to Complete"),
+    ("prompt", "Prompt Text"),
+    ("gpu_seconds_saved", "GPU Seconds Saved"),
+)
+HEADERS = dict(FIELDS)
+COLUMNS = {header: column for column, header in FIELDS}
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar iteration log needs pyarrow (pip install pyarrow).")
+
+def schema():
+    require_pyarrow()
+    text = pa.dictionary(pa.int32(), pa.string())  # Few distinct values, each repeated on many rows
+    return pa.schema([
+        ("iteration", pa.int32()),
+        ("start_time", pa.timestamp("us")),
+        ("end_time", pa.timestamp("us")),
+        ("inference_steps", pa.int16()),
+        ("latent_batch_amount", pa.int16()),
+        ("scheduler", text),
+        ("sampler", text),
+        ("lora2", text),
+        ("lora3", text),
+        ("file_path", pa.string()),
+        ("time_to_complete", pa.duration("us")),
+        ("prompt", text),
+        ("gpu_seconds_saved", pa.float64()),
+    ])
+
+def column_array(values, column_type):
+    if pa.types.is_dictionary(column_type):
+        return pa.array(values, column_type.value_type).dictionary_encode()
+    return pa.array(values, column_type)
+
+def partition_path(directory, run_date):
+    return os.path.join(directory, f"run_date={run_date.isoformat()}")
+
+class ColumnarIterationLog:
+    """Buffers iteration log rows and writes them as Parquet part files, one partition per run date.
+    Safe to call from several threads; whatever is still buffered is written at exit."""
+
+    def __init__(self, directory=LOG_DIRECTORY, buffer_rows=BUFFER_ROWS):
+        require_pyarrow()
+        self.directory = directory
+        self.buffer_rows = buffer_rows
+        self.run_date = datetime.now().date()
+        self.run_id = f"{datetime.now():%Y%m%d%H%M%S}-{os.getpid()}"  # Keeps the parts of concurrent runs apart
+        self.parts = 0
+        self.lock = threading.Lock()
+        self.buffers = {}  # run date -> {column: [values]}
+        self.buffered = 0
+        atexit.register(self.flush)
+
+    def add_row(self, values, run_date=None):
+        """Buffer one row (a value per FIELDS column, in order); flushes once buffer_rows are waiting."""
+        with self.lock:
+            buffer = self.buffers.setdefault(run_date or self.run_date, {column: [] for column, _ in FIELDS})
+            for (column, _), value in zip(FIELDS, values):
+                buffer[column].append(value)
+            self.buffered += 1
+            if self.buffered >= self.buffer_rows:
+                self._write_buffers()
+
+    def append(self, iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler,
+               file_paths, lora2, lora3, prompt_text, gpu_seconds_saved=None):
+        """The rows log_iteration_details would write to the CSV, one per file path."""
+        for file_path in file_paths:
+            self.add_row((
+                iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler,
+                lora2, lora3, file_path, time_end - time_start, prompt_text,
+                None if gpu_seconds_saved is None else round(gpu_seconds_saved, 2)
+            ))
+
+    def flush(self):
+        with self.lock:
+            self._write_buffers()
+
+    def _write_buffers(self):
+        log_schema = schema()
+        for run_date, buffer in self.buffers.items():
+            table = pa.table({column: column_array(buffer[column], log_schema.field(column).type) for column, _ in FIELDS},
+                             schema=log_schema)
+            folder = partition_path(self.directory, run_date)
+            os.makedirs(folder, exist_ok=True)
+            name = f"part-{self.run_id}-{self.parts:05d}.parquet"
+            temp_path = os.path.join(folder, f".{name}.tmp")  # Datasets skip dot files, so readers never see half a file
+            pq.write_table(table, temp_path)
+            os.replace(temp_path, os.path.join(folder, name))
+            self.parts += 1
+        self.buffers = {}
+        self.buffered = 0
+
+def log_dataset(directory=LOG_DIRECTORY):
+    require_pyarrow()
+    partitioning = ds.partitioning(pa.schema([("run_date", pa.string())]), flavor="hive")
+    return ds.dataset(directory, schema=schema().append(pa.field("run_date", pa.string())),
+                      format="parquet", partitioning=partitioning)
+
+def text_column(column):
+    """A column as the text log_iteration_details writes for it; nulls become ''."""
+    if pa.types.is_timestamp(column.type):
+        column = pc.strftime(column.cast(pa.timestamp("s"), safe=False), format="%Y-%m-%d %H:%M:%S")
+    elif pa.types.is_duration(column.type) or pa.types.is_floating(column.type):
+        column = pa.array([None if value is None else str(value) for value in column.to_pylist()], pa.string())
+    else:
+        column = column.cast(pa.string())
+    return column.fill_null("")
+
+def read_text_batches(directory=LOG_DIRECTORY, headers=None, batch_rows=BATCH_ROWS, since=None):
+    """Record batches of the columns named by headers (CSV header names, all when None) as the text
+    the CSV holds, under the CSV headers. since ('YYYY-MM-DD') skips the partitions of earlier runs."""
+    headers = list(headers or HEADERS.values())
+    dataset = log_dataset(directory)
+    row_filter = ds.field("run_date") >= since if since else None
+    for batch in dataset.to_batches(columns=[COLUMNS[header] for header in headers], filter=row_filter, batch_size=batch_rows):
+        yield pa.RecordBatch.from_arrays([text_column(column) for column in batch.columns], names=headers)
+
+def parse_timedelta(text):
+    """The inverse of str(timedelta): '[N day[s], ]H:MM:SS[.ffffff]'."""
+    match = re.fullmatch(r"(?:(-?\d+) days?, )?(\d+):(\d\d):(\d\d(?:\.\d+)?)", text.strip())
+    if not match:
+        raise ValueError(f"Not a duration: {text!r}")
+    days, hours, minutes, seconds = match.groups()
+    return timedelta(days=int(days or 0), hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+def import_csv(csv_path, directory=LOG_DIRECTORY, buffer_rows=BATCH_ROWS):
+    """Copy iteration_log.csv into the columnar log, partitioned by each row's start date.
+    Returns (rows imported, rows skipped as unreadable)."""
+    columnar_log = ColumnarIterationLog(directory, buffer_rows)
+    imported = skipped = 0
+    with open(csv_path, 'r', newline='') as file:
+        for row in csv.DictReader(file):
+            try:
+                start = datetime.strptime(row["Start Time"], "%Y-%m-%d %H:%M:%S")
+                values = (
+                    int(row["Iteration Number"]), start, datetime.strptime(row["End Time"], "%Y-%m-%d %H:%M:%S"),
+                    int(row["Inference Steps"]), int(row["Latent Batch Amount"]), row["Scheduler"], row["Sampler"],
+                    row["LORA2"], row["LORA3"], row["File Path"], parse_timedelta(row["Time to Complete"]),
+                    row.get("Prompt Text") or "", float(row["GPU Seconds Saved"]) if row.get("GPU Seconds Saved") else None
+                )
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            columnar_log.add_row(values, run_date=start.date())
+            imported += 1
+    columnar_log.flush()
+    return imported, skipped
+
+def export_csv(csv_path, directory=LOG_DIRECTORY, since=None):
+    """Write the columnar log as iteration_log.csv; returns the number of rows."""
+    rows = 0
+    with open(csv_path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(HEADERS.values())
+        for batch in read_text_batches(directory, since=since):
+            writer.writerows(zip(*(column.to_pylist() for column in batch.columns)))
+            rows += batch.num_rows
+    return rows
+
+def compact(directory=LOG_DIRECTORY):
+    """Merge the part files of each run date into one. Returns the number of part files merged."""
+    merged = 0
+    for partition in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, partition)
+        parts = sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.startswith("part-") and name.endswith(".parquet"))
+        if len(parts) < 2:
+            continue
+        table = ds.dataset(parts, schema=schema(), format="parquet").to_table()  # Sorted names keep the rows in run order
+        temp_path = os.path.join(folder, ".compacted.tmp")
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, parts[0])
+        for path in parts[1:]:
+            os.remove(path)
+        merged += len(parts)
+    return merged
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert, export or compact the columnar iteration log.")
+    parser.add_argument("--directory", default=LOG_DIRECTORY)
+    parser.add_argument("--import-csv", metavar="CSV", help="Copy an iteration_log.csv into the columnar log")
+    parser.add_argument("--export-csv", metavar="CSV", help="Write the columnar log as an iteration_log.csv")
+    parser.add_argument("--since", metavar="YYYY-MM-DD", help="Export only runs from this date on")
+    parser.add_argument("--compact", action="store_true", help="Merge the part files of each run date")
+    args = parser.parse_args()
+
+    if args.import_csv:
+        imported, skipped = import_csv(args.import_csv, args.directory)
+        print(f"Imported {imported} rows from {args.import_csv} into {args.directory}" + (f" ({skipped} unreadable rows skipped)." if skipped else "."))
+    if args.compact:
+        print(f"Merged {compact(args.directory)} part files.")
+    if args.export_csv:
+        print(f"Wrote {export_csv(args.export_csv, args.directory, args.since)} rows to {args.export_csv}.")
+    if os.path.isdir(args.directory):
+        counts = log_dataset(args.directory).to_table(columns=["run_date"]).group_by("run_date").aggregate([([], "count_all")])
+        for run_date, rows in sorted(zip(counts["run_date"].to_pylist(), counts["count_all"].to_pylist())):
+            print(f"  {run_date}: {rows} rows")
+
+if __name__ == "__main__":
+    main()
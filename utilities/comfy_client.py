@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+import uuid
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utilities.logging_utils import log
+
+# One HTTP client for the ComfyUI API. It keeps a pooled keep-alive Session, puts a timeout on every
+# call, retries connection failures and 502/503/504 answers (POST /prompt only when the request
+# never reached the server, so a prompt is not queued twice), and times each endpoint.
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+VIEW_TIMEOUT = 120  # Full-size PNGs over a slow link
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 10
+
+class ComfyRequestError(requests.exceptions.HTTPError):
+    """ComfyUI answered with an error status; body holds its reply (node_errors for /prompt)."""
+
+    def __init__(self, endpoint, status_code, body):
+        super().__init__(f"{endpoint} returned {status_code}: {str(body)[:500]}")
+        self.endpoint = endpoint
+        self.status_code = status_code
+        self.body = body
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds, failed):
+        self.count += 1
+        self.errors += failed
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.count if self.count else 0.0
+
+class ComfyClient:
+    def __init__(self, base_url, client_id=None, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id or str(uuid.uuid4())
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries, connect=retries, read=0, status=retries,
+            backoff_factor=BACKOFF_FACTOR, status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET"}), raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def request(self, method, endpoint, path=None, timeout=None, **kwargs):
+        """Send one request and record its latency under endpoint (e.g. '/history/{id}')."""
+        start = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f"{self.base_url}{path or endpoint}", timeout=timeout or self.timeout, **kwargs)
+            if response.status_code >= 400:
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = response.text
+                raise ComfyRequestError(endpoint, response.status_code, body)
+            failed = False
+            return response
+        finally:
+            with self.stats_lock:
+                self.stats.setdefault(f"{method} {endpoint}", EndpointStats()).add(time.perf_counter() - start, failed)
+
+    def queue_prompt(self, workflow, client_id=None, prompt_id=None):
+        """Queue a workflow (a dict, or JSON text from a WorkflowTemplate). Returns {'prompt_id', 'number', ...}.
+        A prompt_id chosen by the caller lets it look the prompt up even when the reply never arrives."""
+        prompt_json = workflow if isinstance(workflow, str) else json.dumps(workflow)
+        body = f'{{"prompt": {prompt_json}, "client_id": {json.dumps(client_id or self.client_id)}'
+        if prompt_id:
+            body += f', "prompt_id": {json.dumps(prompt_id)}'
+        body += '}'
+        response = self.request("POST", "/prompt", data=body, headers={"Content-Type": "application/json"})
+        return response.json()
+
+    def queue(self):
+        """The /queue listing: {'queue_running': [...], 'queue_pending': [...]}."""
+        return self.request("GET", "/queue").json()
+
+    def queue_depth(self):
+        queue = self.queue()
+        return len(queue.get("queue_running", [])) + len(queue.get("queue_pending", []))
+
+    def history(self, prompt_id=None, max_items=None):
+        """All history, or the entry of one prompt ({} while it is still queued or running)."""
+        if prompt_id:
+            return self.request("GET", "/history/{id}", path=f"/history/{prompt_id}").json()
+        params = {"max_items": max_items} if max_items else None
+        return self.request("GET", "/history", params=params).json()
+
+    def view(self, filename, subfolder="", type="output"):
+        """The bytes of an output (or temp/input) image."""
+        params = {"filename": filename, "subfolder": subfolder, "type": type}
+        return self.request("GET", "/view", params=params, timeout=(CONNECT_TIMEOUT, VIEW_TIMEOUT)).content
+
+    def interrupt(self):
+        self.request("POST", "/interrupt")
+
+    def free(self, unload_models=True, free_memory=True, timeout=None):
+        self.request("POST", "/free", json={"unload_models": unload_models, "free_memory": free_memory}, timeout=timeout)
+
+    def object_info(self, node_class=None):
+        if node_class:
+            return self.request("GET", "/object_info/{class}", path=f"/object_info/{node_class}").json()
+        return self.request("GET", "/object_info").json()
+
+    def system_stats(self):
+        return self.request("GET", "/system_stats").json()
+
+    def log_latency(self):
+        """Log call count, mean, max and errors per endpoint."""
+        with self.stats_lock:
+            stats = sorted(self.stats.items())
+        for endpoint, endpoint_stats in stats:
+            log(f"[COMFY] {self.base_url} {endpoint}: {endpoint_stats.count} calls, "
+                f"mean {endpoint_stats.mean_seconds * 1000:.1f}ms, max {endpoint_stats.max_seconds * 1000:.1f}ms, "
+                f"{endpoint_stats.errors} errors")
@@ -0,0 +1,272 @@
+import os
+import time
+import uuid
+from collections import deque
+import requests
+from utilities.comfy_client import ComfyClient, ComfyRequestError
+from utilities.logging_utils import log, log_error
+
+# Spreads (combo, sampler, scheduler) jobs over several ComfyUI servers (one per GPU box). Each job
+# goes to the server with the least work, judged by its /queue plus what we have in flight there.
+# Finished images are downloaded through /view into one central folder.
+
+POLL_INTERVAL = 1.0
+REQUEST_TIMEOUT = 10
+MAX_IN_FLIGHT_PER_SERVER = 2  # One running and one waiting keeps a GPU busy between prompts
+MAX_IDLE_POLLS = 60  # Give up when no server has accepted a job for this many polls
+MAX_HISTORY_POLL_FAILURES = 60  # Re-queue a server's jobs after this many failed /history reads in a row
+SUBMIT_BACKOFF_SECONDS = 30  # A server that failed a submit gets no new jobs for this long
+
+class ComfyServer:
+    """Book-keeping for one ComfyUI endpoint."""
+
+    def __init__(self, address, client_id=None):
+        self.address = address.rstrip('/')
+        # No client retries: an unreachable server is marked unhealthy and its jobs go elsewhere
+        self.client = ComfyClient(self.address, client_id, timeout=(REQUEST_TIMEOUT, REQUEST_TIMEOUT), retries=0)
+        self.in_flight = {}  # prompt_id -> job record
+        self.queue_depth = 0
+        self.healthy = True
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.poll_failures = 0
+        self.retry_after = 0.0  # time.time() before which no job is submitted here
+
+    def available(self):
+        return time.time() >= self.retry_after
+
+    def load(self):
+        # /queue also counts other clients' prompts; our own in-flight count covers the gap before
+        # a just-submitted prompt shows up there.
+        return max(self.queue_depth, len(self.in_flight))
+
+class ComfyDispatcher:
+    def __init__(self, server_addresses, output_folder, max_in_flight=MAX_IN_FLIGHT_PER_SERVER, poll_interval=POLL_INTERVAL):
+        if not server_addresses:
+            raise ValueError("At least one ComfyUI server address is required.")
+        self.client_id = str(uuid.uuid4())
+        self.servers = [ComfyServer(address, self.client_id) for address in server_addresses]
+        self.output_folder = output_folder
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+
+    def refresh_queue_depth(self, server):
+        """Read the server's queue length; marks the server unhealthy when it cannot be reached."""
+        try:
+            server.queue_depth = server.client.queue_depth()
+            if not server.healthy:
+                log(f"[DISPATCH] {server.address} is reachable again.")
+            server.healthy = True
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if server.healthy:
+                log(f"[DISPATCH] {server.address} is unavailable: {e}")
+            server.healthy = False
+
+    def least_loaded_server(self):
+        """The healthy server with the least queued work that still has room for another job, or None."""
+        candidates = []
+        for server in self.servers:
+            if len(server.in_flight) >= self.max_in_flight or not server.available():
+                continue
+            self.refresh_queue_depth(server)
+            if server.healthy:
+                candidates.append(server)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda server: (server.load(), server.completed))
+
+    def submit(self, server, workflow_json, job):
+        """Queue workflow_json (a dict, or JSON text from a WorkflowTemplate) on server.
+
+        Returns the job record, or None if the server could not be reached. After a failed submit the
+        server gets no new jobs for SUBMIT_BACKOFF_SECONDS. A submit whose reply timed out may still have
+        been queued, so it is kept in flight as 'unconfirmed' under the prompt ID we chose, for poll() to
+        look up, rather than being sent again.
+        """
+        prompt_id = str(uuid.uuid4())
+        status = "queued"
+        try:
+            prompt_id = server.client.queue_prompt(workflow_json, prompt_id=prompt_id).get("prompt_id", prompt_id)
+        except ComfyRequestError as e:
+            log(f"[DISPATCH] {server.address} rejected the prompt ({e.status_code}): {str(e.body)[:500]}")
+            return {"job": job, "server": server.address, "status": "rejected", "files": []}
+        except requests.exceptions.ReadTimeout as e:
+            log(f"[DISPATCH] No reply from {server.address} to the submit; checking for prompt {prompt_id} later: {e}")
+            server.retry_after = time.time() + SUBMIT_BACKOFF_SECONDS
+            status = "unconfirmed"
+        except requests.exceptions.RequestException as e:
+            log(f"[DISPATCH] Could not queue on {server.address}; no new jobs there for {SUBMIT_BACKOFF_SECONDS}s: {e}")
+            server.healthy = False
+            server.retry_after = time.time() + SUBMIT_BACKOFF_SECONDS
+            return None
+
+        record = {
+            "job": job,
+            "server": server.address,
+            "prompt_id": prompt_id,
+            "submitted_at": time.time(),
+            "status": status,
+            "files": [],
+        }
+        server.in_flight[record["prompt_id"]] = record
+        server.queue_depth += 1
+        return record
+
+    def poll(self):
+        """Collect the jobs that finished since the last poll, downloading their images.
+
+        Returns (finished records, lost jobs); jobs are lost when their server stopped answering, or
+        when an unconfirmed submit turns out never to have been queued.
+        """
+        finished = []
+        lost = []
+        for server in self.servers:
+            for prompt_id, record in list(server.in_flight.items()):
+                try:
+                    if record["status"] == "unconfirmed":
+                        if not server.available():
+                            continue  # Give a slow server time to queue the prompt before looking for it
+                        # /queue before /history: a prompt that leaves the queue in between is in the history
+                        if prompt_id in queued_prompt_ids(server.client.queue()):
+                            record["status"] = "queued"
+                            continue
+                    entry = server.client.history(prompt_id).get(prompt_id)
+                    server.poll_failures = 0
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    server.poll_failures += 1
+                    log(f"[DISPATCH] Could not read history from {server.address}: {e}")
+                    if server.poll_failures >= MAX_HISTORY_POLL_FAILURES:
+                        log(f"[DISPATCH] Giving up on {server.address}; re-queueing its {len(server.in_flight)} jobs.")
+                        lost += [in_flight["job"] for in_flight in server.in_flight.values()]
+                        server.in_flight.clear()
+                        server.healthy = False
+                        server.retry_after = time.time() + SUBMIT_BACKOFF_SECONDS
+                        server.poll_failures = 0
+                        break
+                    continue
+                if not entry:
+                    if record["status"] == "unconfirmed":
+                        log(f"[DISPATCH] Prompt {prompt_id} never reached {server.address}; re-queueing its job.")
+                        lost.append(record["job"])
+                        del server.in_flight[prompt_id]
+                    continue  # Still queued or running
+
+                status = entry.get("status", {})
+                record["status"] = "success" if status.get("completed") else status.get("status_str", "error")
+                record["finished_at"] = time.time()
+                record["execution_seconds"] = execution_seconds(status, record)
+                record["execution_window"] = execution_window(status)
+                record["files"] = self.download_outputs(server, entry)
+                del server.in_flight[prompt_id]
+                server.busy_seconds += record["execution_seconds"]
+                if record["status"] == "success":
+                    server.completed += 1
+                else:
+                    server.failed += 1
+                finished.append(record)
+        return finished, lost
+
+    def download_outputs(self, server, history_entry):
+        """Fetch every output image of a finished prompt into the central output folder."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        files = []
+        for node_output in history_entry.get("outputs", {}).values():
+            for image in node_output.get("images", []):
+                if image.get("type") != "output":
+                    continue
+                try:
+                    content = server.client.view(image["filename"], image.get("subfolder", ""), image["type"])
+                except requests.exceptions.RequestException as e:
+                    log(f"[DISPATCH] Could not download {image.get('filename')} from {server.address}: {e}")
+                    continue
+                path = os.path.join(self.output_folder, image["filename"])
+                if os.path.exists(path):
+                    stem, extension = os.path.splitext(image["filename"])
+                    path = os.path.join(self.output_folder, f"{stem}_{self.servers.index(server)}{extension}")
+                with open(path, "wb") as file:
+                    file.write(content)
+                files.append(path)
+        return files
+
+    def in_flight_count(self):
+        return sum(len(server.in_flight) for server in self.servers)
+
+    def run(self, jobs, build_workflow, on_complete=None):
+        """Dispatch every job until all have finished.
+
+        build_workflow(job) returns the ComfyUI prompt for a job; on_complete(record) is called
+        for each finished (or rejected) job. Returns the list of job records.
+        """
+        pending = deque(jobs)
+        records = []
+        idle_polls = 0
+
+        while pending or self.in_flight_count():
+            while pending:
+                server = self.least_loaded_server()
+                if server is None:
+                    break
+                job = pending.popleft()
+                try:
+                    workflow_json = build_workflow(job)
+                except Exception as e:
+                    log_error(f"[DISPATCH] Could not build the workflow for {job}: {str(e)}")
+                    continue
+                record = self.submit(server, workflow_json, job)
+                if record is None:
+                    pending.appendleft(job)  # Server went away; poll and wait before trying another one
+                    break
+                if record["status"] == "rejected":
+                    records.append(record)
+                    if on_complete:
+                        on_complete(record)
+                    continue
+                if record["status"] == "unconfirmed":
+                    break
+                log(f"[DISPATCH] Queued on {server.address} ({len(pending)} jobs waiting).")
+
+            finished, lost = self.poll()
+            pending.extendleft(reversed(lost))
+            for record in finished:
+                records.append(record)
+                if on_complete:
+                    on_complete(record)
+
+            if pending and not self.in_flight_count():
+                idle_polls += 1
+                if idle_polls >= MAX_IDLE_POLLS:
+                    log(f"[DISPATCH] No ComfyUI server is available; {len(pending)} jobs were not run.")
+                    break
+            else:
+                idle_polls = 0
+
+            if not finished and (pending or self.in_flight_count()):
+                time.sleep(self.poll_interval)
+
+        return records
+
+    def log_summary(self):
+        for server in self.servers:
+            log(f"[DISPATCH] {server.address}: {server.completed} completed, {server.failed} failed, "
+                f"{server.busy_seconds:.1f}s busy")
+            server.client.log_latency()
+
+def queued_prompt_ids(queue):
+    """The prompt IDs running or waiting in a /queue listing ([number, prompt_id, prompt, ...] items)."""
+    return {item[1] for item in queue.get("queue_running", []) + queue.get("queue_pending", []) if len(item) > 1}
+
+def execution_window(status):
+    """(start, end) in epoch seconds of the prompt's execution from its status messages, or None."""
+    timestamps = {name: data.get("timestamp") for name, data in status.get("messages", []) if isinstance(data, dict)}
+    start, end = timestamps.get("execution_start"), timestamps.get("execution_success")
+    if start and end:
+        return start / 1000, end / 1000
+    return None
+
+def execution_seconds(status, record):
+    """Time the server spent on the prompt, from its status messages when available."""
+    window = execution_window(status)
+    if window:
+        return window[1] - window[0]
+    return record["finished_at"] - record["submitted_at"]
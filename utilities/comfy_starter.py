@@ -1,18 +1,33 @@
 import os
+import csv
 import subprocess
 import requests
 import time
 from datetime import datetime
-import psutil
+from statistics import median
+import platform
+from utilities.comfy_client import ComfyClient, ComfyRequestError
+from utilities.port_utils import is_port_in_use, launch_process, find_port_owner, terminate_process, remove_pidfile
 
 # Configurable constants
 SERVER_ADDRESS = 'http://127.0.0.1:8188'
 COMFYUI_DIR = r'C:\kumori\dev\ComfyUI_training\ComfyUI'
 COMFYUI_MAIN_SCRIPT = 'main.py'
 COMFY_ENV_DIR = os.path.join(COMFYUI_DIR, "comfy_env")
-START_SCRIPT = f'start cmd.exe /k "cd /d {COMFYUI_DIR} && call {COMFY_ENV_DIR}\\Scripts\\activate && python {COMFYUI_MAIN_SCRIPT} --lowvram --listen 0.0.0.0"'
+COMFY_PYTHON = os.path.join(COMFY_ENV_DIR, "Scripts", "python.exe") if platform.system() == "Windows" else os.path.join(COMFY_ENV_DIR, "bin", "python")
+COMFYUI_COMMAND = [COMFY_PYTHON, COMFYUI_MAIN_SCRIPT, "--lowvram", "--listen", "0.0.0.0"]
+COMFYUI_PORT = 8188
+PIDFILE = 'comfyui.pid'  # Written by start_comfyui so the server can be found without scanning every socket
 MAX_ATTEMPTS = 40
 ATTEMPT_DELAY = 15
+READY_TIMEOUT = MAX_ATTEMPTS * ATTEMPT_DELAY  # Same overall budget as the old fixed-delay loop
+INITIAL_PROBE_DELAY = 0.25  # Seconds; doubles after every failed probe
+MAX_PROBE_DELAY = 5
+PROBE_TIMEOUT = 3  # Per-request timeout so a hung server cannot stall a probe
+STARTUP_TIMES_FILE = 'comfyui_startup_times.csv'
+FREE_TIMEOUT = 30  # Unloading the models can take a while
+# No client retries: wait_for_comfyui_ready paces the probes with its own backoff
+comfy_client = ComfyClient(SERVER_ADDRESS, timeout=PROBE_TIMEOUT, retries=0)
 
 def log(message):
     """Log a message both to the console and to a file."""
@@ -31,88 +46,128 @@ def run_command(command):
 
 def start_comfyui():
     """Start the ComfyUI server in a new terminal window."""
-    subprocess.Popen(START_SCRIPT, shell=True)
-    log("Started ComfyUI server in a new terminal window.")
+    process = launch_process(COMFYUI_COMMAND, PIDFILE, cwd=COMFYUI_DIR, new_console=True)
+    log(f"Started ComfyUI server in a new terminal window (PID: {process.pid}).")
 
 def stop_comfyui():
     """Stop the ComfyUI server if running."""
     print("Stopping ComfyUI server if running...")
-    port = 8188
+    port = COMFYUI_PORT
     if is_port_in_use(port):
         kill_process_using_port(port)
         time.sleep(5)  # Ensure the process has time to terminate
     else:
         print("ComfyUI server is not running.")
 
+def probe_comfyui():
+    """Check that ComfyUI answers /system_stats and has its node definitions loaded. Returns (ready, reason)."""
+    try:
+        comfy_client.system_stats()
+    except ComfyRequestError as e:
+        return False, f"/system_stats returned {e.status_code}"
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return False, f"{type(e).__name__}"
+    try:
+        if "KSamplerSelect" not in comfy_client.object_info("KSamplerSelect"):
+            return False, "node definitions are not loaded yet"
+        return True, "ready"
+    except ComfyRequestError:
+        return False, "node definitions are not loaded yet"
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return False, f"{type(e).__name__}"
+
+def wait_for_comfyui_ready(timeout=READY_TIMEOUT):
+    """Probe with exponential backoff until ComfyUI is usable. Returns seconds waited, or None on timeout."""
+    start = time.monotonic()
+    delay = INITIAL_PROBE_DELAY
+    attempt = 0
+    while True:
+        attempt += 1
+        ready, reason = probe_comfyui()
+        elapsed = time.monotonic() - start
+        if ready:
+            log(f"ComfyUI is ready after {attempt} attempts ({elapsed:.2f} seconds).")
+            return elapsed
+        if elapsed + delay > timeout:
+            log(f"ComfyUI is not ready after {elapsed:.1f} seconds: {reason}.")
+            return None
+        log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt}: ComfyUI not ready yet ({reason}). Retrying in {delay:.2f} seconds...")
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_PROBE_DELAY)
+
+def record_startup_time(seconds):
+    """Append the measured cold-start time and warn when it is well above the usual."""
+    previous = []
+    if os.path.isfile(STARTUP_TIMES_FILE):
+        with open(STARTUP_TIMES_FILE, newline='') as f:
+            previous = [float(row["seconds"]) for row in csv.DictReader(f)]
+
+    with open(STARTUP_TIMES_FILE, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if not previous and f.tell() == 0:
+            writer.writerow(["timestamp", "seconds"])
+        writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), f"{seconds:.2f}"])
+
+    log(f"ComfyUI cold start took {seconds:.2f} seconds.")
+    if len(previous) >= 3 and seconds > 1.5 * median(previous):
+        log(f"WARNING: ComfyUI cold start is slower than the median of {median(previous):.2f} seconds over {len(previous)} runs.")
+
 def is_comfyui_ready():
     """Check if the ComfyUI server is ready to receive requests."""
-    url = f"{SERVER_ADDRESS}/prompt"
-    for attempt in range(MAX_ATTEMPTS):
-        try:
-            log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: Checking if ComfyUI is ready at {url}...")
-            response = requests.get(url)
-            if response.status_code == 200:
-                log(f"ComfyUI is ready after {attempt + 1} attempts.")
-                return True
-            log(f"Status code received: {response.status_code}, Response: {response.text}")
-        except requests.exceptions.ConnectionError as e:
-            remaining_attempts = MAX_ATTEMPTS - attempt - 1
-            log(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Attempt {attempt + 1}: ComfyUI not ready yet. {remaining_attempts} attempts left. Retrying in {ATTEMPT_DELAY} seconds...")
-            log(f"ConnectionError: {e}")
-            time.sleep(ATTEMPT_DELAY)
-    log("ComfyUI is not ready.")
-    return False
-
-def is_port_in_use(port):
-    """Check if a given port is in use by any process."""
-    for conn in psutil.net_connections():
-        if conn.laddr.port == port and conn.status == psutil.CONN_LISTEN:
-            return conn.pid
-    return None
+    return wait_for_comfyui_ready() is not None
+
+def start_comfyui_and_wait():
+    """Start ComfyUI, wait for it to become usable and record the cold-start time."""
+    start_comfyui()
+    startup_time = wait_for_comfyui_ready()
+    if startup_time is None:
+        log("ComfyUI did not start in time.")
+        return False
+    record_startup_time(startup_time)
+    return True
+
+def free_comfyui_memory():
+    """Ask ComfyUI to unload its models and free VRAM so another engine can use the GPU."""
+    try:
+        comfy_client.free(timeout=FREE_TIMEOUT)
+        log("Asked ComfyUI to unload models and free VRAM.")
+    except requests.exceptions.RequestException as e:
+        log(f"Failed to free ComfyUI memory: {e}")
 
 def kill_process_using_port(port):
     """Kill the process currently using the given port."""
-    pid = is_port_in_use(port)
+    pid = find_port_owner(port, PIDFILE, COMFYUI_MAIN_SCRIPT)
     if pid:
-        process = psutil.Process(pid)
-        log(f"Killing process {process.name()} (PID: {pid}) using port {port}.")
-        process.terminate()
-        process.wait()
+        log(f"Killing process (PID: {pid}) using port {port}.")
+        terminate_process(pid)
+        remove_pidfile(PIDFILE)
 
 def show_port_usage(port):
     """Show what is using the specified port."""
-    netstat_cmd = f'netstat -an | findstr /C:"{port}"'
-    try:
-        result = subprocess.run(netstat_cmd, shell=True, capture_output=True, text=True, check=True)
-        if result.stdout:
-            log(f"Port usage:\n{result.stdout}")
-        else:
-            log(f"No processes are using port {port}.")
-    except subprocess.CalledProcessError:
+    pid = find_port_owner(port, PIDFILE, COMFYUI_MAIN_SCRIPT)
+    if pid:
+        log(f"Port {port} is in use by PID {pid}.")
+    else:
         log(f"No processes are using port {port}.")
 
 def initialize_comfyui():
     """Ensure that ComfyUI is running, starting it if necessary."""
-    show_port_usage(8188)
+    show_port_usage(COMFYUI_PORT)
 
-    if is_port_in_use(8188):
+    if is_port_in_use(COMFYUI_PORT):
         log("ComfyUI port is in use. Checking if ComfyUI is ready...")
         if is_comfyui_ready():
             log("ComfyUI is already running and ready.")
             return True
         else:
             log("ComfyUI is not responding correctly. Restarting ComfyUI.")
-            kill_process_using_port(8188)
+            kill_process_using_port(COMFYUI_PORT)
             time.sleep(5)  # Wait a little before starting it again, to make sure the port is freed
-            start_comfyui()
-            if not is_comfyui_ready():
-                log("ComfyUI did not start in time.")
+            if not start_comfyui_and_wait():
                 return False
     else:
         log("ComfyUI port is not in use. Starting ComfyUI in a new terminal window.")
-        start_comfyui()
-        if not is_comfyui_ready():
-            log("ComfyUI did not start in time.")
+        if not start_comfyui_and_wait():
             return False
 
     return True
@@ -0,0 +1,68 @@
+import math
+import importlib
+
+# CPU scoring for the draft stage of 2_create_loop_lora.py (TWO_STAGE). Each seed is first rendered
+# with DRAFT_STEPS; the drafts are scored here and only the best seeds are rendered again at full
+# INFERENCE_STEPS. A scorer takes an image path and returns a number, higher is better.
+# DRAFT_SCORER names one of SCORERS or any "module:function" with that signature.
+
+SCORE_SIZE = 256  # Drafts are shrunk to this before scoring; a few ms per image
+
+def load_gray(path, size=SCORE_SIZE):
+    """The image as a float32 luminance array in [0, 1], at most size x size."""
+    import numpy as np  # Imported here, like PIL, so importing this module stays cheap
+    from PIL import Image
+    with Image.open(path) as img:
+        img = img.convert("L")
+        img.thumbnail((size, size))
+        return np.asarray(img, dtype=np.float32) / 255.0
+
+def laplacian_std(gray):
+    """Edge detail: standard deviation of the 4-neighbour Laplacian. Blurry drafts score low."""
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+    return float(laplacian.std())
+
+def sharpness(path):
+    return laplacian_std(load_gray(path))
+
+def contrast(path):
+    return float(load_gray(path).std())
+
+def sharpness_contrast(path):
+    """The default: detail plus global contrast, which drops washed-out and smeared drafts."""
+    gray = load_gray(path)
+    return laplacian_std(gray) + float(gray.std())
+
+SCORERS = {
+    "sharpness": sharpness,
+    "contrast": contrast,
+    "sharpness_contrast": sharpness_contrast,
+}
+
+def load_scorer(name):
+    """A scorer from SCORERS, or a function given as 'package.module:function'."""
+    if name in SCORERS:
+        return SCORERS[name]
+    module_name, _, function_name = name.partition(":")
+    if not function_name:
+        raise ValueError(f"Unknown draft scorer '{name}'; use one of {sorted(SCORERS)} or 'module:function'.")
+    return getattr(importlib.import_module(module_name), function_name)
+
+def keep_count(draft_count, keep_fraction):
+    """How many of draft_count seeds go on to the full render; always at least one."""
+    return max(1, min(draft_count, math.ceil(draft_count * keep_fraction)))
+
+def select_seeds(seed_scores, keep_fraction):
+    """The best keep_count() seeds from {seed: score}, best first."""
+    ranked = sorted(seed_scores, key=seed_scores.get, reverse=True)
+    return ranked[:keep_count(len(ranked), keep_fraction)]
+
+def gpu_seconds_saved(draft_seconds, final_seconds, draft_count, kept):
+    """Seconds saved per kept image against rendering all draft_count seeds at full steps.
+
+    The full-step cost of one seed is taken from the final renders (final_seconds / kept).
+    """
+    if not kept:
+        return 0.0
+    full_seconds_per_seed = final_seconds / kept
+    return (full_seconds_per_seed * draft_count - draft_seconds - final_seconds) / kept
@@ -0,0 +1,525 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# -------------------------
+# GLOBAL VARIABLES SECTION
+# -------------------------
+
+# Stand-in for a ComfyUI server so the image scripts and the dispatcher can be exercised on a CPU-only
+# box. It implements the HTTP endpoints the scripts use, runs prompts one at a time like ComfyUI and
+# simulates ComfyUI's node cache: a node whose class and inputs (including everything upstream) are
+# unchanged since the previous prompt is reported as cached and costs no time. Clients connected to /ws
+# get ComfyUI's events (execution_start, executing, progress per sampling step, execution_success).
+DEFAULT_PORT = 8190
+TIME_SCALE = 0.01  # Simulated seconds are multiplied by this (0.01 = 100x faster than a real GPU)
+DEFAULT_NODE_SECONDS = 0.01
+VRAM_TOTAL = 24 * 1024 ** 3
+
+# Simulated cost per node class: (seconds per execution, seconds per image in the batch)
+NODE_SECONDS = {
+    "UNETLoader": (8.0, 0.0),
+    "DualCLIPLoader": (4.0, 0.0),
+    "VAELoader": (0.5, 0.0),
+    "LoraLoader": (1.5, 0.0),
+    "CLIPTextEncode": (0.4, 0.0),
+    "ModelSamplingFlux": (0.05, 0.0),
+    "SamplerCustomAdvanced": (0.5, 6.0),
+    "KSampler": (0.5, 6.0),
+    "VAEDecode": (0.1, 0.4),
+    "SaveImage": (0.0, 0.05),
+}
+# The sampler costs above are for DEFAULT_STEPS; some samplers call the model more than once per step
+DEFAULT_STEPS = 20
+MODEL_CALLS_PER_STEP = {
+    "heun": 2, "heunpp2": 3, "dpm_2": 2, "dpm_2_ancestral": 2, "dpmpp_2s_ancestral": 2,
+    "dpmpp_sde": 2, "dpmpp_sde_gpu": 2, "dpm_adaptive": 3,
+}
+SAMPLER_NODES = {"SamplerCustomAdvanced", "KSampler"}
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# VRAM held by loaded models until /free is called
+MODEL_VRAM = {"UNETLoader": 11 * 1024 ** 3, "DualCLIPLoader": 5 * 1024 ** 3, "VAELoader": 300 * 1024 ** 2, "LoraLoader": 200 * 1024 ** 2}
+VRAM_PER_IMAGE = 600 * 1024 ** 2
+
+# Required inputs and outputs of the node classes used by workflow_json/*.json (served as /object_info)
+NODE_DEFINITIONS = {
+    "CLIPTextEncode": (["text", "clip"], ["CONDITIONING"]),
+    "VAEDecode": (["samples", "vae"], ["IMAGE"]),
+    "SaveImage": (["images", "filename_prefix"], []),
+    "VAELoader": (["vae_name"], ["VAE"]),
+    "DualCLIPLoader": (["clip_name1", "clip_name2", "type"], ["CLIP"]),
+    "UNETLoader": (["unet_name", "weight_dtype"], ["MODEL"]),
+    "SamplerCustomAdvanced": (["noise", "guider", "sampler", "sigmas", "latent_image"], ["LATENT", "LATENT"]),
+    "KSamplerSelect": (["sampler_name"], ["SAMPLER"]),
+    "BasicScheduler": (["model", "scheduler", "steps", "denoise"], ["SIGMAS"]),
+    "BasicGuider": (["model", "conditioning"], ["GUIDER"]),
+    "RandomNoise": (["noise_seed"], ["NOISE"]),
+    "FluxGuidance": (["conditioning", "guidance"], ["CONDITIONING"]),
+    "EmptySD3LatentImage": (["width", "height", "batch_size"], ["LATENT"]),
+    "EmptyLatentImage": (["width", "height", "batch_size"], ["LATENT"]),
+    "ModelSamplingFlux": (["model", "max_shift", "base_shift", "width", "height"], ["MODEL"]),
+    "LoraLoader": (["model", "clip", "lora_name", "strength_model", "strength_clip"], ["MODEL", "CLIP"]),
+    "RepeatLatentBatch": (["samples", "amount"], ["LATENT"]),
+    "PreviewImage": (["images"], []),
+}
+OUTPUT_NODES = {"SaveImage", "PreviewImage"}
+
+# -------------------------
+# HELPER FUNCTIONS SECTION
+# -------------------------
+
+def png_bytes(seed):
+    """A valid 1x1 RGB PNG whose colour depends on seed."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    rgb = bytes([(seed * 67) % 256, (seed * 131) % 256, (seed * 197) % 256])
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00" + rgb)) + chunk(b"IEND", b""))
+
+def websocket_frame(payload):
+    """An unmasked, unfragmented server-to-client text frame."""
+    if len(payload) < 126:
+        header = struct.pack(">BB", 0x81, len(payload))
+    elif len(payload) < 65536:
+        header = struct.pack(">BBH", 0x81, 126, len(payload))
+    else:
+        header = struct.pack(">BBQ", 0x81, 127, len(payload))
+    return header + payload
+
+def sampling_work(prompt, node_id):
+    """(steps, model calls per step) of a sampler node, following its links like ComfyUI would."""
+    inputs = prompt[node_id].get("inputs", {})
+    steps, sampler_name = inputs.get("steps"), inputs.get("sampler_name")
+    for value in inputs.values():
+        if is_link(value, prompt):
+            upstream = prompt[value[0]].get("inputs", {})
+            steps = upstream.get("steps", steps)
+            sampler_name = upstream.get("sampler_name", sampler_name)
+    steps = steps if isinstance(steps, int) else DEFAULT_STEPS
+    return steps, MODEL_CALLS_PER_STEP.get(sampler_name, 1)
+
+def is_link(value, prompt):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] in prompt
+
+def validate_prompt(prompt):
+    """Return ComfyUI-style node_errors for unknown classes, missing inputs and dangling links."""
+    node_errors = {}
+    for node_id, node in prompt.items():
+        errors = []
+        definition = NODE_DEFINITIONS.get(node.get("class_type"))
+        if definition is None:
+            errors.append(f"Unknown node class '{node.get('class_type')}'")
+        else:
+            inputs = node.get("inputs", {})
+            errors += [f"Required input '{name}' is missing" for name in definition[0] if name not in inputs]
+            for name, value in inputs.items():
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] not in prompt:
+                    errors.append(f"Input '{name}' links to missing node {value[0]}")
+        if errors:
+            node_errors[node_id] = {"errors": [{"message": error} for error in errors], "class_type": node.get("class_type")}
+    if not any(node.get("class_type") in OUTPUT_NODES for node in prompt.values()):
+        node_errors["prompt"] = {"errors": [{"message": "Prompt has no outputs"}]}
+    return node_errors
+
+def node_signatures(prompt):
+    """Map node id -> a signature covering its class, literal inputs and all upstream nodes."""
+    signatures = {}
+
+    def signature(node_id):
+        if node_id not in signatures:
+            node = prompt[node_id]
+            parts = [node["class_type"]]
+            for name, value in sorted(node.get("inputs", {}).items()):
+                if is_link(value, prompt):
+                    parts.append(f"{name}=<{signature(value[0])}:{value[1]}>")
+                else:
+                    parts.append(f"{name}={json.dumps(value, sort_keys=True)}")
+            signatures[node_id] = "|".join(parts)
+        return signatures[node_id]
+
+    for node_id in prompt:
+        signature(node_id)
+    return signatures
+
+def batch_sizes(prompt):
+    """Map node id -> number of images flowing through it."""
+    sizes = {}
+
+    def size(node_id):
+        if node_id not in sizes:
+            node = prompt[node_id]
+            inputs = node.get("inputs", {})
+            upstream = [size(value[0]) for value in inputs.values() if is_link(value, prompt)]
+            if node["class_type"] == "RepeatLatentBatch":
+                sizes[node_id] = int(inputs.get("amount", 1)) * (upstream[0] if upstream else 1)
+            elif "batch_size" in inputs and not is_link(inputs["batch_size"], prompt):
+                sizes[node_id] = int(inputs["batch_size"])
+            else:
+                sizes[node_id] = max(upstream, default=1)
+        return sizes[node_id]
+
+    for node_id in prompt:
+        size(node_id)
+    return sizes
+
+def required_nodes(prompt):
+    """Node ids reachable upstream from the output nodes, in execution (topological) order."""
+    order = []
+    seen = set()
+
+    def visit(node_id):
+        if node_id in seen:
+            return
+        seen.add(node_id)
+        for value in prompt[node_id].get("inputs", {}).values():
+            if is_link(value, prompt):
+                visit(value[0])
+        order.append(node_id)
+
+    for node_id, node in prompt.items():
+        if node["class_type"] in OUTPUT_NODES:
+            visit(node_id)
+    return order
+
+class FakeComfyUIHandler(BaseHTTPRequestHandler):
+    """Implements the parts of the ComfyUI HTTP API used by this repository."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return None
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if time.monotonic() < server.ready_at:
+            self.send_json({"error": "starting"}, status=503)
+        elif url.path == "/ws":
+            self.serve_websocket(query.get("clientId", [""])[0])
+        elif url.path == "/system_stats":
+            self.send_json(server.system_stats())
+        elif url.path == "/object_info":
+            self.send_json({name: server.object_info(name) for name in NODE_DEFINITIONS})
+        elif url.path.startswith("/object_info/"):
+            name = url.path[len("/object_info/"):]
+            self.send_json({name: server.object_info(name)} if name in NODE_DEFINITIONS else {})
+        elif url.path == "/queue":
+            with server.lock:
+                running = [server.queue_entry(server.running)] if server.running else []
+                pending = [server.queue_entry(job) for job in server.pending]
+            self.send_json({"queue_running": running, "queue_pending": pending})
+        elif url.path == "/prompt":
+            with server.lock:
+                remaining = len(server.pending) + (1 if server.running else 0)
+            self.send_json({"exec_info": {"queue_remaining": remaining}})
+        elif url.path == "/history":
+            with server.lock:
+                items = list(server.history.items())
+            max_items = int(query.get("max_items", [0])[0])
+            self.send_json(dict(items[-max_items:] if max_items else items))
+        elif url.path.startswith("/history/"):
+            prompt_id = url.path[len("/history/"):]
+            with server.lock:
+                entry = server.history.get(prompt_id)
+            self.send_json({prompt_id: entry} if entry else {})
+        elif url.path == "/view":
+            filename = query.get("filename", [""])[0]
+            with server.lock:
+                data = server.images.get(filename)
+            if data is None:
+                self.send_json({"error": "not found"}, status=404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif url.path == "/":
+            self.send_json({"name": "fake-comfyui"})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def serve_websocket(self, client_id):
+        """Upgrade to a websocket and forward this client's events until it goes away."""
+        key = self.headers.get("Sec-WebSocket-Key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.close_connection = True
+        events = queue.SimpleQueue()
+        with self.server.lock:
+            self.server.listeners.setdefault(client_id, []).append(events)
+        try:
+            self.wfile.write(websocket_frame(json.dumps({"type": "status", "data": {"sid": client_id}}).encode("utf-8")))
+            while True:
+                try:
+                    message = events.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                self.wfile.write(websocket_frame(json.dumps(message).encode("utf-8")))
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            with self.server.lock:
+                self.server.listeners[client_id].remove(events)
+
+    def do_POST(self):
+        server = self.server
+        body = self.read_json()
+        if body is None:
+            self.send_json({"error": "invalid JSON"}, status=400)
+            return
+        if time.monotonic() < server.ready_at:
+            self.send_json({"error": "starting"}, status=503)
+        elif self.path == "/prompt":
+            prompt = body.get("prompt")
+            if not isinstance(prompt, dict):
+                self.send_json({"error": {"type": "invalid_prompt", "message": "No prompt provided"}, "node_errors": {}}, status=400)
+                return
+            node_errors = validate_prompt(prompt)
+            if node_errors:
+                self.send_json({"error": {"type": "prompt_outputs_failed_validation", "message": "Prompt outputs failed validation"},
+                                "node_errors": node_errors}, status=400)
+                return
+            self.send_json(server.enqueue(prompt, body.get("client_id"), body.get("prompt_id")))
+        elif self.path == "/free":
+            server.free(body.get("unload_models", False))
+            self.send_json({})
+        elif self.path == "/interrupt":
+            server.interrupted.set()
+            self.send_json({})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+class FakeComfyUIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, time_scale=TIME_SCALE, startup_delay=0.0, output_dir=None, name="fake-gpu"):
+        super().__init__(address, FakeComfyUIHandler)
+        self.time_scale = time_scale
+        self.ready_at = time.monotonic() + startup_delay
+        self.output_dir = output_dir
+        self.device_name = name
+        self.lock = threading.Lock()
+        self.work_available = threading.Condition(self.lock)
+        self.interrupted = threading.Event()
+        self.pending = []
+        self.running = None
+        self.history = {}
+        self.images = {}
+        self.counter = 0
+        self.image_counters = {}
+        self.listeners = {}  # client_id -> event queues of its open websockets
+        self.cache = {}  # node id -> signature of the output it currently holds
+        self.loaded_vram = {}
+        self.peak_vram = 0
+        # Statistics for benchmarks
+        self.prompts_completed = 0
+        self.executed_nodes = 0
+        self.cached_nodes = 0
+        self.simulated_seconds = 0.0
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def object_info(self, name):
+        inputs, outputs = NODE_DEFINITIONS[name]
+        return {
+            "input": {"required": {input_name: [["*"]] for input_name in inputs}},
+            "output": outputs, "name": name, "display_name": name, "category": "fake",
+            "output_node": name in OUTPUT_NODES,
+        }
+
+    def system_stats(self):
+        with self.lock:
+            used = sum(self.loaded_vram.values())
+        return {
+            "system": {"os": "fake", "python_version": "fake", "comfyui_version": "fake"},
+            "devices": [{
+                "name": self.device_name, "type": "cuda", "index": 0,
+                "vram_total": VRAM_TOTAL, "vram_free": VRAM_TOTAL - used,
+                "torch_vram_total": VRAM_TOTAL, "torch_vram_free": VRAM_TOTAL - used,
+                "peak_vram_used": self.peak_vram,
+            }],
+        }
+
+    def emit(self, job, event_type, data):
+        """Send a websocket event to the client that queued job."""
+        with self.lock:
+            listeners = list(self.listeners.get(job["client_id"], ()))
+        for events in listeners:
+            events.put({"type": event_type, "data": dict(data, prompt_id=job["prompt_id"])})
+
+    def queue_entry(self, job):
+        return [job["number"], job["prompt_id"], job["prompt"], {"client_id": job["client_id"]}, []]
+
+    def enqueue(self, prompt, client_id, prompt_id=None):
+        with self.lock:
+            job = {"number": self.counter, "prompt_id": prompt_id or str(uuid.uuid4()), "prompt": prompt, "client_id": client_id}
+            self.counter += 1
+            self.pending.append(job)
+            self.work_available.notify()
+        return {"prompt_id": job["prompt_id"], "number": job["number"], "node_errors": {}}
+
+    def free(self, unload_models):
+        with self.lock:
+            if unload_models:
+                self.loaded_vram.clear()
+                self.cache.clear()
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.work_available.wait()
+                self.running = self.pending.pop(0)
+            self.interrupted.clear()
+            entry = self.execute(self.running)
+            with self.lock:
+                self.history[self.running["prompt_id"]] = entry
+                self.running = None
+                self.prompts_completed += 1
+
+    def execute(self, job):
+        """Run the prompt against the simulated node cache and produce the output images."""
+        prompt = job["prompt"]
+        signatures = node_signatures(prompt)
+        sizes = batch_sizes(prompt)
+        messages = [["execution_start", {"prompt_id": job["prompt_id"], "timestamp": int(time.time() * 1000)}]]
+        self.emit(job, "execution_start", {"timestamp": messages[0][1]["timestamp"]})
+        cached = [node_id for node_id in required_nodes(prompt) if self.cache.get(node_id) == signatures[node_id]]
+        messages.append(["execution_cached", {"nodes": cached, "prompt_id": job["prompt_id"], "timestamp": int(time.time() * 1000)}])
+        self.emit(job, "execution_cached", {"nodes": cached})
+        outputs = {}
+        executed = []
+        node_timings = {}
+
+        for node_id in required_nodes(prompt):
+            if node_id in cached:
+                continue
+            if self.interrupted.is_set():
+                messages.append(["execution_interrupted", {"prompt_id": job["prompt_id"], "node_id": node_id, "timestamp": int(time.time() * 1000)}])
+                return {"prompt": [job["number"], job["prompt_id"], prompt, {}, []], "outputs": outputs,
+                        "status": {"status_str": "error", "completed": False, "messages": messages}}
+            node = prompt[node_id]
+            class_type = node["class_type"]
+            fixed, per_image = NODE_SECONDS.get(class_type, (DEFAULT_NODE_SECONDS, 0.0))
+            self.emit(job, "executing", {"node": node_id})
+            if class_type in SAMPLER_NODES:
+                steps, calls = sampling_work(prompt, node_id)
+                seconds = fixed + per_image * sizes[node_id] * steps * calls / DEFAULT_STEPS
+                time.sleep(fixed * self.time_scale)
+                for step in range(1, steps + 1):
+                    time.sleep((seconds - fixed) / steps * self.time_scale)
+                    self.emit(job, "progress", {"value": step, "max": steps, "node": node_id})
+            else:
+                seconds = fixed + per_image * sizes[node_id]
+                time.sleep(seconds * self.time_scale)
+            executed.append(node_id)
+            node_timings[node_id] = seconds
+
+            with self.lock:
+                self.cache[node_id] = signatures[node_id]
+                self.executed_nodes += 1
+                self.simulated_seconds += seconds
+                if class_type in MODEL_VRAM:
+                    self.loaded_vram[node_id] = MODEL_VRAM[class_type]
+                self.peak_vram = max(self.peak_vram, sum(self.loaded_vram.values()) + VRAM_PER_IMAGE * sizes[node_id])
+
+            if class_type == "SaveImage":
+                outputs[node_id] = {"images": self.save_images(node, sizes[node_id])}
+
+        with self.lock:
+            self.cached_nodes += len(cached)
+        messages.append(["execution_success", {"prompt_id": job["prompt_id"], "timestamp": int(time.time() * 1000)}])
+        self.emit(job, "executing", {"node": None})
+        self.emit(job, "execution_success", {"timestamp": messages[-1][1]["timestamp"]})
+        return {
+            "prompt": [job["number"], job["prompt_id"], prompt, {"client_id": job["client_id"]}, []],
+            "outputs": outputs,
+            "status": {"status_str": "success", "completed": True, "messages": messages},
+            "meta": {node_id: {"node_id": node_id, "simulated_seconds": node_timings[node_id]} for node_id in executed},
+        }
+
+    def save_images(self, node, count):
+        prefix = node["inputs"].get("filename_prefix", "ComfyUI")
+        images = []
+        for _ in range(count):
+            with self.lock:
+                index = self.image_counters.get(prefix, 0) + 1
+                self.image_counters[prefix] = index
+            filename = f"{prefix}_{index:05d}_.png"
+            data = png_bytes(self.counter + index)
+            with self.lock:
+                self.images[filename] = data
+            if self.output_dir:
+                os.makedirs(self.output_dir, exist_ok=True)
+                with open(os.path.join(self.output_dir, filename), "wb") as file:
+                    file.write(data)
+            images.append({"filename": filename, "subfolder": "", "type": "output"})
+        return images
+
+def start_fake_comfyui_server(port=0, time_scale=TIME_SCALE, startup_delay=0.0, output_dir=None, name="fake-gpu"):
+    """Start the stand-in server on a background thread. Port 0 picks a free port (see server.server_port)."""
+    server = FakeComfyUIServer(("127.0.0.1", port), time_scale, startup_delay, output_dir, name)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# -------------------------
+# MAIN EXECUTION SECTION
+# -------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one or more stand-in ComfyUI servers.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="First port; further servers use the next ports")
+    parser.add_argument("--servers", type=int, default=1)
+    parser.add_argument("--time-scale", type=float, default=TIME_SCALE)
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="Seconds of 503 answers before the server is ready")
+    parser.add_argument("--output-dir", default=None, help="Also write generated images here (like ComfyUI/output)")
+    args = parser.parse_args()
+
+    servers = [
+        start_fake_comfyui_server(args.port + index, args.time_scale, args.startup_delay, args.output_dir, f"fake-gpu-{index}")
+        for index in range(args.servers)
+    ]
+    for server in servers:
+        print(f"Fake ComfyUI listening on http://127.0.0.1:{server.server_port}")
+    print("Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
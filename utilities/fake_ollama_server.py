@@ -0,0 +1,185 @@
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -------------------------
+# GLOBAL VARIABLES SECTION
+# -------------------------
+
+# Stand-in for a local Ollama server so 1_create_ollama_prompts.py can be exercised on a CPU-only box.
+# Point the client at it with OLLAMA_URL=http://127.0.0.1:<port>.
+DEFAULT_PORT = 11435
+FIRST_TOKEN_LATENCY = 0.05      # Seconds before the first token, on top of prompt processing
+PROMPT_TOKENS_PER_SEC = 2000.0  # Prompt processing rate
+RESPONSE_TOKENS_PER_SEC = 200.0 # Generation rate
+RESPONSE_TOKENS = 60            # Tokens generated per answer (per request id in JSON mode)
+
+FILLER_WORDS = [
+    "a", "vivid", "cinematic", "portrait", "of", "a", "hero", "standing", "in", "neon", "rain,",
+    "dramatic", "lighting,", "ultra", "detailed", "textures,", "watercolor", "splashes", "and",
+    "soft", "bokeh", "background,", "confident", "expression,", "highly", "realistic", "style."
+]
+
+# -------------------------
+# HELPER FUNCTIONS SECTION
+# -------------------------
+
+def count_tokens(text):
+    """Rough token estimate (about 1.3 tokens per word)."""
+    return int(len(text.split()) * 1.3) + 1
+
+def make_answer(token_count, offset=0):
+    """Deterministic filler text of roughly token_count tokens."""
+    words = max(1, int(token_count / 1.3))
+    return " ".join(FILLER_WORDS[(offset + i) % len(FILLER_WORDS)] for i in range(words))
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Implements the parts of the Ollama HTTP API used by utilities/ollama_utils.py."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output readable
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path in ("/", "/api/version"):
+            self.send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self.send_json({"models": [{"name": name} for name in sorted(self.server.models)]})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json({"error": "invalid JSON"}, status=400)
+            return
+
+        if self.path == "/api/pull":
+            self.server.models.add(request.get("model", request.get("name", "")))
+            self.send_json({"status": "success"})
+        elif self.path == "/api/generate":
+            self.handle_generate(request)
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def handle_generate(self, request):
+        settings = self.server.settings
+        with self.server.lock:
+            self.server.request_count += 1
+
+        prompt = request.get("prompt", "")
+        context = request.get("context") or []
+        # With a context the shared prefix is already in the KV cache, so only the new prompt is processed
+        prompt_tokens = count_tokens(prompt)
+        options = request.get("options", {})
+        response_tokens = int(options.get("num_predict", settings["response_tokens"]))
+        if not prompt:
+            response_tokens = 0  # An empty prompt just loads/unloads the model
+
+        request_ids = re.findall(r"Request (\d+):", prompt)
+        if request.get("format") == "json" and request_ids:
+            answer = json.dumps({rid: make_answer(response_tokens, int(rid)) for rid in request_ids})
+            response_tokens *= len(request_ids)
+        else:
+            answer = make_answer(response_tokens) if response_tokens else ""
+
+        prompt_eval_duration = prompt_tokens / settings["prompt_tokens_per_sec"]
+        time.sleep(settings["first_token_latency"] + prompt_eval_duration)
+
+        with self.server.lock:
+            self.server.prompt_tokens += prompt_tokens
+            self.server.response_tokens += response_tokens
+
+        final = {
+            "model": request.get("model", ""),
+            "done": True,
+            "context": list(context) + list(range(prompt_tokens + response_tokens)),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_eval_duration * 1e9),
+            "eval_count": response_tokens,
+        }
+
+        if not request.get("stream", True):
+            time.sleep(response_tokens / settings["response_tokens_per_sec"])
+            final["response"] = answer
+            self.send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ") if answer else []
+        delay = 1.0 / settings["response_tokens_per_sec"]
+        for index, word in enumerate(words):
+            time.sleep(delay)
+            chunk = word if index == 0 else f" {word}"
+            self.write_chunk({"model": final["model"], "response": chunk, "done": False})
+        final["response"] = ""
+        self.write_chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, body):
+        data = (json.dumps(body) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+def start_fake_ollama_server(port=0, first_token_latency=FIRST_TOKEN_LATENCY,
+                             prompt_tokens_per_sec=PROMPT_TOKENS_PER_SEC,
+                             response_tokens_per_sec=RESPONSE_TOKENS_PER_SEC,
+                             response_tokens=RESPONSE_TOKENS):
+    """Start the stand-in server on a background thread. Port 0 picks a free port (see server.server_port)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.settings = {
+        "first_token_latency": first_token_latency,
+        "prompt_tokens_per_sec": prompt_tokens_per_sec,
+        "response_tokens_per_sec": response_tokens_per_sec,
+        "response_tokens": response_tokens,
+    }
+    server.models = set()
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.prompt_tokens = 0
+    server.response_tokens = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# -------------------------
+# MAIN EXECUTION SECTION
+# -------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stand-in Ollama /api/generate server.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--first-token-latency", type=float, default=FIRST_TOKEN_LATENCY)
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=PROMPT_TOKENS_PER_SEC)
+    parser.add_argument("--response-tokens-per-sec", type=float, default=RESPONSE_TOKENS_PER_SEC)
+    parser.add_argument("--response-tokens", type=int, default=RESPONSE_TOKENS)
+    args = parser.parse_args()
+
+    server = start_fake_ollama_server(
+        args.port, args.first_token_latency, args.prompt_tokens_per_sec,
+        args.response_tokens_per_sec, args.response_tokens
+    )
+    print(f"Fake Ollama listening on http://127.0.0.1:{server.server_port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,87 @@
+import threading
+
+LLM = "llm"
+IMAGES = "images"
+
+POLICIES = ("exclusive", "concurrent")
+
+class GpuArbiter:
+    """Decides when the LLM (prompt producer) and ComfyUI (image consumer) may use the GPU.
+
+    Policies:
+      exclusive  - one engine at a time. The LLM keeps the GPU until handoff_size prompts are
+                   waiting (or it runs out of work); ComfyUI then renders until no ready combos
+                   are left. The engine giving up the GPU is asked to unload its models first.
+      concurrent - both engines run whenever they have work (enough VRAM for both).
+    """
+
+    def __init__(self, policy="exclusive", handoff_size=4, unload_hooks=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown GPU arbitration policy '{policy}'. Use one of {POLICIES}.")
+        self.policy = policy
+        self.handoff_size = max(1, handoff_size)
+        self.unload_hooks = unload_hooks or {}
+        self.condition = threading.Condition()
+        self.owner = None
+        self.busy = False
+        self.ready = 0
+        self.producer_done = False
+        self.handoffs = 0
+
+    def _wants(self, engine):
+        if engine == LLM:
+            if self.producer_done:
+                return False
+            return self.ready == 0 if self.owner == IMAGES else self.ready < self.handoff_size
+        if self.ready == 0:
+            return False
+        return self.owner == IMAGES or self.producer_done or self.ready >= self.handoff_size
+
+    def _may_run(self, engine):
+        if self.policy == "concurrent":
+            return True
+        if self.owner in (None, engine):
+            return self._wants(engine)
+        return not self.busy and self._wants(engine) and not self._wants(self.owner)
+
+    def acquire(self, engine):
+        """Block until engine may use the GPU, unloading the other engine's models on a handoff."""
+        with self.condition:
+            while not self._may_run(engine):
+                self.condition.wait(timeout=1)
+            previous = self.owner
+            self.owner = engine
+            self.busy = True
+
+        if self.policy == "exclusive" and previous not in (None, engine):
+            self.handoffs += 1
+            hook = self.unload_hooks.get(previous)
+            if hook:
+                hook()
+
+    def release(self, engine):
+        """Mark the current unit of work as finished so the other engine can be scheduled."""
+        with self.condition:
+            if self.owner == engine:
+                self.busy = False
+            self.condition.notify_all()
+
+    def add_ready(self, count=1):
+        """Record combos whose prompts are ready for image generation."""
+        with self.condition:
+            self.ready += count
+            self.condition.notify_all()
+
+    def combo_done(self):
+        """Record that the image side has finished a ready combo."""
+        with self.condition:
+            self.ready = max(0, self.ready - 1)
+            self.condition.notify_all()
+
+    def finish_producer(self):
+        """The LLM has no more work; the image side may run until the ready combos are drained."""
+        with self.condition:
+            self.producer_done = True
+            if self.owner == LLM:
+                self.busy = False
+            self.condition.notify_all()
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from utilities.logging_utils import iteration_log_rows
+
+# A SQLite catalog of every image 2_create_loop_lora.py saves, written when the image is collected:
+# path, prompt ID, seed, sampler and scheduler, LoRAs and weights, steps, timings and a SHA-256 of the
+# file. folder is where the image is now (relative to the output folder, '.' for the top level);
+# sync_folder() refreshes it after images were moved into subfolders or deleted by hand, and sets it
+# to NULL for images that are gone. Triggers keep image_counts (images per sampler, scheduler and
+# folder) current, so count_faves.py reads a few dozen rows however many images there are.
+# Usage (from the repo root): python -m utilities.image_catalog [--import-log iteration_log.csv] [--sync] [--output-folder api_outputs]
+
+CATALOG_PATH = 'image_catalog.db'
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    image_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    filename TEXT NOT NULL,
+    folder TEXT,
+    prompt_id TEXT,
+    seed INTEGER,
+    sampler TEXT NOT NULL,
+    scheduler TEXT NOT NULL,
+    steps INTEGER,
+    batch_size INTEGER,
+    lora1 TEXT,
+    lora1_weight REAL,
+    lora2 TEXT,
+    lora2_weight REAL,
+    lora3 TEXT,
+    lora3_weight REAL,
+    prompt TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    render_seconds REAL,
+    sha256 TEXT,
+    cataloged_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_by_pair ON images (sampler, scheduler);
+CREATE INDEX IF NOT EXISTS images_by_filename ON images (filename);
+CREATE TABLE IF NOT EXISTS image_counts (
+    sampler TEXT NOT NULL,
+    scheduler TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    images INTEGER NOT NULL,
+    PRIMARY KEY (sampler, scheduler, folder)
+);
+CREATE TRIGGER IF NOT EXISTS count_inserted AFTER INSERT ON images WHEN NEW.folder IS NOT NULL BEGIN
+    INSERT INTO image_counts VALUES (NEW.sampler, NEW.scheduler, NEW.folder, 1)
+    ON CONFLICT (sampler, scheduler, folder) DO UPDATE SET images = images + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS count_deleted AFTER DELETE ON images WHEN OLD.folder IS NOT NULL BEGIN
+    UPDATE image_counts SET images = images - 1
+    WHERE sampler = OLD.sampler AND scheduler = OLD.scheduler AND folder = OLD.folder;
+END;
+CREATE TRIGGER IF NOT EXISTS count_updated AFTER UPDATE OF sampler, scheduler, folder ON images BEGIN
+    UPDATE image_counts SET images = images - 1
+    WHERE OLD.folder IS NOT NULL AND sampler = OLD.sampler AND scheduler = OLD.scheduler AND folder = OLD.folder;
+    INSERT INTO image_counts SELECT NEW.sampler, NEW.scheduler, NEW.folder, 1 WHERE NEW.folder IS NOT NULL
+    ON CONFLICT (sampler, scheduler, folder) DO UPDATE SET images = images + 1;
+END;
+"""
+COLUMNS = (
+    "path", "filename", "folder", "prompt_id", "seed", "sampler", "scheduler", "steps", "batch_size",
+    "lora1", "lora1_weight", "lora2", "lora2_weight", "lora3", "lora3_weight", "prompt",
+    "started_at", "finished_at", "render_seconds", "sha256", "cataloged_at",
+)
+HASH_CHUNK = 1 << 20
+
+def file_sha256(path):
+    """Hex SHA-256 of the file, or None when it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+def relative_folder(path, output_folder):
+    folder = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(output_folder))
+    return folder.replace(os.sep, '/')
+
+def timestamp(value):
+    return value.isoformat(sep=' ', timespec='seconds') if isinstance(value, datetime) else value
+
+def image_row(file_path, output_folder, details):
+    """The COLUMNS values for one image file."""
+    row = {key: timestamp(value) for key, value in details.items()}
+    row.update(path=file_path, filename=os.path.basename(file_path), folder=relative_folder(file_path, output_folder),
+               sha256=file_sha256(file_path), cataloged_at=datetime.now().isoformat(sep=' ', timespec='seconds'))
+    return tuple(row.get(column) for column in COLUMNS)
+
+class ImageCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        # Streaming mode renders on a worker thread; the lock keeps the one connection to one writer at a time
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")  # count_faves.py can read while a run is writing
+        self.connection.executescript(SCHEMA)
+
+    def _insert(self, rows):
+        # An upsert rather than INSERT OR REPLACE: the replace would delete without firing count_deleted
+        updates = ', '.join(f"{column} = excluded.{column}" for column in COLUMNS if column != "path")
+        with self.lock, self.connection:
+            self.connection.executemany(
+                f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                f"ON CONFLICT (path) DO UPDATE SET {updates}", rows
+            )
+
+    def add_images(self, file_paths, output_folder, **details):
+        """Catalog freshly saved images. details holds the other COLUMNS (sampler, scheduler, seed, ...);
+        the file name, folder, hash and cataloged_at are filled in here."""
+        self._insert([image_row(file_path, output_folder, details) for file_path in file_paths])
+
+    def import_iteration_log(self, log_path, output_folder):
+        """Catalog the images listed in iteration_log.csv (or a columnar log directory) that are not in the
+        catalog yet (images made before the catalog existed). The log has no seed or prompt ID.
+        Returns the number added."""
+        known = {row[0] for row in self.query("SELECT path FROM images")}
+        rows = []
+        for row in iteration_log_rows(log_path):
+            file_path = row.get("File Path")
+            if not file_path or file_path in known:
+                continue
+            known.add(file_path)
+            rows.append(image_row(file_path, output_folder, dict(
+                sampler=row["Sampler"], scheduler=row["Scheduler"],
+                steps=row["Inference Steps"], batch_size=row["Latent Batch Amount"],
+                lora2=row["LORA2"], lora3=row["LORA3"], prompt=row.get("Prompt Text"),
+                started_at=row["Start Time"], finished_at=row["End Time"]
+            )))
+        self._insert(rows)
+        return len(rows)
+
+    def sync_folder(self, output_folder):
+        """Point folder at where each image is now, by file name, and NULL it for images that are gone.
+        Returns the image files found that are not in the catalog."""
+        found = []
+        for root, _, files in os.walk(output_folder):
+            folder = os.path.relpath(root, output_folder).replace(os.sep, '/')
+            found.extend((filename, folder) for filename in files if filename.endswith(('.png', '.jpg', '.jpeg')))
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS found (filename TEXT PRIMARY KEY, folder TEXT)")
+            self.connection.execute("DELETE FROM found")
+            self.connection.executemany("INSERT OR REPLACE INTO found VALUES (?, ?)", found)
+            # Only rows whose folder changed, so the count triggers fire for moved and deleted images alone
+            self.connection.execute(
+                "UPDATE images SET folder = (SELECT folder FROM found WHERE found.filename = images.filename) "
+                "WHERE folder IS NOT (SELECT folder FROM found WHERE found.filename = images.filename)"
+            )
+            unknown = [row[0] for row in self.connection.execute(
+                "SELECT filename FROM found WHERE filename NOT IN (SELECT filename FROM images) ORDER BY filename"
+            )]
+        return unknown
+
+    def counts(self, *columns):
+        """{(values of columns): images} for the images still in the output folder, from image_counts.
+        columns are any of sampler, scheduler and folder."""
+        names = ', '.join(columns)
+        rows = self.query(f"SELECT {names}, SUM(images) FROM image_counts GROUP BY {names} HAVING SUM(images) > 0")
+        return {tuple(row)[:-1]: row[-1] for row in rows}
+
+    def query(self, sql, *params):
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def close(self):
+        self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill or refresh the image catalog of 2_create_loop_lora.py.")
+    parser.add_argument("--path", default=CATALOG_PATH)
+    parser.add_argument("--output-folder", default="api_outputs")
+    parser.add_argument("--import-log", metavar="CSV", help="Catalog the images listed in an iteration log")
+    parser.add_argument("--sync", action="store_true", help="Re-read where the images in --output-folder are now")
+    args = parser.parse_args()
+
+    catalog = ImageCatalog(args.path)
+    if args.import_log:
+        print(f"Cataloged {catalog.import_iteration_log(args.import_log, args.output_folder)} images from {args.import_log}.")
+    if args.sync:
+        unknown = catalog.sync_folder(args.output_folder)
+        print(f"Synced {args.output_folder}; {len(unknown)} image files are not in the catalog.")
+    total, present = catalog.query("SELECT COUNT(*), COUNT(folder) FROM images")[0]
+    print(f"{total} images cataloged, {present} still in {args.output_folder}.")
+    catalog.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,29 +2,18 @@ import os
 import re
 import shutil
 import time
-import json
 from datetime import datetime, timedelta
+from utilities.tracing import add_span, span
 
-def load_lora_combos():
-    """Load LoRA combinations from a JSON file."""
-    # Calculate the base filepath relative to the script's directory 
-    base_path = os.path.dirname(os.path.dirname(__file__))
-    filepath = os.path.join(base_path, 'lora_combos.json')
-    
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
-
-def wait_for_images(output_path, wait_time, check_interval, prefix, expected_count, log, loop, start_time_total, start_time_loop, prompt, lora1, lora2, lora3):
+def wait_for_images(output_path, wait_time, check_interval, prefix, expected_count, log, loop, start_time_total, start_time_loop, prompt, lora1, lora2, lora3, context):
     """Wait for multiple image files to appear in the output directory."""
-    # Calls the modified lora loader
-    lora_combos = load_lora_combos()
-    total_combinations = len(lora_combos)
+    total_combinations = len(context.lora_combos)
 
     log(f"Waiting for {expected_count} images with prefix '{prefix}' to appear in {output_path}...")
 
     total_wait_time = 0
     found_files = []
+    wait_start = time.time()
 
     while total_wait_time < wait_time:
         pattern = re.compile(f"{prefix}.*.png")
@@ -43,11 +32,13 @@ def wait_for_images(output_path, wait_time, check_interval, prefix, expected_cou
         loop_elapsed_time = current_time - start_time_loop
 
         # Log estimates for the current loop and entire process
-        log_estimates(log, loop, len(found_files), expected_count, total_elapsed_time, loop_elapsed_time, total_combinations, prompt, lora1, lora2, lora3)
+        remaining_seconds = context.remaining_seconds() if context.remaining_seconds else None
+        log_estimates(log, loop, len(found_files), expected_count, total_elapsed_time, loop_elapsed_time, total_combinations, prompt, lora1, lora2, lora3, context.config, remaining_seconds)
 
         time.sleep(check_interval)
         total_wait_time += check_interval
 
+    add_span("wait_for_images", wait_start, time.time(), prefix=prefix, images=len(found_files), expected=expected_count)
     if len(found_files) >= expected_count:
         log(f"All {expected_count} images created successfully.")
     else:
@@ -56,17 +47,9 @@ def wait_for_images(output_path, wait_time, check_interval, prefix, expected_cou
     return found_files
 
 
-def load_configurations():
-    """Load configurations from global_variables.json."""
-    base_path = os.path.dirname(os.path.dirname(__file__))
-    config_path = os.path.join(base_path, 'global_variables.json')
-    with open(config_path, 'r', encoding='utf-8') as file:
-        configs = json.load(file)
-        return {key: value['value'] for key, value in configs.items()}
-
-def log_estimates(log, loop, images_created, expected_count, total_elapsed_time, loop_elapsed_time, total_combinations, prompt, lora1, lora2, lora3):
-    """Log estimates for the current loop and entire process."""
-    config = load_configurations()
+def log_estimates(log, loop, images_created, expected_count, total_elapsed_time, loop_elapsed_time, total_combinations, prompt, lora1, lora2, lora3, config, remaining_seconds=None):
+    """Log estimates for the current loop and entire process. remaining_seconds (from a per-sampler cost
+    model, see utilities/render_costs.py) replaces the estimate that assumes every image costs the same."""
     total_sampler_scheduler_combinations = len(config['BEST_SAMPLERS_SCHEDULERS'])
 
     completed_images = images_created + (expected_count * loop)
@@ -78,25 +61,14 @@ def log_estimates(log, loop, images_created, expected_count, total_elapsed_time,
 
     total_remaining_images = total_expected_images - completed_images
     estimated_time_remaining = total_elapsed_time.total_seconds() / completed_images * total_remaining_images if completed_images > 0 else 0
+    if remaining_seconds is not None:
+        estimated_time_remaining = remaining_seconds
     estimated_remaining_str = str(timedelta(seconds=int(estimated_time_remaining)))
 
-    # Log for entire process
-    log("\n===Estimates for entire process===")
-    log(f"Total images (Expected): {total_expected_images}")
-    log(f"Total iterations in lora_combos.json: {total_combinations}")
-    log(f"Completed images: {completed_images}")
-    log(f"Total remaining images: {total_remaining_images}")
-    log(f"Total time elapsed: {str(total_elapsed_time)}")
-    log(f"Estimated time remaining: ~{estimated_remaining_str}\n")
-
-    # Log for current loop
-    log("===Estimates for this loop===")
-    log(f"Images: {images_created}/{expected_count}")
-    log(f"Time elapsed: {str(loop_elapsed_time)}")
-    log(f"Prompt: {prompt}")  # Log the prompt
-    log(f"LORA1: {lora1}")
-    log(f"LORA2: {lora2}")
-    log(f"LORA3: {lora3}")
+    # One line for the entire process and one for the current loop; the prompt is logged when it is queued
+    log(f"[ESTIMATE] {completed_images}/{total_expected_images} images ({total_combinations} combos), "
+        f"{total_remaining_images} remaining, elapsed {total_elapsed_time}, ~{estimated_remaining_str} left")
+    log(f"[ESTIMATE] Loop {loop}: {images_created}/{expected_count} images in {loop_elapsed_time} ({lora1}, {lora2}, {lora3})")
 
 def move_and_rename_images(src_path, dest_dir, new_filename_prefix, num_images, delay=5):
     """Move and rename image files to directory with indexed filenames."""
@@ -109,7 +81,8 @@ def move_and_rename_images(src_path, dest_dir, new_filename_prefix, num_images,
         src_filepath = os.path.join(src_path, original_filename)
         dest_filepath = os.path.join(dest_dir, dest_filename)
         
-        time.sleep(delay)  # Ensures file is not in use
+        with span("sleep_before_move", delay=delay):
+            time.sleep(delay)  # Ensures file is not in use
 
         try:
             shutil.move(src_filepath, dest_filepath)
@@ -129,8 +102,9 @@ def create_filename_prefix(prompt_text, sampler_name, scheduler):
 def remove_metadata_if_required(file_path, remove_func, show_func, has_func, log, remove_metadata_after):
     """Remove metadata from the image if REMOVE_METADATA_AFTER is True."""
     if remove_metadata_after:
-        if has_func(file_path):
-            log(f"Removing metadata from {file_path}...")
-            show_func(file_path)
-            remove_func(file_path)
-            show_func(file_path)
\ No newline at end of file
+        with span("strip_metadata", file=os.path.basename(file_path)):
+            if has_func(file_path):
+                log(f"Removing metadata from {file_path}...")
+                show_func(file_path)
+                remove_func(file_path)
+                show_func(file_path)
\ No newline at end of file
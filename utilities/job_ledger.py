@@ -0,0 +1,178 @@
+import json
+import random
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+
+# A SQLite ledger of the jobs 2_create_loop_lora.py plans and finishes. A run is the full
+# NUMBER_OF_LOOPS x combos x samplers plan, stored in render order with a seed per job. Restarting
+# with the same plan (same signature) resumes the open run at the first unfinished job instead of
+# reshuffling. Seeds come from the run's seed_base, so any job can be rendered again on its own.
+# Usage (from the repo root): python -m utilities.job_ledger [--runs | --jobs RUN | --requeue RUN POSITION... | --close RUN]
+
+LEDGER_PATH = 'job_ledger.db'
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    signature TEXT NOT NULL,
+    seed_base INTEGER NOT NULL,
+    jobs_per_loop INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open',
+    created_at TEXT NOT NULL,
+    finished_at TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    position INTEGER NOT NULL,
+    loop INTEGER NOT NULL,
+    job_index INTEGER NOT NULL,
+    lora2 TEXT NOT NULL,
+    lora3 TEXT NOT NULL,
+    sampler_pairs TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'planned',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at TEXT,
+    finished_at TEXT,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (run_id, status, position);
+"""
+
+def plan_signature(**plan):
+    """A stable hash of everything that shapes a run (workflow, loops, combos, samplers, ...)."""
+    return hashlib.sha256(json.dumps(plan, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def job_seed(seed_base, loop, lora2, lora3, sampler_pairs):
+    """The seed of one job, derived only from the run's seed_base and what the job renders."""
+    key = json.dumps([seed_base, loop, lora2, lora3, sampler_pairs])
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=4).digest(), 'big')
+
+def now():
+    return datetime.now().isoformat(timespec='seconds')
+
+class JobLedger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")  # The CLI below can read while a run is writing
+        self.connection.executescript(SCHEMA)
+
+    def open_run(self, signature):
+        """The newest unfinished run with this signature, or None."""
+        row = self.connection.execute(
+            "SELECT run_id FROM runs WHERE signature = ? AND status = 'open' ORDER BY run_id DESC LIMIT 1", (signature,)
+        ).fetchone()
+        return row["run_id"] if row else None
+
+    def create_run(self, signature, jobs_per_loop, jobs, seed_base=None):
+        """Store a new run. jobs yields (loop, job_index, lora2, lora3, sampler_pairs) in render order."""
+        seed_base = random.randint(0, 2**31 - 1) if seed_base is None else seed_base
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (signature, seed_base, jobs_per_loop, created_at) VALUES (?, ?, ?, ?)",
+                (signature, seed_base, jobs_per_loop, now())
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO jobs (run_id, position, loop, job_index, lora2, lora3, sampler_pairs, seed) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (run_id, position, loop, job_index, lora2, lora3, json.dumps(sampler_pairs),
+                     job_seed(seed_base, loop, lora2, lora3, sampler_pairs))
+                    for position, (loop, job_index, lora2, lora3, sampler_pairs) in enumerate(jobs)
+                )
+            )
+        return run_id
+
+    def run_info(self, run_id):
+        return dict(self.connection.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone())
+
+    def pending(self, run_id):
+        """The unfinished jobs of a run in render order, as dicts; sampler_pairs is a tuple of pairs."""
+        rows = self.connection.execute(
+            "SELECT * FROM jobs WHERE run_id = ? AND status != 'done' ORDER BY position", (run_id,)
+        )
+        return [dict(row, sampler_pairs=tuple(tuple(pair) for pair in json.loads(row["sampler_pairs"]))) for row in rows]
+
+    def counts(self, run_id):
+        """{status: number of jobs} for a run."""
+        rows = self.connection.execute("SELECT status, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY status", (run_id,))
+        return {status: count for status, count in rows}
+
+    def _update(self, sql, *params):
+        with self.connection:
+            self.connection.execute(sql, params)
+
+    def mark_started(self, job):
+        self._update(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE run_id = ? AND position = ?",
+            now(), job["run_id"], job["position"]
+        )
+
+    def mark_done(self, job):
+        self._update(
+            "UPDATE jobs SET status = 'done', finished_at = ? WHERE run_id = ? AND position = ?",
+            now(), job["run_id"], job["position"]
+        )
+
+    def mark_failed(self, job):
+        self._update(
+            "UPDATE jobs SET status = 'failed', finished_at = ? WHERE run_id = ? AND position = ?",
+            now(), job["run_id"], job["position"]
+        )
+
+    def finish_run(self, run_id):
+        """Close the run if every job is done; returns True when it was closed."""
+        if set(self.counts(run_id)) - {'done'}:
+            return False
+        self.close_run(run_id)
+        return True
+
+    def close_run(self, run_id):
+        """Stop resuming a run; the next start plans a new one."""
+        self._update("UPDATE runs SET status = 'closed', finished_at = ? WHERE run_id = ?", now(), run_id)
+
+    def requeue(self, run_id, positions):
+        """Mark jobs to be rendered again (same seed) and reopen their run."""
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE jobs SET status = 'planned' WHERE run_id = ? AND position = ?",
+                ((run_id, position) for position in positions)
+            )
+            self.connection.execute("UPDATE runs SET status = 'open', finished_at = NULL WHERE run_id = ?", (run_id,))
+
+    def close(self):
+        self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and edit the job ledger of 2_create_loop_lora.py.")
+    parser.add_argument("--path", default=LEDGER_PATH)
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--runs", action="store_true", help="List the runs (the default)")
+    action.add_argument("--jobs", type=int, metavar="RUN", help="List the jobs of a run with their seeds")
+    action.add_argument("--requeue", type=int, nargs="+", metavar=("RUN", "POSITION"), help="Render these jobs again on the next start")
+    action.add_argument("--close", type=int, metavar="RUN", help="Stop resuming a run")
+    args = parser.parse_args()
+
+    ledger = JobLedger(args.path)
+    if args.jobs is not None:
+        for job in ledger.connection.execute("SELECT * FROM jobs WHERE run_id = ? ORDER BY position", (args.jobs,)):
+            pairs = ", ".join(f"{sampler}/{scheduler}" for sampler, scheduler in json.loads(job["sampler_pairs"]))
+            print(f"{job['position']:>7} loop {job['loop'] + 1:<5} {job['status']:<8} seed {job['seed']:<10} {job['lora2']} + {job['lora3']} [{pairs}]")
+    elif args.requeue:
+        run_id, positions = args.requeue[0], args.requeue[1:]
+        ledger.requeue(run_id, positions)
+        print(f"Requeued {len(positions)} jobs of run {run_id}.")
+    elif args.close is not None:
+        ledger.close_run(args.close)
+        print(f"Closed run {args.close}.")
+    else:
+        for run in ledger.connection.execute("SELECT * FROM runs ORDER BY run_id"):
+            counts = ledger.counts(run["run_id"])
+            print(f"Run {run['run_id']} ({run['status']}, created {run['created_at']}, seed_base {run['seed_base']}): "
+                  f"{counts.get('done', 0)}/{sum(counts.values())} done, {counts.get('failed', 0)} failed")
+    ledger.close()
+
+if __name__ == "__main__":
+    main()
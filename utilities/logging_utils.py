@@ -1,35 +1,191 @@
 import traceback
 import csv
 import os
-from datetime import datetime
+import sys
+import gzip
+import queue
+import shutil
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, MemoryHandler, RotatingFileHandler
 
 # Define constants for log files in the utilities module as they were in the app.py
 LOG_FILE = 'superhero_test_log.txt'
 ITERATION_LOG_FILE = 'iteration_log.csv'
 
-def log(message):
-    """ Log a message both to the console and to a file. """
-    with open(LOG_FILE, 'a') as f:
-        f.write(f"{message}\n")
-    print(message)
+# log() hands records to a queue; a background listener buffers them and writes them to a rotating
+# log file, flushing every FLUSH_INTERVAL seconds, every BUFFER_CAPACITY records or at once on an
+# error. Rotated files are gzipped. LOG_LEVEL (environment or configure_logging) controls what is
+# kept; the full prompt payloads are logged at DEBUG, which is off by default.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+BUFFER_CAPACITY = 200
+FLUSH_INTERVAL = 2.0
+
+logger = logging.getLogger('comfy_scripts')
+logger.propagate = False
+_listener = None
+_buffer = None
+_file_handler = None
+_flusher_stop = None
+_setup_lock = threading.RLock()
+_upgraded_logs = set()  # CSV iteration logs whose header was already checked this run
+_columnar_log = None  # utilities.columnar_log.ColumnarIterationLog while ITERATION_LOG_FORMAT is 'parquet'
+ITERATION_LOG_FORMATS = ('csv', 'parquet')
+
+def gzip_rotator(source, dest):
+    """ Compress a rotated log file instead of keeping it as plain text. """
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def configure_logging(log_file=None, level=None, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, clear=False):
+    """ (Re)start the background log writer. clear=True empties log_file first. """
+    global _listener, _buffer, _file_handler, _flusher_stop
+    with _setup_lock:
+        shutdown_logging()
+
+        file_handler = RotatingFileHandler(
+            log_file or LOG_FILE, mode='w' if clear else 'a',
+            maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.namer = lambda name: name + '.gz'
+        file_handler.rotator = gzip_rotator
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+
+        _buffer = MemoryHandler(BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler, flushOnClose=True)
+        record_queue = queue.SimpleQueue()
+        logger.handlers = [QueueHandler(record_queue)]
+        logger.setLevel(getattr(logging, str(level or LOG_LEVEL).upper(), logging.INFO))
+        _listener = QueueListener(record_queue, _buffer)
+        _listener.start()
+
+        _file_handler = file_handler
+        _flusher_stop = threading.Event()
+        threading.Thread(target=_flush_periodically, args=(_buffer, _flusher_stop), name='log-flusher', daemon=True).start()
+
+def _flush_periodically(buffer, stop):
+    while not stop.wait(FLUSH_INTERVAL):
+        buffer.flush()
+
+def shutdown_logging():
+    """ Write out everything still queued and close the log file. """
+    global _listener, _buffer, _file_handler
+    with _setup_lock:
+        if _flusher_stop is not None:
+            _flusher_stop.set()
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _buffer is not None:
+            _buffer.close()
+            _file_handler.close()
+            _buffer = _file_handler = None
+        logger.handlers = []
+
+atexit.register(shutdown_logging)
+
+def _ensure_configured():
+    with _setup_lock:
+        if _listener is None:
+            configure_logging()
+
+def _format(message, fields):
+    if not fields:
+        return str(message)
+    return f"{message} " + ' '.join(f"{key}={value}" for key, value in fields.items())
+
+def log(message, level=logging.INFO, **fields):
+    """ Log a message both to the console and to a file; extra keyword fields are appended as key=value. """
+    _ensure_configured()
+    if not logger.isEnabledFor(level):
+        return
+    text = _format(message, fields)
+    logger.log(level, text)
+    print(text)
+
+def log_debug(message, **fields):
+    """ Log a message that is only kept when the level is DEBUG (payload dumps and the like). """
+    log(message, logging.DEBUG, **fields)
+
+def log_warning(message, **fields):
+    log(message, logging.WARNING, **fields)
 
 def log_error(message):
     """ Log an error message with traceback both to the console and to a file. """
-    with open(LOG_FILE, 'a') as f:
-        f.write(f"{message}\n")
-        f.write(traceback.format_exc() + "\n")
+    _ensure_configured()
+    details = traceback.format_exc() if sys.exc_info()[0] else ''
+    logger.error(f"{message}\n{details}".rstrip())
     print(message)
-    print(traceback.format_exc())
+    if details:
+        print(details)
+
+ITERATION_LOG_HEADER = [
+    "Iteration Number", "Start Time", "End Time", "Inference Steps",
+    "Latent Batch Amount", "Scheduler", "Sampler",
+    "LORA2", "LORA3", "File Path", "Time to Complete", "Prompt Text", "GPU Seconds Saved"
+]
+
+def upgrade_iteration_log(path):
+    """ Pad a log written before newer columns existed, so old and new rows line up. """
+    with open(path, 'r', newline='') as file:
+        rows = list(csv.reader(file))
+    if not rows or len(rows[0]) >= len(ITERATION_LOG_HEADER):
+        return
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(ITERATION_LOG_HEADER)
+        writer.writerows(row + [''] * (len(ITERATION_LOG_HEADER) - len(row)) for row in rows[1:])
+
+def configure_iteration_log(path=None, log_format='csv', directory='iteration_log'):
+    """ Where log_iteration_details writes: the CSV file at path, or with log_format 'parquet' a columnar
+    log in directory, partitioned by run date (needs pyarrow; see utilities/columnar_log.py). """
+    global ITERATION_LOG_FILE, _columnar_log
+    if log_format not in ITERATION_LOG_FORMATS:
+        raise ValueError(f"Unknown iteration log format '{log_format}'. Use one of {ITERATION_LOG_FORMATS}.")
+    flush_iteration_log()
+    ITERATION_LOG_FILE = path or ITERATION_LOG_FILE
+    _columnar_log = None
+    if log_format == 'parquet':
+        from utilities.columnar_log import ColumnarIterationLog  # pyarrow is only loaded when this log is used
+        _columnar_log = ColumnarIterationLog(directory)
+
+def flush_iteration_log():
+    """ Write the rows the columnar log still buffers (the CSV is written as it goes). """
+    if _columnar_log is not None:
+        _columnar_log.flush()
+
+def iteration_log_rows(path, headers=None):
+    """ The rows of an iteration log as {CSV header: text}, from iteration_log.csv or from a columnar
+    log directory. headers limits the columns read from a columnar log. """
+    if os.path.isdir(path):
+        from utilities.columnar_log import read_text_batches  # pyarrow is only loaded when this log is used
+        for batch in read_text_batches(path, headers):
+            yield from batch.to_pylist()
+        return
+    if not os.path.isfile(path):
+        return
+    with open(path, 'r', newline='') as file:
+        yield from csv.DictReader(file)
 
-def log_iteration_details(iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler, file_paths, lora2, lora3, prompt_text):
-    """ Log details of each iteration in a CSV file. """
-    file_exists = os.path.isfile(ITERATION_LOG_FILE)
+def log_iteration_details(iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler, file_paths, lora2, lora3, prompt_text, gpu_seconds_saved=None):
+    """ Log details of each iteration in a CSV file (or the columnar log, see configure_iteration_log).
+    gpu_seconds_saved is set for TWO_STAGE renders. """
+    if _columnar_log is not None:
+        _columnar_log.append(iter_num, time_start, time_end, inference_steps, latent_batch_amount, scheduler, sampler,
+                             file_paths, lora2, lora3, prompt_text, gpu_seconds_saved)
+        return
+    # The header is checked once per run, not on every call
+    file_exists = ITERATION_LOG_FILE in _upgraded_logs or os.path.isfile(ITERATION_LOG_FILE)
+    if file_exists and ITERATION_LOG_FILE not in _upgraded_logs:
+        upgrade_iteration_log(ITERATION_LOG_FILE)
+    _upgraded_logs.add(ITERATION_LOG_FILE)
     with open(ITERATION_LOG_FILE, 'a', newline='') as file:
         writer = csv.writer(file)
         if not file_exists:
-            writer.writerow(["Iteration Number", "Start Time", "End Time", "Inference Steps", 
-                            "Latent Batch Amount", "Scheduler", "Sampler", 
-                            "LORA2", "LORA3", "File Path", "Time to Complete", "Prompt Text"])
+            writer.writerow(ITERATION_LOG_HEADER)
         for file_path in file_paths:
             writer.writerow([
                 iter_num,
@@ -43,5 +199,6 @@ def log_iteration_details(iter_num, time_start, time_end, inference_steps, laten
                 lora3,
                 file_path,
                 str(time_end - time_start),
-                prompt_text  # Add prompt_text to each row
-            ])
\ No newline at end of file
+                prompt_text,  # Add prompt_text to each row
+                '' if gpu_seconds_saved is None else round(gpu_seconds_saved, 2)
+            ])
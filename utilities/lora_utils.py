@@ -2,15 +2,11 @@ import os
 import json
 import itertools
 import re
+import threading
 from .logging_utils import log
+from .runtime_context import get_runtime_context
 
-def load_configurations():
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'global_variables.json')
-    with open(config_path, 'r', encoding='utf-8') as file:
-        configs = json.load(file)
-        return {key: value['value'] for key, value in configs.items()}
-
-config = load_configurations()
+config = get_runtime_context().config
 LORA_DIRECTORY = config['LORA_DIRECTORY']
 LORA_METADATA_FILENAME = config['LORA_METADATA_FILENAME']
 LORA1_NAME = config['LORA1_NAME']
@@ -18,6 +14,9 @@ OLLAMA_BASE_PROMPT = config['OLLAMA_BASE_PROMPT']
 PROMPT_TEXT = config['PROMPT_TEXT']
 LORA_COMBOS_PATH = config['LORA_COMBOS_PATH']
 
+# Prompt generation and image generation can share lora_combos.json in streaming mode
+LORA_COMBOS_LOCK = threading.Lock()
+
 def cleanse_prompt(text):
     """
     Cleanse the input text by removing non-alphanumeric characters,
@@ -27,6 +26,14 @@ def cleanse_prompt(text):
     cleaned_text = re.sub(r"[^a-zA-Z0-9\s.,!?']", '', text)
     return cleaned_text.strip()
 
+def write_lora_combos(lora_combos, file_path=LORA_COMBOS_PATH, indent=2):
+    """Write the combos atomically so a concurrent reader never sees a half-written file."""
+    with LORA_COMBOS_LOCK:
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(lora_combos, file, indent=indent)
+        os.replace(temp_path, file_path)
+
 def sort_json_by_iteration(file_path):
     # Read the JSON data from the file
     with open(file_path, 'r') as file:
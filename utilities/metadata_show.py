@@ -1,7 +1,5 @@
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
 import os
 
 # Set the file to scan
@@ -23,6 +21,8 @@ def read_metadata_with_pillow(file_path):
 
 def read_metadata_with_hachoir(file_path):
     try:
+        from hachoir.parser import createParser  # Only needed here, so load it on demand
+        from hachoir.metadata import extractMetadata
         parser = createParser(file_path)
         metadata = extractMetadata(parser)
         if metadata:
@@ -0,0 +1,104 @@
+import os
+import threading
+from utilities.logging_utils import log, log_warning
+
+# Knows which model files are present in each MODEL_DIRS folder. The folders are scanned once; after
+# that a background thread stats each folder every POLL_INTERVAL seconds and rescans only the ones
+# whose modification time changed, which stays cheap on network shares. Checks before a job are set
+# lookups, and a watched file that disappears mid-run is reported as soon as the watcher sees it.
+
+POLL_INTERVAL = 5.0
+
+def scan_model_files(root):
+    """File names under root, relative to it with '/' separators (the names ComfyUI uses),
+    and {folder: mtime} for root and every folder below it."""
+    files = set()
+    mtimes = {}
+    for directory, _, filenames in os.walk(root):
+        try:
+            mtimes[directory] = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            continue
+        relative = os.path.relpath(directory, root)
+        for filename in filenames:
+            files.add(filename if relative == '.' else f"{relative}/{filename}".replace(os.sep, '/'))
+    return files, mtimes
+
+def folders_changed(mtimes):
+    """True when any folder was added to, removed from or deleted since mtimes was taken."""
+    for directory, mtime in mtimes.items():
+        try:
+            if os.stat(directory).st_mtime_ns != mtime:
+                return True
+        except FileNotFoundError:
+            return True
+    return not mtimes
+
+class ModelRegistry:
+    """The model files of each category in model_dirs ({'unet': path, 'loras': path, ...})."""
+
+    def __init__(self, model_dirs, poll_interval=POLL_INTERVAL):
+        self.model_dirs = dict(model_dirs)
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.files = {}
+        self.mtimes = {}
+        self.watched = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def refresh(self, force=False):
+        """Rescan the categories whose folders changed. Returns the watched files that went missing."""
+        newly_missing = []
+        for category, root in self.model_dirs.items():
+            if not force and category in self.files and not folders_changed(self.mtimes[category]):
+                continue
+            files, mtimes = scan_model_files(root)
+            with self.lock:
+                previous = self.files.get(category, set())
+                self.files[category] = files
+                self.mtimes[category] = mtimes
+                newly_missing += [(category, name) for name in previous - files if (category, name) in self.watched]
+        for category, name in newly_missing:
+            log_warning(f"[MODELS] '{name}' disappeared from '{self.model_dirs[category]}'.")
+        return newly_missing
+
+    def has(self, category, filename):
+        if category not in self.files:
+            self.refresh()
+        with self.lock:
+            return filename.replace('\\', '/') in self.files.get(category, ())
+
+    def missing(self, required):
+        """The (category, filename) pairs in required that are not present."""
+        return [(category, filename) for category, filename in required if not self.has(category, filename)]
+
+    def validate(self, required):
+        """Check required once and log the result; returns True when every file is present."""
+        self.refresh(force=True)
+        missing = self.missing(required)
+        for category, filename in required:
+            if (category, filename) in missing:
+                log(f"Model file '{filename}' not found in '{self.model_dirs[category]}' directory.")
+            else:
+                log(f"Model file '{filename}' found in '{self.model_dirs[category]}' directory.")
+        return not missing
+
+    def watch(self, required):
+        """Report required files as soon as they go missing, and start the watcher thread."""
+        with self.lock:
+            self.watched.update(required)
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.poll, name='model-registry', daemon=True)
+            self.thread.start()
+
+    def poll(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except OSError as e:
+                log_warning(f"[MODELS] Could not rescan the model folders: {e}")
+
+    def stop(self):
+        self.stop_event.set()
@@ -13,6 +13,8 @@ OLLAMA_PORT = 11434
 OLLAMA_DIRECTORY = Path("ollama")
 OLLAMA_EXECUTABLE = OLLAMA_DIRECTORY / "ollama.exe" if platform.system() == "Windows" else OLLAMA_DIRECTORY / "ollama"
 OLLAMA_PROCESS = None
+# Point the client at another server (e.g. utilities/fake_ollama_server.py) without touching the port checks
+OLLAMA_URL = os.getenv("OLLAMA_URL", f"http://localhost:{OLLAMA_PORT}").rstrip("/")
 
 DEFAULT_MODELS_DIR = Path("D:/ollama_models") if platform.system() == "Windows" else Path.home() / ".ollama" / "models"
 
@@ -126,7 +128,7 @@ def pull_model(model_name):
 
 def get_story_response_from_model(model_name, user_message):
     response = requests.post(
-        f'http://localhost:{OLLAMA_PORT}/api/generate',
+        f'{OLLAMA_URL}/api/generate',
         json={'model': model_name, 'prompt': user_message},
         stream=True
     )
@@ -138,6 +140,39 @@ def get_story_response_from_model(model_name, user_message):
             story += body['response']
     return story
 
+def prime_model_context(model_name, shared_prefix):
+    """Run the shared prompt prefix once and return Ollama's context tokens for reuse."""
+    response = requests.post(
+        f'{OLLAMA_URL}/api/generate',
+        json={
+            'model': model_name,
+            'prompt': f"{shared_prefix} Reply with OK once you have read these instructions.",
+            'stream': False,
+            'options': {'num_predict': 1}
+        }
+    )
+    response.raise_for_status()
+    return response.json().get('context')
+
+def get_structured_response_from_model(model_name, user_message, context=None):
+    """Request a JSON-formatted answer, optionally continuing from a primed context."""
+    payload = {'model': model_name, 'prompt': user_message, 'format': 'json', 'stream': False}
+    if context:
+        payload['context'] = context
+    response = requests.post(f'{OLLAMA_URL}/api/generate', json=payload)
+    response.raise_for_status()
+    body = response.json()
+    return json.loads(body.get('response') or '{}'), body
+
+def unload_ollama_model(model_name):
+    """Ask Ollama to drop the model from VRAM right away instead of after its keep-alive timeout."""
+    try:
+        response = requests.post(f'{OLLAMA_URL}/api/generate', json={'model': model_name, 'keep_alive': 0}, timeout=30)
+        response.raise_for_status()
+        print(f"Unloaded Ollama model {model_name} from VRAM.")
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to unload Ollama model {model_name}: {e}")
+
 def kill_existing_ollama_service():
     for process in psutil.process_iter(['pid', 'name', 'username']):
         try:
@@ -0,0 +1,143 @@
+import os
+import json
+import socket
+import subprocess
+import platform
+import psutil
+
+# Cheap answers to "is something listening on this port, and which process is it?" without
+# enumerating every socket on the system with psutil.net_connections().
+
+TCP_LISTEN_STATE = "0A"  # Socket state code for LISTEN in /proc/net/tcp
+PROC_NET_TCP_FILES = ("/proc/net/tcp", "/proc/net/tcp6")
+CONNECT_TIMEOUT = 0.2  # Seconds; a local listener answers almost instantly
+
+def is_port_in_use(port, host="127.0.0.1"):
+    """Check if something accepts TCP connections on the given local port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.settimeout(CONNECT_TIMEOUT)
+        return s.connect_ex((host, port)) == 0
+
+def launch_process(command, pidfile, cwd=None, new_console=False):
+    """Start command directly (no shell wrapper) and record its PID and start time in pidfile."""
+    kwargs = {"cwd": cwd}
+    if new_console and platform.system() == "Windows":
+        kwargs["creationflags"] = subprocess.CREATE_NEW_CONSOLE
+    process = subprocess.Popen(command, **kwargs)
+    write_pidfile(pidfile, process.pid)
+    return process
+
+def write_pidfile(pidfile, pid):
+    """Record pid together with its creation time, so a recycled PID is not mistaken for ours."""
+    try:
+        create_time = psutil.Process(pid).create_time()
+    except psutil.NoSuchProcess:
+        return
+    with open(pidfile, "w", encoding="utf-8") as file:
+        json.dump({"pid": pid, "create_time": create_time}, file)
+
+def read_pidfile(pidfile):
+    """Return the recorded PID if that exact process is still alive, otherwise remove the stale pidfile."""
+    try:
+        with open(pidfile, "r", encoding="utf-8") as file:
+            record = json.load(file)
+        if abs(psutil.Process(record["pid"]).create_time() - record["create_time"]) < 0.01:
+            return record["pid"]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError, psutil.Error):
+        pass
+    remove_pidfile(pidfile)
+    return None
+
+def remove_pidfile(pidfile):
+    try:
+        os.remove(pidfile)
+    except FileNotFoundError:
+        pass
+
+def listening_socket_inodes(port):
+    """Socket inodes listening on port, read from /proc/net/tcp(6). Returns None where /proc is unavailable."""
+    port_hex = f":{port:04X}"
+    inodes = set()
+    found_table = False
+    for path in PROC_NET_TCP_FILES:
+        try:
+            with open(path, "r") as file:
+                next(file, None)  # Header
+                found_table = True
+                for line in file:
+                    fields = line.split()
+                    # fields: sl, local_address, rem_address, st, ..., inode (index 9)
+                    if fields[1].endswith(port_hex) and fields[3] == TCP_LISTEN_STATE:
+                        inodes.add(fields[9])
+        except OSError:
+            continue
+    return inodes if found_table else None
+
+def process_owns_inodes(pid, inodes):
+    """Check whether pid holds one of the given socket inodes open."""
+    targets = {f"socket:[{inode}]" for inode in inodes}
+    fd_dir = f"/proc/{pid}/fd"
+    try:
+        for fd in os.listdir(fd_dir):
+            try:
+                if os.readlink(os.path.join(fd_dir, fd)) in targets:
+                    return True
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return False
+
+def runs_script(pid, script):
+    """Check whether pid's command line runs script (e.g. ComfyUI's main.py), by file name."""
+    try:
+        return any(os.path.basename(arg) == script for arg in psutil.Process(pid).cmdline())
+    except psutil.Error:
+        return False
+
+def find_port_owner(port, pidfile=None, script=None):
+    """Return the PID listening on port, or None.
+
+    Checks the pidfile first, then the matching /proc/net/tcp entries, and only falls back to a
+    psutil socket scan on systems without /proc (e.g. Windows). With script, only processes whose
+    command line runs it are considered, so the scan skips every other process and never returns
+    an unrelated program that took the port. An owner found by scanning is written to pidfile.
+    """
+    if not is_port_in_use(port):
+        return None
+
+    recorded_pid = read_pidfile(pidfile) if pidfile else None
+    inodes = listening_socket_inodes(port)
+
+    owner = None
+    if inodes is None:
+        if recorded_pid is not None:
+            return recorded_pid  # Port is in use and our launched process is still alive
+        for conn in psutil.net_connections(kind="tcp"):
+            if conn.laddr and conn.laddr.port == port and conn.status == psutil.CONN_LISTEN and (script is None or runs_script(conn.pid, script)):
+                owner = conn.pid
+                break
+    elif recorded_pid is not None and process_owns_inodes(recorded_pid, inodes):
+        return recorded_pid
+    else:
+        for entry in os.listdir("/proc"):
+            if entry.isdigit() and (script is None or runs_script(int(entry), script)) and process_owns_inodes(int(entry), inodes):
+                owner = int(entry)
+                break
+
+    if owner is not None and pidfile:
+        write_pidfile(pidfile, owner)  # The next lookup is answered from the pidfile
+    return owner
+
+def terminate_process(pid, timeout=10):
+    """Terminate pid and wait for it, killing it if it does not exit in time."""
+    try:
+        process = psutil.Process(pid)
+        process.terminate()
+        process.wait(timeout=timeout)
+    except psutil.TimeoutExpired:
+        process.kill()
+    except psutil.NoSuchProcess:
+        pass
@@ -0,0 +1,185 @@
+import re
+import json
+import time
+import argparse
+import importlib
+import numpy as np
+
+# MinHash + LSH near-duplicate detection for the PROMPT_TEXT values in lora_combos.json.
+# Usage (from the repo root): python -m utilities.prompt_dedup [--merge | --regenerate]
+
+SHINGLE_SIZE = 3        # Words per shingle
+NUM_PERMUTATIONS = 64   # MinHash signature length
+BANDS = 16              # LSH bands (NUM_PERMUTATIONS / BANDS rows per band)
+THRESHOLD = 0.8         # Estimated Jaccard similarity at which two prompts count as duplicates
+CHUNK_SHINGLES = 20_000  # Small chunks keep the permutation matrix in cache
+
+WORD_PATTERN = re.compile(r"[a-z0-9']+")
+MIX_CONSTANTS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93], dtype=np.uint64)
+
+def shingle_hashes(prompts, size=SHINGLE_SIZE):
+    """Hash the word n-grams of every prompt in one vectorized pass.
+
+    Returns (hashes, counts): a flat uint64 array of shingle hashes and the number of shingles per
+    prompt. Prompts shorter than size words get a single padded shingle, so every prompt without words
+    hashes alike; find_near_duplicates leaves those out.
+    """
+    vocabulary = {}
+    token_ids = []
+    word_counts = np.empty(len(prompts), dtype=np.int64)
+    for index, prompt in enumerate(prompts):
+        words = WORD_PATTERN.findall((prompt or "").lower())
+        token_ids.extend(vocabulary.setdefault(word, len(vocabulary) + 1) for word in words)
+        token_ids.extend([0] * size)  # Padding keeps n-grams from running into the next prompt
+        word_counts[index] = len(words)
+
+    tokens = np.array(token_ids, dtype=np.uint64)
+    length = len(tokens) - size + 1
+    hashes = np.zeros(length, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(size):
+            hashes ^= tokens[offset:offset + length] * MIX_CONSTANTS[offset % len(MIX_CONSTANTS)]
+
+    # Keep the n-grams that start early enough to lie within their own prompt
+    counts = np.maximum(word_counts - size + 1, 1)
+    tokens_per_prompt = word_counts + size
+    prompt_of_token = np.repeat(np.arange(len(prompts)), tokens_per_prompt)[:length]
+    token_starts = np.cumsum(tokens_per_prompt) - tokens_per_prompt
+    position = np.arange(length) - token_starts[prompt_of_token]
+    return hashes[position < counts[prompt_of_token]], counts
+
+def minhash_signatures(hashes, counts, num_permutations=NUM_PERMUTATIONS, seed=1):
+    """Return an (n, num_permutations) MinHash matrix, computed in vectorized chunks.
+
+    Each permutation is a multiply-shift hash ((a * x + b) mod 2**64) >> 32 with a random odd a.
+    """
+    rng = np.random.default_rng(seed)
+    a = (rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+    b = rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64)[:, None]
+
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    signatures = np.empty((len(counts), num_permutations), dtype=np.uint64)
+    doc = 0
+    with np.errstate(over="ignore"):
+        while doc < len(counts):
+            # Take as many whole prompts as fit in one chunk (at least one)
+            last = max(doc + 1, int(np.searchsorted(ends, starts[doc] + CHUNK_SHINGLES, side="right")))
+            chunk = hashes[starts[doc]:ends[last - 1]]
+            permuted = (a * chunk[None, :] + b) >> np.uint64(32)
+            signatures[doc:last] = np.minimum.reduceat(permuted, starts[doc:last] - starts[doc], axis=1).T
+            doc = last
+    return signatures
+
+def find_parent(parents, index):
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+def find_near_duplicates(prompts, threshold=THRESHOLD, bands=BANDS):
+    """Group prompts whose estimated Jaccard similarity is at least threshold.
+
+    Returns a list of clusters (lists of indices into prompts), largest first; singletons are omitted.
+    Empty prompts (combos Ollama has not answered for yet) are never clustered.
+    """
+    indices = [index for index, prompt in enumerate(prompts) if WORD_PATTERN.search((prompt or "").lower())]
+    if not indices:
+        return []
+    signatures = minhash_signatures(*shingle_hashes([prompts[index] for index in indices]))
+    rows = signatures.shape[1] // bands
+    parents = list(range(len(indices)))
+
+    for band in range(bands):
+        band_rows = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = band_rows.view(np.dtype((np.void, band_rows.dtype.itemsize * rows))).ravel()
+        _, bucket_ids, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = np.flatnonzero(counts[bucket_ids] > 1)
+        if not len(shared):
+            continue
+        # Compare each bucket member with the bucket's first member (a star, not all pairs)
+        order = shared[np.argsort(bucket_ids[shared], kind="stable")]
+        buckets = bucket_ids[order]
+        is_first = np.r_[True, buckets[1:] != buckets[:-1]]
+        representatives = order[np.maximum.accumulate(np.where(is_first, np.arange(len(order)), 0))]
+        members = order[~is_first]
+        heads = representatives[~is_first]
+        similarity = (signatures[members] == signatures[heads]).mean(axis=1)
+        for member, head in zip(members[similarity >= threshold], heads[similarity >= threshold]):
+            root_member, root_head = find_parent(parents, int(member)), find_parent(parents, int(head))
+            if root_member != root_head:
+                parents[max(root_member, root_head)] = min(root_member, root_head)
+
+    clusters = {}
+    for position, index in enumerate(indices):
+        clusters.setdefault(find_parent(parents, position), []).append(index)
+    return sorted((c for c in clusters.values() if len(c) > 1), key=len, reverse=True)
+
+def mark_duplicates(lora_combos, threshold=THRESHOLD):
+    """Set DUPLICATE_OF on every combo whose prompt nearly duplicates an earlier combo's. Returns the clusters."""
+    clusters = find_near_duplicates([combo.get("PROMPT_TEXT", "") for combo in lora_combos], threshold)
+    for combo in lora_combos:
+        combo.pop("DUPLICATE_OF", None)
+    for cluster in clusters:
+        keeper = lora_combos[cluster[0]]["iteration"]
+        for index in cluster[1:]:
+            lora_combos[index]["DUPLICATE_OF"] = keeper
+    return clusters
+
+def report_clusters(lora_combos, clusters, limit=20):
+    duplicates = sum(len(cluster) - 1 for cluster in clusters)
+    print(f"{len(lora_combos)} prompts, {len(clusters)} near-duplicate clusters, {duplicates} redundant prompts.")
+    for cluster in clusters[:limit]:
+        iterations = [lora_combos[index]["iteration"] for index in cluster]
+        print(f"\nCluster of {len(cluster)} (iterations {iterations}):")
+        print(f"  {lora_combos[cluster[0]].get('PROMPT_TEXT', '')[:150]}")
+
+def regenerate_duplicates(lora_combos, clusters):
+    """Ask Ollama again for every non-keeper prompt in the clusters. Their DUPLICATE_OF marks are
+    cleared first, so lora_combos.json (saved after every batch) never pairs a new prompt with an old mark."""
+    prompts_stage = importlib.import_module("1_create_ollama_prompts")
+    from utilities.ollama_utils import install_and_setup_ollama, stop_ollama_service
+
+    to_regenerate = [lora_combos[index] for cluster in clusters for index in cluster[1:]]
+    for combo in to_regenerate:
+        combo.pop("DUPLICATE_OF", None)
+    install_and_setup_ollama(prompts_stage.MODEL_NAME)
+    try:
+        prompts_stage.generate_new_prompts(lora_combos, to_regenerate, prompts_stage.config["OLLAMA_BASE_PROMPT"])
+    finally:
+        stop_ollama_service()
+
+def main():
+    parser = argparse.ArgumentParser(description="Find near-duplicate prompts in lora_combos.json.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--merge", action="store_true", help="Mark duplicates with DUPLICATE_OF so the image loop skips them")
+    action.add_argument("--regenerate", action="store_true", help="Ask Ollama for new prompts for the duplicates")
+    args = parser.parse_args()
+
+    from utilities.lora_utils import LORA_COMBOS_PATH, write_lora_combos
+
+    with open(LORA_COMBOS_PATH, "r", encoding="utf-8") as file:
+        lora_combos = json.load(file)
+
+    start = time.perf_counter()
+    clusters = find_near_duplicates([combo.get("PROMPT_TEXT", "") for combo in lora_combos], args.threshold)
+    print(f"Checked {len(lora_combos)} prompts in {time.perf_counter() - start:.2f}s.")
+    report_clusters(lora_combos, clusters)
+
+    if args.merge:
+        mark_duplicates(lora_combos, args.threshold)
+        write_lora_combos(lora_combos, LORA_COMBOS_PATH)
+        print(f"\nMarked duplicates in {LORA_COMBOS_PATH}.")
+    elif args.regenerate and clusters:
+        merged = any(combo.get("DUPLICATE_OF") for combo in lora_combos)
+        regenerate_duplicates(lora_combos, clusters)
+        remaining = find_near_duplicates([combo.get("PROMPT_TEXT", "") for combo in lora_combos], args.threshold)
+        print(f"\nAfter regeneration: {len(remaining)} clusters remain.")
+        if merged:  # Combos were marked by an earlier --merge; mark what is still duplicated after regeneration
+            mark_duplicates(lora_combos, args.threshold)
+            write_lora_combos(lora_combos, LORA_COMBOS_PATH)
+            print(f"Updated the duplicate marks in {LORA_COMBOS_PATH}.")
+
+if __name__ == "__main__":
+    main()
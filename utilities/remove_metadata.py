@@ -2,7 +2,6 @@
 # utilities/remove_metadata.py
 import os
 import logging
-from PIL import Image
 import time
 
 # Set up logging
@@ -10,6 +9,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def show_metadata(file_path):
     """ Display the metadata of the image file. """
+    from PIL import Image  # Imported here so importing this module stays cheap
     logging.info(f"Metadata for {file_path}:")
     try:
         with Image.open(file_path) as img:
@@ -25,6 +25,7 @@ def show_metadata(file_path):
 
 def has_metadata(file_path):
     """ Check if the image file has metadata. """
+    from PIL import Image
     try:
         with Image.open(file_path) as img:
             img.load()  # Ensuring info is populated for PNG images
@@ -35,6 +36,7 @@ def has_metadata(file_path):
 
 def remove_metadata_in_place(file_path):
     """ Remove all metadata from the image file and save it in place. """
+    from PIL import Image
     try:
         with Image.open(file_path) as img:
             data = img.copy()
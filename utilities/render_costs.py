@@ -0,0 +1,224 @@
+import os
+import csv
+import json
+import argparse
+from datetime import datetime, timedelta
+from utilities.logging_utils import iteration_log_rows
+
+# Learns how long a render takes for each (sampler, scheduler, steps, batch) and plans a sweep against
+# a wall-clock deadline. heun or dpm_adaptive take several times as long as euler, so an ETA that
+# assumes every job costs the same is badly wrong for sweeps that mix them. Costs are ComfyUI execution
+# seconds: they start from iteration_log.csv and sampler_benchmark.csv and are then updated (moving
+# average) from the /history execution times of finished jobs. What a job costs on top of that
+# (queueing, polling for images, moving and stripping them) is learned as one per-job overhead, which
+# the ETA adds to every job. A key that was never seen is estimated from the seconds per step and image
+# of the same sampler, then of all samplers. Costs are kept in render_costs.json.
+# With a deadline (FINISH_BY in global_variables.json), budget_jobs() chooses the jobs that fit:
+# first one job for every LoRA combo, cheapest first, then one for every combo and sampler pairs,
+# then the rest in planned order.
+# Usage (from the repo root): python -m utilities.render_costs [--log iteration_log.csv] [--finish-by 07:00]
+
+COSTS_PATH = 'render_costs.json'
+SMOOTHING = 0.3  # Weight of the newest measurement in the moving average
+DEFAULT_SECONDS_PER_STEP = 1.5  # Per step and image, before anything has been measured
+LOG_COLUMNS = ["Iteration Number", "Start Time", "End Time", "Inference Steps", "Latent Batch Amount", "Scheduler", "Sampler"]
+
+def cost_key(sampler, scheduler, steps, batch):
+    return f"{sampler}|{scheduler}|{int(steps)}|{int(batch)}"
+
+def parse_deadline(text, now=None):
+    """The datetime of FINISH_BY: 'HH:MM' is the next time the clock shows it, else an ISO date and time."""
+    now = now or datetime.now()
+    try:
+        clock = datetime.strptime(text, "%H:%M")
+    except ValueError:
+        return datetime.fromisoformat(text)
+    deadline = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    return deadline if deadline > now else deadline + timedelta(days=1)
+
+def iteration_log_samples(path):
+    """(key, seconds) for each render in iteration_log.csv (or a columnar log directory).
+
+    A job's rows share a start time; with several sampler branches in one prompt each branch ends
+    later than the one before, so a branch costs the time since the previous branch ended.
+    """
+    renders = {}
+    for row in iteration_log_rows(path, LOG_COLUMNS):
+        try:
+            start = datetime.strptime(row["Start Time"], "%Y-%m-%d %H:%M:%S")
+            end = datetime.strptime(row["End Time"], "%Y-%m-%d %H:%M:%S")
+            key = cost_key(row["Sampler"], row["Scheduler"], row["Inference Steps"], row["Latent Batch Amount"])
+        except (KeyError, ValueError):
+            continue
+        renders.setdefault((row["Iteration Number"], start), {})[key] = end  # One row per file, one entry per branch
+
+    samples = []
+    for (_, start), branches in renders.items():
+        previous_end = start
+        for key, end in sorted(branches.items(), key=lambda item: item[1]):
+            if end > previous_end:
+                samples.append((key, (end - previous_end).total_seconds()))
+            previous_end = end
+    return samples
+
+def benchmark_samples(path):
+    """(key, seconds) for each timed row of sampler_benchmark.csv (see utilities/sampler_benchmark.py)."""
+    if not os.path.isfile(path):
+        return []
+    samples = []
+    with open(path, 'r', newline='') as file:
+        for row in csv.DictReader(file):
+            try:
+                samples.append((cost_key(row["sampler"], row["scheduler"], row["steps"], row["batch"]), float(row["execution_seconds"])))
+            except (KeyError, ValueError):
+                continue
+    return samples
+
+class RenderCostModel:
+    """Seconds per render by cost_key(), learned from history and from the jobs of this run."""
+
+    def __init__(self, path=COSTS_PATH, smoothing=SMOOTHING):
+        self.path = path
+        self.smoothing = smoothing
+        self.costs = {}
+        self.overhead = {"seconds": 0.0, "count": 0}  # Seconds per job beyond ComfyUI's execution
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+            if "renders" in saved:
+                self.costs = saved["renders"]
+                self.overhead = saved.get("job_overhead", self.overhead)
+            else:
+                self.costs = saved  # Written before the overhead was learned
+
+    def learn(self, samples):
+        """Fold (key, seconds) samples into the averages, oldest first."""
+        for key, seconds in samples:
+            entry = self.costs.get(key)
+            if entry is None:
+                self.costs[key] = {"seconds": seconds, "count": 1}
+            else:
+                entry["seconds"] += self.smoothing * (seconds - entry["seconds"])
+                entry["count"] += 1
+
+    def seconds_per_step(self, sampler=None):
+        """Mean seconds per step and image over the keys of sampler (all keys if None), or None."""
+        rates = []
+        for key, entry in self.costs.items():
+            key_sampler, _, steps, batch = key.split("|")
+            if sampler is None or key_sampler == sampler:
+                rates.append(entry["seconds"] / (int(steps) * int(batch)))
+        return sum(rates) / len(rates) if rates else None
+
+    def estimate(self, sampler, scheduler, steps, batch):
+        """Seconds for one render; falls back to the sampler's, then everyone's, seconds per step."""
+        entry = self.costs.get(cost_key(sampler, scheduler, steps, batch))
+        if entry:
+            return entry["seconds"]
+        rate = self.seconds_per_step(sampler) or self.seconds_per_step() or DEFAULT_SECONDS_PER_STEP
+        return rate * steps * batch
+
+    def job_seconds(self, renders, overhead=True):
+        """Seconds for a job made of renders, a list of (sampler, scheduler, steps, batch), plus the
+        per-job overhead unless overhead is False (jobs overlapped by the dispatcher)."""
+        return sum(self.estimate(*render) for render in renders) + (self.overhead["seconds"] if overhead else 0.0)
+
+    def observe(self, renders, seconds, wall_seconds=None):
+        """Learn from a finished job that ComfyUI executed in seconds; they are split over its renders in
+        proportion to their estimates. A render listed several times (draft seeds) is learned once, from
+        the share of one copy. wall_seconds, the job's time end to end, teaches the per-job overhead."""
+        estimates = {cost_key(*render): self.estimate(*render) for render in renders}
+        total = sum(self.estimate(*render) for render in renders)
+        self.learn((key, seconds * estimate / total) for key, estimate in estimates.items())
+        if wall_seconds is not None:
+            overhead = max(wall_seconds - seconds, 0.0)
+            if self.overhead["count"]:
+                self.overhead["seconds"] += self.smoothing * (overhead - self.overhead["seconds"])
+            else:
+                self.overhead["seconds"] = overhead
+            self.overhead["count"] += 1
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({"renders": self.costs, "job_overhead": self.overhead}, file, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+def load_cost_model(path=COSTS_PATH, iteration_log=None, benchmark_results=None):
+    """The saved model; on first use it is seeded from the iteration log and benchmark results."""
+    model = RenderCostModel(path)
+    if not model.costs:
+        model.learn(iteration_log_samples(iteration_log) if iteration_log else [])
+        # Last, so the benchmark's execution seconds outweigh the log's times, which include moving the files
+        model.learn(benchmark_samples(benchmark_results) if benchmark_results else [])
+        if model.costs:
+            model.save()
+    return model
+
+def budget_jobs(jobs, job_seconds, budget_seconds, coverage=(), covered=None):
+    """The jobs to run within budget_seconds, in the order to run them.
+
+    coverage lists key functions, most important first (e.g. the LoRA combo, then the combo and its
+    sampler pairs). For each, the cheapest job of every key not yet covered is taken, cheapest key
+    first, while the budget lasts; then the remaining jobs that fit, in their given order. Jobs picked
+    for an earlier key come first, so running out of time drops the least new coverage.
+    covered holds a set of already covered keys per coverage function.
+    """
+    covered = [set(keys) for keys in covered] if covered else [set() for _ in coverage]
+    seconds = [job_seconds(job) for job in jobs]
+    chosen, order = set(), []
+    remaining = budget_seconds
+
+    for level, key_of in enumerate(coverage):
+        cheapest = {}
+        for index, job in enumerate(jobs):
+            key = key_of(job)
+            if index not in chosen and key not in covered[level] and (key not in cheapest or seconds[index] < seconds[cheapest[key]]):
+                cheapest[key] = index
+        picked = []
+        for key, index in sorted(cheapest.items(), key=lambda item: seconds[item[1]]):
+            if seconds[index] > remaining:
+                break
+            remaining -= seconds[index]
+            picked.append(index)
+            chosen.add(index)
+            for deeper, deeper_key_of in enumerate(coverage):
+                covered[deeper].add(deeper_key_of(jobs[index]))
+        order.extend(sorted(picked))  # Within a level keep the planned (cache friendly) order
+
+    for index in range(len(jobs)):
+        if index not in chosen and seconds[index] <= remaining:
+            remaining -= seconds[index]
+            order.append(index)
+    return [jobs[index] for index in order]
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the learned render costs and how much fits before a deadline.")
+    parser.add_argument("--path", default=COSTS_PATH)
+    parser.add_argument("--log", default="iteration_log.csv", help="Seeds the model when --path does not exist yet (a CSV or columnar log)")
+    parser.add_argument("--benchmark", default="sampler_benchmark.csv")
+    parser.add_argument("--finish-by", help="HH:MM or an ISO date and time")
+    args = parser.parse_args()
+
+    model = load_cost_model(args.path, args.log, args.benchmark)
+    if not model.costs:
+        print(f"No render times yet; estimates use {DEFAULT_SECONDS_PER_STEP}s per step and image.")
+        return
+    print(f"{'sampler':<16} {'scheduler':<14} {'steps':>5} {'batch':>5} {'seconds':>9} {'s/step':>7} {'samples':>7}")
+    for key in sorted(model.costs, key=lambda key: model.costs[key]["seconds"]):
+        sampler, scheduler, steps, batch = key.split("|")
+        entry = model.costs[key]
+        print(f"{sampler:<16} {scheduler:<14} {steps:>5} {batch:>5} {entry['seconds']:>9.1f} "
+              f"{entry['seconds'] / (int(steps) * int(batch)):>7.2f} {entry['count']:>7}")
+    print(f"Per-job overhead: {model.overhead['seconds']:.1f}s ({model.overhead['count']} jobs)")
+    if args.finish_by:
+        budget = (parse_deadline(args.finish_by) - datetime.now()).total_seconds()
+        print(f"\n{timedelta(seconds=int(max(budget, 0)))} until {parse_deadline(args.finish_by):%Y-%m-%d %H:%M}:")
+        for key in sorted(model.costs):
+            print(f"  {key.replace('|', ' '):<40} about {int(max(budget, 0) // model.costs[key]['seconds'])} renders")
+
+if __name__ == "__main__":
+    main()
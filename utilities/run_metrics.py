@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utilities.logging_utils import log, log_warning
+
+# Live numbers for a long 2_create_loop_lora.py run: images/sec, jobs completed and failed, the
+# ComfyUI queue depth, the mean seconds of each stage (queue, draft, render, move, job) and the
+# seconds the GPU sat idle between our prompts: the gaps between one prompt's execution and the next on
+# the same server, from ComfyUI's /history timestamps (so with several servers, each GPU counts).
+# They are served in the Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics (JSON at
+# /metrics.json) and written to METRICS_JSON_PATH every METRICS_INTERVAL seconds.
+# Scrape config: - job_name: comfy_loop / static_configs: [{targets: ["127.0.0.1:<METRICS_PORT>"]}]
+
+PREFIX = "comfy_loop"
+DEFAULT_INTERVAL = 15
+
+class RunMetrics:
+    """Counters for one run; every method is safe to call from any thread."""
+
+    def __init__(self, queue_depth=None):
+        self.lock = threading.Lock()
+        self.queue_depth_source = queue_depth  # Callable returning the ComfyUI queue depth
+        self.started_at = time.time()
+        self.images = 0
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.queue_depth = None
+        self.stages = {}  # stage -> [count, total seconds]
+        self.gpu_idle_seconds = 0.0
+        self.last_execution_end = {}  # server -> end of the last prompt it executed, on its clock
+
+    def job_done(self, images):
+        with self.lock:
+            self.jobs_completed += 1
+            self.images += images
+
+    def job_failed(self):
+        with self.lock:
+            self.jobs_failed += 1
+
+    def add_stage(self, stage, seconds):
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextmanager
+    def stage(self, stage):
+        """Time the body as one run of stage."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.time() - start)
+
+    def gpu_executed(self, server, windows):
+        """server executed prompts over windows ((start, end) epoch seconds on its clock, from /history).
+        The gap before each one since the previous prompt on that server counts as idle GPU time; the
+        idle time after the last prompt is only counted once the next one has run."""
+        with self.lock:
+            for start, end in sorted(windows):
+                previous_end = self.last_execution_end.get(server)
+                if previous_end is not None and start > previous_end:
+                    self.gpu_idle_seconds += start - previous_end
+                self.last_execution_end[server] = max(end, previous_end or end)
+
+    def poll_queue_depth(self):
+        if self.queue_depth_source is None:
+            return
+        try:
+            depth = self.queue_depth_source()
+        except Exception:
+            depth = None  # ComfyUI busy or restarting; reported as unknown
+        with self.lock:
+            self.queue_depth = depth
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            elapsed = now - self.started_at
+            return {
+                "updated_at": now,
+                "elapsed_seconds": round(elapsed, 3),
+                "images": self.images,
+                "images_per_second": round(self.images / elapsed, 6) if elapsed > 0 else 0.0,
+                "jobs_completed": self.jobs_completed,
+                "jobs_failed": self.jobs_failed,
+                "queue_depth": self.queue_depth,
+                "gpu_idle_seconds": round(self.gpu_idle_seconds, 3),
+                "stages": {
+                    stage: {"count": count, "total_seconds": round(total, 3), "mean_seconds": round(total / count, 3)}
+                    for stage, (count, total) in sorted(self.stages.items())
+                },
+            }
+
+def prometheus_text(snapshot):
+    """The snapshot in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{PREFIX}_{name}{labels} {value}")
+
+    metric("images_total", "counter", "Images saved by finished jobs.", [("", snapshot["images"])])
+    metric("images_per_second", "gauge", "Images per second since the run started.", [("", snapshot["images_per_second"])])
+    metric("jobs_completed_total", "counter", "Jobs that finished with their images.", [("", snapshot["jobs_completed"])])
+    metric("jobs_failed_total", "counter", "Jobs that failed.", [("", snapshot["jobs_failed"])])
+    if snapshot["queue_depth"] is not None:
+        metric("queue_depth", "gauge", "Prompts running or pending in ComfyUI.", [("", snapshot["queue_depth"])])
+    metric("gpu_idle_seconds_total", "counter", "Seconds ComfyUI sat idle between our prompts.", [("", snapshot["gpu_idle_seconds"])])
+    metric("elapsed_seconds", "gauge", "Seconds since the run started.", [("", snapshot["elapsed_seconds"])])
+    stages = snapshot["stages"].items()
+    metric("stage_seconds", "summary", "Seconds spent per stage of a job.",
+           [(f'_sum{{stage="{stage}"}}', totals["total_seconds"]) for stage, totals in stages]
+           + [(f'_count{{stage="{stage}"}}', totals["count"]) for stage, totals in stages])
+    return "\n".join(lines) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Scrapes would flood the console
+
+    def do_GET(self):
+        snapshot = self.server.metrics.snapshot()
+        if self.path == "/metrics":
+            body, content_type = prometheus_text(snapshot), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot, indent=2), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MetricsExporter:
+    """Serves the metrics over HTTP (when port is set) and rewrites json_path (when set) every interval."""
+
+    def __init__(self, metrics, port=None, json_path=None, interval=DEFAULT_INTERVAL, host="127.0.0.1"):
+        self.metrics = metrics
+        self.json_path = json_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server = None
+        if port:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.metrics = metrics
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            log(f"[METRICS] Serving http://{host}:{self.server.server_address[1]}/metrics")
+        self.writer = threading.Thread(target=self.update_loop, daemon=True)
+        self.writer.start()
+
+    def write_json(self):
+        if not self.json_path:
+            return
+        temp_path = f"{self.json_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.metrics.snapshot(), file, indent=2)
+            os.replace(temp_path, self.json_path)
+        except OSError as e:
+            log_warning(f"[METRICS] Could not write {self.json_path}: {e}")
+
+    def update_loop(self):
+        while not self.stopped.is_set():
+            self.metrics.poll_queue_depth()
+            self.write_json()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        """Write the final numbers and stop serving."""
+        self.stopped.set()
+        self.writer.join()
+        self.write_json()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
@@ -0,0 +1,92 @@
+import os
+import json
+import threading
+from utilities.tracing import span
+
+# One place to load global_variables.json and lora_combos.json. Scripts get the shared context with
+# get_runtime_context() and pass it to the code that runs in the image loop, so nothing re-reads the
+# files on every poll. Set RELOAD_ON_CHANGE to true in global_variables.json to pick up edits made
+# while a run is in progress (checked with a cheap os.stat, re-read only when the file changed).
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'global_variables.json')
+
+def load_configurations(config_path):
+    with open(config_path, 'r', encoding='utf-8') as file:
+        configs = json.load(file)
+        return {key: value['value'] for key, value in configs.items()}
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class RuntimeContext:
+    """Configuration and LoRA combos, loaded on first use and cached for the rest of the run."""
+
+    def __init__(self, config_path=None, reload_on_change=None):
+        self.config_path = config_path or os.getenv('GLOBAL_VARIABLES_PATH', DEFAULT_CONFIG_PATH)
+        self.reload_on_change = reload_on_change
+        self.lock = threading.RLock()
+        self._config = None
+        self._config_mtime = None
+        self._lora_combos = None
+        self._lora_combos_mtime = None
+        self.remaining_seconds = None  # Set by a script that can estimate the seconds left in its run (see wait_for_images)
+
+    @property
+    def config(self):
+        with self.lock:
+            if self._config is None or (self.reload_on_change and file_mtime(self.config_path) != self._config_mtime):
+                self._config_mtime = file_mtime(self.config_path)
+                with span("load_config"):
+                    self._config = load_configurations(self.config_path)
+                if self.reload_on_change is None:
+                    self.reload_on_change = bool(self._config.get('RELOAD_ON_CHANGE', False))
+            return self._config
+
+    @property
+    def lora_combos_path(self):
+        return self.config['LORA_COMBOS_PATH']
+
+    @property
+    def lora_combos(self):
+        """The combos list; an empty list if lora_combos.json does not exist yet."""
+        with self.lock:
+            path = self.lora_combos_path
+            if self._lora_combos is None or (self.reload_on_change and file_mtime(path) != self._lora_combos_mtime):
+                self._lora_combos_mtime = file_mtime(path)
+                if self._lora_combos_mtime is None:
+                    self._lora_combos = []
+                else:
+                    with span("load_lora_combos"), open(path, 'r', encoding='utf-8') as file:
+                        self._lora_combos = json.load(file)
+            return self._lora_combos
+
+    def save_lora_combos(self, lora_combos):
+        """Write lora_combos.json and keep the written list as the cached copy."""
+        from utilities.lora_utils import write_lora_combos  # lora_utils itself reads its config from this module
+
+        with self.lock:
+            path = self.lora_combos_path
+            with span("save_lora_combos"):
+                write_lora_combos(lora_combos, path)
+            self._lora_combos = lora_combos
+            self._lora_combos_mtime = file_mtime(path)
+
+    def invalidate(self):
+        """Drop the cached files so the next access reads them again."""
+        with self.lock:
+            self._config = None
+            self._lora_combos = None
+
+_context = None
+_context_lock = threading.Lock()
+
+def get_runtime_context():
+    """Return the process-wide RuntimeContext, creating it on first use."""
+    global _context
+    with _context_lock:
+        if _context is None:
+            _context = RuntimeContext()
+        return _context
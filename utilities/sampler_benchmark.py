@@ -0,0 +1,276 @@
+import argparse
+import csv
+import importlib
+import itertools
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import requests
+from utilities.comfy_client import ComfyClient
+from utilities.comfy_dispatcher import execution_seconds
+from utilities.workflow_template import FLUX_LORA_BINDINGS, WorkflowTemplate
+
+try:
+    import websocket  # websocket-client; optional, gives per-step timings
+except ImportError:
+    websocket = None
+
+# Benchmarks sampler/scheduler pairs on ComfyUI's own timings instead of queue-to-file wall clock,
+# so polling intervals and DELAY_BEFORE_MOVE do not count. With websocket-client installed each job
+# is timed from ComfyUI's websocket events (execution_start, progress per sampling step,
+# execution_success) and s/it comes from the progress events alone. Without it the /history
+# timestamps are used and s/it is execution time / steps, which also counts decoding and saving.
+# A second client polls /system_stats for the peak VRAM in use while each job runs.
+# Results are appended to sampler_benchmark.csv under a run id, so runs can be compared.
+# Usage (from the repo root):
+#   python -m utilities.sampler_benchmark [--pairs euler/simple heun/beta] [--steps 20 30] [--batch 1 2] [--fake]
+#   python -m utilities.sampler_benchmark --runs | --compare RUN_A RUN_B
+
+RESULTS_PATH = 'sampler_benchmark.csv'
+RESULT_COLUMNS = [
+    "run", "device", "sampler", "scheduler", "steps", "batch", "source",
+    "execution_seconds", "seconds_per_iteration", "images_per_second", "peak_vram_mb",
+]
+POLL_INTERVAL = 0.5
+VRAM_POLL_INTERVAL = 0.2
+JOB_TIMEOUT = 1800
+
+class EventListener:
+    """Collects the websocket events of each prompt queued with client's client_id."""
+
+    def __init__(self, client):
+        url = client.base_url.replace("http", "ws", 1) + f"/ws?clientId={client.client_id}"
+        self.socket = websocket.create_connection(url, timeout=10)
+        self.socket.settimeout(1.0)
+        self.events = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.receive, name='comfy-events', daemon=True)
+        self.thread.start()
+
+    def receive(self):
+        while not self.stop_event.is_set():
+            try:
+                message = self.socket.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except (websocket.WebSocketException, OSError):
+                break
+            if not isinstance(message, str):
+                continue  # Binary frames are preview images
+            event = json.loads(message)
+            data = event.get("data") or {}
+            if data.get("prompt_id"):
+                with self.lock:
+                    self.events.setdefault(data["prompt_id"], []).append((time.time(), event["type"], data))
+
+    def events_for(self, prompt_id):
+        with self.lock:
+            return list(self.events.pop(prompt_id, []))
+
+    def close(self):
+        self.stop_event.set()
+        self.socket.close()
+
+class VramMonitor:
+    """Polls /system_stats on its own connection and keeps the peak VRAM use since the last reset()."""
+
+    def __init__(self, base_url, interval=VRAM_POLL_INTERVAL):
+        self.client = ComfyClient(base_url, retries=0)
+        self.interval = interval
+        self.peak = 0
+        self.device = "unknown"
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.poll, name='vram-monitor', daemon=True)
+        self.thread.start()
+
+    def poll(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                device = self.client.system_stats().get("devices", [{}])[0]
+            except (requests.exceptions.RequestException, ValueError, IndexError):
+                continue
+            with self.lock:
+                self.peak = max(self.peak, device.get("vram_total", 0) - device.get("vram_free", 0))
+                self.device = device.get("name", self.device)
+
+    def reset(self):
+        """The peak VRAM in bytes since the previous reset()."""
+        with self.lock:
+            peak, self.peak = self.peak, 0
+        return peak
+
+    def stop(self):
+        self.stop_event.set()
+
+def measure_events(events):
+    """(execution seconds, seconds per sampling step) from one prompt's websocket events."""
+    start = end = None
+    progress = {}
+    for received, event_type, data in events:
+        if event_type == "execution_start":
+            start = received
+        elif event_type == "execution_success" or (event_type == "executing" and data.get("node") is None):
+            end = end or received
+        elif event_type == "progress":
+            progress.setdefault(data.get("node"), []).append((received, data["value"]))
+    if start is None or end is None:
+        return None, None
+    # Time from the first to the last step of each sampler node; the first step's setup is left out
+    seconds = sum(steps[-1][0] - steps[0][0] for steps in progress.values())
+    counted = sum(steps[-1][1] - steps[0][1] for steps in progress.values())
+    return end - start, (seconds / counted if counted else None)
+
+def wait_for_history(client, prompt_id, timeout=JOB_TIMEOUT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        entry = client.history(prompt_id).get(prompt_id)
+        if entry:
+            return entry
+        time.sleep(POLL_INTERVAL)
+    return None
+
+def benchmark_job(client, template, values, listener, monitor, sampler, scheduler, steps, batch):
+    """Render one (sampler, scheduler, steps, batch) job and return its result row, or None if it failed."""
+    prompt_json = template.render(
+        **values, sampler=sampler, scheduler=scheduler, steps=steps, batch_amount=batch,
+        filename_prefix=f"benchmark_{sampler}_{scheduler}_{steps}_{batch}"
+    )
+    monitor.reset()
+    record = {"submitted_at": time.time()}
+    prompt_id = client.queue_prompt(prompt_json)["prompt_id"]
+    entry = wait_for_history(client, prompt_id)
+    record["finished_at"] = time.time()
+    peak_vram = monitor.reset()
+    if not entry or not entry.get("status", {}).get("completed"):
+        return None
+
+    seconds, seconds_per_iteration = measure_events(listener.events_for(prompt_id)) if listener else (None, None)
+    source = "events"
+    if seconds is None or seconds_per_iteration is None:
+        seconds = execution_seconds(entry["status"], record)
+        seconds_per_iteration = seconds / steps
+        source = "history"
+    return {
+        "device": monitor.device, "sampler": sampler, "scheduler": scheduler, "steps": steps, "batch": batch,
+        "source": source, "execution_seconds": round(seconds, 3),
+        "seconds_per_iteration": round(seconds_per_iteration, 4),
+        "images_per_second": round(batch / seconds, 4) if seconds else 0.0,
+        "peak_vram_mb": round(peak_vram / 1024 ** 2),
+    }
+
+def run_benchmark(client, template, values, pairs, steps_list, batch_list):
+    """Benchmark every combination; returns the result rows tagged with a new run id."""
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    listener = EventListener(client) if websocket else None
+    monitor = VramMonitor(client.base_url)
+    seeds = itertools.count(1)  # A new seed per job, so ComfyUI cannot answer from its cache
+    rows = []
+    try:
+        print(f"Run {run_id}: timing from {'websocket events' if listener else '/history (install websocket-client for per-step timings)'}.")
+        # The first prompt also loads the models; keep that out of the results
+        benchmark_job(client, template, dict(values, seed=next(seeds)), listener, monitor, *pairs[0], steps_list[0], 1)
+        for (sampler, scheduler), steps, batch in itertools.product(pairs, steps_list, batch_list):
+            row = benchmark_job(client, template, dict(values, seed=next(seeds)), listener, monitor, sampler, scheduler, steps, batch)
+            if row is None:
+                print(f"{sampler}/{scheduler} steps={steps} batch={batch}: failed")
+                continue
+            rows.append(dict(row, run=run_id))
+            print(f"{sampler}/{scheduler} steps={steps} batch={batch}: {row['seconds_per_iteration']:.3f} s/it, "
+                  f"{row['images_per_second']:.3f} images/sec, peak {row['peak_vram_mb']} MB")
+    finally:
+        monitor.stop()
+        if listener:
+            listener.close()
+    return rows
+
+def save_results(rows, path=RESULTS_PATH):
+    file_exists = os.path.isfile(path)
+    with open(path, 'a', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def load_results(path=RESULTS_PATH):
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'r', newline='') as file:
+        return list(csv.DictReader(file))
+
+def print_table(rows):
+    print(f"\n{'Sampler':<22}{'Scheduler':<14}{'Steps':>6}{'Batch':>6}{'s/it':>9}{'img/s':>9}{'VRAM MB':>9}  Source")
+    for row in sorted(rows, key=lambda row: float(row["seconds_per_iteration"])):
+        print(f"{row['sampler']:<22}{row['scheduler']:<14}{row['steps']:>6}{row['batch']:>6}"
+              f"{float(row['seconds_per_iteration']):>9.3f}{float(row['images_per_second']):>9.3f}{row['peak_vram_mb']:>9}  {row['source']}")
+
+def compare_runs(rows, run_a, run_b):
+    """Print s/it and images/sec of two runs side by side for the jobs both ran."""
+    def by_job(run_id):
+        return {(row["sampler"], row["scheduler"], row["steps"], row["batch"]): row for row in rows if row["run"] == run_id}
+
+    first, second = by_job(run_a), by_job(run_b)
+    print(f"{'Sampler/scheduler':<34}{'Steps':>6}{'Batch':>6}{'s/it A':>9}{'s/it B':>9}{'change':>9}{'img/s A':>9}{'img/s B':>9}")
+    for key in sorted(set(first) & set(second)):
+        a, b = first[key], second[key]
+        seconds_a, seconds_b = float(a["seconds_per_iteration"]), float(b["seconds_per_iteration"])
+        change = (seconds_b - seconds_a) / seconds_a * 100 if seconds_a else 0.0
+        print(f"{key[0] + '/' + key[1]:<34}{key[2]:>6}{key[3]:>6}{seconds_a:>9.3f}{seconds_b:>9.3f}{change:>+8.1f}%"
+              f"{float(a['images_per_second']):>9.3f}{float(b['images_per_second']):>9.3f}")
+
+def load_template(config):
+    """The image workflow with the models and LoRAs of global_variables.json; steps stay a slot."""
+    create = importlib.import_module('2_create_loop_lora')
+    constants = {name: value for name, value in create.workflow_constants().items() if name != "steps"}
+    with open(config['WORKFLOW_PATH'], 'r', encoding='utf-8') as file:
+        return WorkflowTemplate(json.load(file), FLUX_LORA_BINDINGS, constants)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sampler/scheduler pairs on ComfyUI's execution events.")
+    parser.add_argument("--pairs", nargs="+", metavar="SAMPLER/SCHEDULER", help="Default: BEST_SAMPLERS_SCHEDULERS")
+    parser.add_argument("--steps", nargs="+", type=int, help="Default: INFERENCE_STEPS")
+    parser.add_argument("--batch", nargs="+", type=int, default=[1])
+    parser.add_argument("--server", help="Default: SERVER_ADDRESS")
+    parser.add_argument("--fake", action="store_true", help="Run against a local stand-in server (utilities/fake_comfyui_server.py)")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--runs", action="store_true", help="List the stored runs")
+    parser.add_argument("--compare", nargs=2, metavar=("RUN_A", "RUN_B"), help="Compare two stored runs")
+    args = parser.parse_args()
+
+    if args.runs or args.compare:
+        rows = load_results(args.output)
+        if args.compare:
+            compare_runs(rows, *args.compare)
+        else:
+            for run_id, run_rows in itertools.groupby(rows, key=lambda row: row["run"]):
+                run_rows = list(run_rows)
+                print(f"{run_id}: {len(run_rows)} jobs on {run_rows[0]['device']}")
+        return
+
+    from utilities.runtime_context import get_runtime_context
+    context = get_runtime_context()
+    config = context.config
+    pairs = [tuple(pair.split("/", 1)) for pair in args.pairs] if args.pairs else [tuple(pair) for pair in config['BEST_SAMPLERS_SCHEDULERS']]
+    steps_list = args.steps or [config['INFERENCE_STEPS']]
+
+    server_address = args.server or config['SERVER_ADDRESS']
+    if args.fake:
+        from utilities.fake_comfyui_server import start_fake_comfyui_server
+        server = start_fake_comfyui_server(0)
+        server_address = f"http://127.0.0.1:{server.server_port}"
+
+    values = {"prompt": config['PROMPT_TEXT']}
+    if context.lora_combos:
+        values.update(lora2=context.lora_combos[0]['LORA2']['name'], lora3=context.lora_combos[0]['LORA3']['name'])
+
+    client = ComfyClient(server_address)
+    rows = run_benchmark(client, load_template(config), values, pairs, steps_list, args.batch)
+    save_results(rows, args.output)
+    print_table(rows)
+    print(f"\nSaved {len(rows)} results to {args.output}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# Opt-in timeline of where a run's wall time goes, written as Chrome trace-event JSON. Open the file
+# in https://ui.perfetto.dev or chrome://tracing. Client work (payload build, queue_prompt, polling
+# for images, the sleeps before moving them, metadata stripping, json.dump of the combos) is drawn
+# per thread. ComfyUI's queue wait and execution get a track per server, so the gaps where the GPU
+# had nothing to do line up with the client work that caused them.
+# Nothing is recorded until enable() is called; until then span() costs one check.
+
+ORIGIN = time.time()  # Trace timestamps count from when this module was first imported
+
+_lock = threading.Lock()
+_events = None
+_path = None
+_tracks = {}  # thread ident or track name -> tid
+
+def enable(path):
+    """Start recording; write() saves the trace to path."""
+    global _events, _path
+    with _lock:
+        _events = []
+        _path = path
+
+def enabled():
+    return _events is not None
+
+def _track_id(key, name):
+    """The tid for a thread or named track; the first use also names it in the trace."""
+    tid = _tracks.get(key)
+    if tid is None:
+        tid = _tracks[key] = len(_tracks) + 1
+        _events.append({"ph": "M", "name": "thread_name", "pid": 1, "tid": tid, "args": {"name": name}})
+    return tid
+
+def add_span(name, start, end, category="client", track=None, **args):
+    """Record a span from start to end (time.time() seconds). track puts it on a named track
+    instead of the calling thread's."""
+    if _events is None:
+        return
+    with _lock:
+        if track is None:
+            thread = threading.current_thread()
+            tid = _track_id(thread.ident, thread.name)
+        else:
+            tid = _track_id(track, track)
+        _events.append({
+            "ph": "X", "name": name, "cat": category, "pid": 1, "tid": tid,
+            "ts": round((start - ORIGIN) * 1e6), "dur": max(0, round((end - start) * 1e6)),
+            "args": args,
+        })
+
+@contextmanager
+def span(name, category="client", **args):
+    """Record the body as a span on the calling thread."""
+    if _events is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_span(name, start, time.time(), category, **args)
+
+def add_comfy_spans(server, submitted_at, window, **args):
+    """Queue wait and execution of one prompt on the server's track. window is (execution start, end)
+    from utilities.comfy_dispatcher.execution_window, on the server's clock; None skips the prompt."""
+    if window is None:
+        return
+    start, end = window
+    track = f"ComfyUI {server}"
+    add_span("queue_wait", submitted_at, start, "comfyui", track, **args)
+    add_span("execution", start, end, "comfyui", track, **args)
+
+def write():
+    """Save what has been recorded so far; returns the path, or None when tracing is off."""
+    if _events is None:
+        return None
+    with _lock:
+        events = list(_events)
+    os.makedirs(os.path.dirname(_path) or ".", exist_ok=True)
+    temp_path = f"{_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+    os.replace(temp_path, _path)
+    return _path
@@ -0,0 +1,208 @@
+import json
+import re
+from utilities.job_planner import downstream_nodes
+
+# Compiles a ComfyUI API workflow (workflow_json/*.json) into a template once, so each job only
+# fills in the values that change. Bindings name the inputs we set, found by class_type or title
+# instead of hardcoded node ids:
+#   "KSamplerSelect.sampler_name"   the only KSamplerSelect node
+#   "Load VAE.vae_name"             matched on _meta.title
+#   "LoraLoader[1].lora_name"       the second LoraLoader counting from the model loader
+#   "42.lora_name"                  a node id still works
+# Constant values are baked into a pre-serialized skeleton; render() joins the per-job values into
+# it, so every call returns a fresh payload and nothing shared is mutated between jobs.
+# fan_out_workflow() repeats the sampler part of a graph so one prompt renders several
+# sampler/scheduler pairs on top of the same loaded models, LoRAs and text encoding.
+
+# The bindings the Flux LoRA scripts use with workflow_json/superhero_creator.json. The LoRA chain
+# runs UNETLoader -> LORA1 -> LORA3 -> LORA2, which is why lora2 is the last LoraLoader.
+FLUX_LORA_BINDINGS = {
+    "prompt": "CLIPTextEncode.text",
+    "seed": "RandomNoise.noise_seed",
+    "vae": "VAELoader.vae_name",
+    "clip1": "DualCLIPLoader.clip_name1",
+    "clip2": "DualCLIPLoader.clip_name2",
+    "unet": "UNETLoader.unet_name",
+    "sampler": "KSamplerSelect.sampler_name",
+    "scheduler": "BasicScheduler.scheduler",
+    "steps": "BasicScheduler.steps",
+    "guidance": "FluxGuidance.guidance",
+    "batch_amount": "RepeatLatentBatch.amount",
+    "filename_prefix": "SaveImage.filename_prefix",
+    "lora1": "LoraLoader[0].lora_name",
+    "lora1_strength": "LoraLoader[0].strength_model",
+    "lora1_clip_strength": "LoraLoader[0].strength_clip",
+    "lora3": "LoraLoader[1].lora_name",
+    "lora3_strength": "LoraLoader[1].strength_model",
+    "lora3_clip_strength": "LoraLoader[1].strength_clip",
+    "lora2": "LoraLoader[2].lora_name",
+    "lora2_strength": "LoraLoader[2].strength_model",
+    "lora2_clip_strength": "LoraLoader[2].strength_clip",
+}
+
+# Nodes whose settings differ per branch; they and everything downstream of them are repeated
+BRANCH_ROOTS = ("KSamplerSelect", "BasicScheduler", "RepeatLatentBatch")
+
+SELECTOR_PATTERN = re.compile(r"^(?P<target>.+?)(?:\[(?P<index>\d+)\])?\.(?P<input>[^.\[\]]+)$")
+SLOT_MARKER = "\x00slot:{}\x00"
+SERIALIZED_MARKER = re.compile(r'"\\u0000slot:([^"\\]+)\\u0000"')  # SLOT_MARKER after json.dumps
+
+class WorkflowTemplateError(ValueError):
+    pass
+
+def is_link(value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str)
+
+def upstream_count(workflow_json, node_id, seen=None):
+    """Number of nodes feeding node_id, directly or not; orders nodes along a chain."""
+    seen = set() if seen is None else seen
+    for value in workflow_json[node_id].get("inputs", {}).values():
+        if is_link(value) and value[0] in workflow_json and value[0] not in seen:
+            seen.add(value[0])
+            upstream_count(workflow_json, value[0], seen)
+    return len(seen)
+
+def resolve_selector(workflow_json, selector):
+    """Return (node_id, input_name) for a binding selector, or raise WorkflowTemplateError."""
+    match = SELECTOR_PATTERN.match(selector)
+    if not match:
+        raise WorkflowTemplateError(f"Cannot parse binding '{selector}'; use 'ClassOrTitle[index].input'.")
+    target, index, input_name = match.group("target"), match.group("index"), match.group("input")
+
+    if target in workflow_json:
+        candidates = [target]
+    else:
+        candidates = [
+            node_id for node_id, node in workflow_json.items()
+            if node.get("class_type") == target or node.get("_meta", {}).get("title") == target
+        ]
+        candidates.sort(key=lambda node_id: upstream_count(workflow_json, node_id))
+    if not candidates:
+        raise WorkflowTemplateError(f"No node matches '{target}' for binding '{selector}'.")
+    if index is None and len(candidates) > 1:
+        raise WorkflowTemplateError(f"'{target}' matches nodes {candidates}; add an index to '{selector}'.")
+    position = int(index or 0)
+    if position >= len(candidates):
+        raise WorkflowTemplateError(f"'{selector}' asks for node {position} but only {len(candidates)} match.")
+
+    node_id = candidates[position]
+    inputs = workflow_json[node_id].get("inputs", {})
+    if input_name not in inputs:
+        raise WorkflowTemplateError(f"Node {node_id} ({workflow_json[node_id]['class_type']}) has no input '{input_name}'.")
+    if is_link(inputs[input_name]):
+        raise WorkflowTemplateError(f"Input '{input_name}' of node {node_id} is a link, not a value.")
+    return node_id, input_name
+
+def check_object_info(workflow_json, bindings, object_info):
+    """Check node classes and bound inputs against a server's /object_info response."""
+    for node_id, node in workflow_json.items():
+        if node["class_type"] not in object_info:
+            raise WorkflowTemplateError(f"The server has no node class '{node['class_type']}' (node {node_id}).")
+    for name, (node_id, input_name) in bindings.items():
+        definition = object_info[workflow_json[node_id]["class_type"]].get("input", {})
+        known = set(definition.get("required", {})) | set(definition.get("optional", {}))
+        if input_name not in known:
+            raise WorkflowTemplateError(f"Binding '{name}': the server does not know input '{input_name}' of node {node_id}.")
+
+def fan_out_workflow(workflow_json, bindings, branch_count, constants=None, branch_roots=BRANCH_ROOTS):
+    """Repeat the nodes at and below branch_roots branch_count times; everything upstream stays shared.
+
+    Bindings and constants that land in the repeated part get a per-branch suffix (sampler_0,
+    sampler_1, ...). Returns (workflow_json, bindings, constants) ready for WorkflowTemplate.
+    """
+    closures = downstream_nodes(workflow_json)
+    roots = [node_id for node_id, node in workflow_json.items() if node.get("class_type") in branch_roots]
+    branch_nodes = set().union(*(closures[node_id] for node_id in roots))
+    expanded = json.loads(json.dumps(workflow_json))
+    next_id = max([int(node_id) for node_id in workflow_json if node_id.isdigit()] or [0]) + 1
+
+    id_maps = [{node_id: node_id for node_id in branch_nodes}]
+    for _ in range(1, branch_count):
+        id_map = {}
+        for node_id in sorted(branch_nodes, key=lambda node_id: (len(node_id), node_id)):
+            id_map[node_id] = str(next_id)
+            next_id += 1
+        for node_id in branch_nodes:
+            node = json.loads(json.dumps(workflow_json[node_id]))
+            for name, value in node.get("inputs", {}).items():
+                if is_link(value) and value[0] in id_map:
+                    node["inputs"][name] = [id_map[value[0]], value[1]]
+            expanded[id_map[node_id]] = node
+        id_maps.append(id_map)
+
+    branch_bindings = {}
+    branch_names = {}
+    for name, selector in bindings.items():
+        node_id, input_name = resolve_selector(workflow_json, selector)
+        if node_id in branch_nodes:
+            branch_names[name] = [f"{name}_{branch}" for branch in range(branch_count)]
+            for branch_name, id_map in zip(branch_names[name], id_maps):
+                branch_bindings[branch_name] = f"{id_map[node_id]}.{input_name}"
+        else:
+            branch_names[name] = [name]
+            branch_bindings[name] = f"{node_id}.{input_name}"
+    branch_constants = {
+        branch_name: value for name, value in (constants or {}).items() for branch_name in branch_names.get(name, [name])
+    }
+    return expanded, branch_bindings, branch_constants
+
+class WorkflowTemplate:
+    """A compiled workflow. render(**values) returns the prompt JSON for one job."""
+
+    def __init__(self, workflow_json, bindings, constants=None, object_info=None):
+        constants = constants or {}
+        unknown = set(constants) - set(bindings)
+        if unknown:
+            raise WorkflowTemplateError(f"Constants without a binding: {sorted(unknown)}")
+
+        self.workflow_json = workflow_json
+        self.bindings = {name: resolve_selector(workflow_json, selector) for name, selector in bindings.items()}
+        if object_info is not None:
+            check_object_info(workflow_json, self.bindings, object_info)
+
+        skeleton = json.loads(json.dumps(workflow_json))
+        self.slots = {}
+        self.defaults = {}
+        for name, (node_id, input_name) in self.bindings.items():
+            if name in constants:
+                skeleton[node_id]["inputs"][input_name] = constants[name]
+            else:
+                self.slots[name] = (node_id, input_name)
+                self.defaults[name] = json.dumps(skeleton[node_id]["inputs"][input_name])
+                skeleton[node_id]["inputs"][input_name] = SLOT_MARKER.format(name)
+
+        # Split the serialized skeleton around the slot markers: piece, slot name, piece, slot name, ...
+        parts = SERIALIZED_MARKER.split(json.dumps(skeleton))
+        self.pieces = parts[0::2]
+        self.slot_order = parts[1::2]
+
+    def render(self, **values):
+        """The workflow as JSON text with values filled in; unset slots keep the file's value."""
+        unknown = set(values) - set(self.slots)
+        if unknown:
+            raise WorkflowTemplateError(f"Unknown workflow parameters: {sorted(unknown)}")
+        parts = [self.pieces[0]]
+        for name, piece in zip(self.slot_order, self.pieces[1:]):
+            parts.append(json.dumps(values[name]) if name in values else self.defaults[name])
+            parts.append(piece)
+        return "".join(parts)
+
+    def workflow(self, **values):
+        """The workflow as a new dict, for code that still edits it."""
+        return json.loads(self.render(**values))
+
+    def payload(self, client_id=None, **values):
+        """The /prompt request body as JSON text."""
+        body = f'{{"prompt": {self.render(**values)}'
+        if client_id:
+            body += f', "client_id": {json.dumps(client_id)}'
+        return body + "}"
+
+    def inputs_for(self, **values):
+        """{(node_id, input_name): value} for the given slot values."""
+        return {self.slots[name]: value for name, value in values.items()}
+
+def load_workflow_template(path, bindings=None, constants=None, object_info=None):
+    with open(path, "r", encoding="utf-8") as file:
+        workflow_json = json.load(file)
+    return WorkflowTemplate(workflow_json, bindings or FLUX_LORA_BINDINGS, constants, object_info)